@@ -1,39 +1,17 @@
 # 环境配置
-import os, feedparser, smtplib, datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
-from openai import OpenAI
-from dotenv import load_dotenv
-import time
+import os
 import json
+import time
 import random
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from services.sheets import push_to_sheets
-import datetime
-from datetime import timedelta, timezone
-
-load_dotenv() # 加载你的 .env 文件
-print("环境配置已加载")
-
-# ================= 🇨🇳 北京时间智能日期逻辑 (新增) =================
-# 1. 强制创建一个北京时区 (UTC+8)
-beijing_tz = timezone(timedelta(hours=8))
-
-# 2. 获取当前的北京时间
-now_in_beijing = datetime.datetime.now(beijing_tz)
-
-# 3. 核心判断逻辑：
-# 如果北京时间超过 18:00 (晚上6点)，系统认为这是在"为明天备稿" -> 日期 +1
-# 如果北京时间没到 18:00 (比如上午补发)，系统认为这是"当日急救" -> 日期不变
-if now_in_beijing.hour >= 18:
-    target_date = now_in_beijing.date() + timedelta(days=1)
-else:
-    target_date = now_in_beijing.date()
-
-# 生成两种格式供下面使用
-today_str = target_date.strftime("%Y-%m-%d")  # 格式：2026-01-20
-display_date_str = target_date.strftime('%A, %B %d, %Y') # 格式：Tuesday, January 20, 2026
-# ================================================================
+from services.llm import generate_json
+from services.render import SchemaError, validate_ielts, render_ielts
+from services.telemetry import traced, traced_run, in_context
+from services.dates import get_target_dates
+from services.fsutil import remove_quietly
+# 注意：.env 由入口 (main.py / dispatcher.py) 统一加载，日期和客户端都在第一次使用时才创建
 
 BASE_DIR = os.getcwd()
 
@@ -42,26 +20,51 @@ DB_PATH = os.path.join(BASE_DIR, "IELTS Speaking Materials", "Speaking_Materials
 # 状态记录文件 (还是放在根目录)
 STATE_FILE = os.path.join(BASE_DIR, "ielts_state.json")
 
-# 初始化 DeepSeek
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 提前生成队列：话题顺序是固定的，后面几天的简报可以提前在后台生成好，
+# 当天 (以及被拒重写时) 直接取用，不用再等一次 reasoner 调用。
+# 每个话题一份 JSON: ielts_queue/<话题 id>-<P3 组合哈希>.json，workflow 里用 actions/cache 跨运行保留
+QUEUE_DIR = os.path.join(BASE_DIR, "ielts_queue")
+PREGEN_AHEAD = 5          # 提前准备接下来多少个话题
+PREGEN_LOW_WATER = 2      # 接下来的话题里现成的少于这么多就补货
+PREGEN_WORKERS = 2        # 补货时最多同时几个模型调用
+PREGEN_MAX_AGE_DAYS = 30  # 生成后这么多天还没用上就作废
+
+
+def load_topics():
+    if not os.path.exists(DB_PATH):
+        return None
+    with open(DB_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def read_current_index():
+    """
+    下一个要发的话题 (0-based)，还没有进度文件时从 0 开始
+    """
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, 'r') as f:
+            return json.load(f).get('current_index', 0)
+    return 0
+
+def select_p3(topic_data):
+    # 随机抽取 3 个 P3 问题
+    all_p3 = topic_data.get('part3_questions', [])
+    if len(all_p3) > 3:
+        return random.sample(all_p3, 3)
+    return all_p3
 
 # 读取数据 & 管理数据
+@traced("pick_topic")
 def get_daily_topic(force_topic_id=None):
     """
     负责获取话题。
     :param force_topic_id: (可选) 传入数字 ID，强制从该话题开始（例如 1 表示从头开始）。
     """
     # 1. 加载题库
-    if not os.path.exists(DB_PATH):
+    full_db = load_topics()
+    if full_db is None:
         print("❌ 找不到题库文件！请检查路径。")
         return None, None
-    
-    with open(DB_PATH, 'r', encoding='utf-8') as f:
-        full_db = json.load(f)
-        total_topics = len(full_db)
+    total_topics = len(full_db)
 
     # 2. 确定今天的 Index (0-based)
     if force_topic_id is not None:
@@ -71,12 +74,7 @@ def get_daily_topic(force_topic_id=None):
         print(f"🔧 [手动模式] 强制跳转到话题 ID: {force_topic_id}")
     else:
         # 【情况 B：正常读取进度】
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r') as f:
-                state = json.load(f)
-                current_index = state.get('current_index', 0)
-        else:
-            current_index = 0
+        current_index = read_current_index()
 
     # 3. 处理循环逻辑 (核心需求)
     # 如果进度跑到了 50 (而总数只有 50)，说明该回到 0 了
@@ -89,16 +87,13 @@ def get_daily_topic(force_topic_id=None):
     topic_data = full_db[current_index]
     
     # 5. 随机抽取 P3
-    all_p3 = topic_data.get('part3_questions', [])
-    if len(all_p3) > 3:
-        selected_p3 = random.sample(all_p3, 3)
-    else:
-        selected_p3 = all_p3
+    selected_p3 = select_p3(topic_data)
 
     # 6. 更新并保存进度 (指向明天要发的下一个)
     # 明天就是 current_index + 1
     next_index = current_index + 1
     
+    _, today_str, _ = get_target_dates()
     new_state = {
         'current_index': next_index, 
         'last_updated': str(today_str),
@@ -115,30 +110,40 @@ def get_daily_topic(force_topic_id=None):
 
 
 # generate_ielts_html
-def generate_ielts_html(topic_data, selected_p3):
-    print("🧠 正在调用 DeepSeek 生成口语逻辑简报 (Sage Green 2.0)...")
-    
+# 模型只返回 JSON (要点、词伙、逻辑、范文)，Sage Green 模板由 services/render.py 在本地渲染并校验结构
+IELTS_SCHEMA = """{
+      "part2_title": "Part 2 的主标题 (题目第一句话，例如: Describe a friend...)",
+      "part2_points": ["You should say: who he/she is", "要点 2", "要点 3"],
+      "collocations": [{"en": "Collocation (English)", "zh": "中文含义", "example": "英文简短例句或用法示意"}],
+      "thinking": [{"angle": "思维角度 (例如：个人层面 vs 社会层面)", "analysis": "中文逻辑分析，解释为什么...",
+                    "express": "对应的英文表达句子，难词写成 {{difficult words|中文}}"}],
+      "sample_answer": "针对第一个 P3 问题的示范回答，重点词汇写成 {{word|中文}}",
+      "examiner_note": "简短点评"
+    }"""
+
+
+IELTS_SYSTEM_PROMPT = """
+你是一位雅思口语专家（Band 9）。
+你的任务是根据提供的话题素材，生成一份口语逻辑训练简报的内容。
+你的教学目标是：拒绝平庸的模板，教会学生如何用“逻辑+地道词伙”征服考官。
+
+你的输出风格：
+1. **逻辑硬核**：在 Logic 部分，必须给出 Pros/Cons 或 Macro/Micro 的深度分析。
+2. **词汇高级**：只讲 Collocations（词伙），不讲简单单词，并且至少给出10个以上Collocations。
+
+⚠️ 【极其重要的格式指令】：
+你的输出必须是一个 JSON 对象，不要输出 HTML、Markdown 或任何解释文字，排版由程序完成。
+"""
+
+
+def build_messages(topic_data, selected_p3):
+    """
+    话题 + P3 组合 -> 发给模型的消息 (提前生成的简报也用它的哈希判断是否还有效)
+    """
     # 准备 Prompt 素材
     p3_text_list = "\n".join([f"- {q}" for q in selected_p3])
-    
-    # --- 1. System Prompt: 强化 HTML 格式指令 ---
-    system_prompt = """
-    你是一位雅思口语专家（Band 9）。
-    你的任务是根据提供的话题素材，生成一份 HTML 格式的口语逻辑训练简报。
-    你的教学目标是：拒绝平庸的模板，教会学生如何用“逻辑+地道词伙”征服考官。
-    
-    你的输出风格：
-    1. **结构清晰**：使用 HTML 格式。
-    2. **逻辑硬核**：在 Logic 部分，必须给出 Pros/Cons 或 Macro/Micro 的深度分析。
-    3. **词汇高级**：只讲 Collocations（词伙），不讲简单单词，并且至少给出10个以上Collocations。
-    
-    ⚠️ 【极其重要的格式指令】：
-    1. **绝对禁止**使用 Markdown 语法（如 **bold**）。
-    2. **必须使用** HTML 标签来设置样式（如 <b>bold</b>, <u>underline</u>）。
-    3. 你的输出必须是纯粹的 HTML 代码，不要包含 ```html 包裹符。
-    """
-    
-    # --- 2. User Prompt: 分离数据与模板 ---
+
+    # 只要内容，不要模板
     user_prompt = f"""
     【今日素材】：
     Topic: {topic_data['topic_name']}
@@ -149,132 +154,181 @@ def generate_ielts_html(topic_data, selected_p3):
     [Part 3 Selected Questions]:
     {p3_text_list}
     
-    【任务目标】：
-    请将上述素材填入下方的 HTML 模板中，并根据要求进行改写和扩充。
-    
-    【排版与内容要求】：
-    1. **Part 2 部分**：不要直接复制原文！请把题目第一句话加粗，剩下的 "You should say" 部分拆解成一个 HTML 列表 (ul/li)。
-    2. **Critical Thinking 部分**：不要给一大段中文。请生成 5-6 组【逻辑解析 + 英文表达】的对照。
-       - 英文部分必须使用高分词汇，**难词用 <u>下划线</u> 标记**，并在其后紧跟 **【中文释义】**。
-    3. **Sample Answer**：针对第一个 P3 问题写一个示范回答。
-    
-    【HTML 模板代码 (请严格套用)】：
+    【内容要求】：
+    1. **Part 2 部分**：不要直接复制原文！把题目第一句话作为 part2_title，剩下的 "You should say" 部分拆解成 part2_points。
+    2. **Collocations**：至少 10 个。
+    3. **Critical Thinking 部分**：不要给一大段中文。请生成 5-6 组【逻辑解析 + 英文表达】的对照。
+       - 英文部分必须使用高分词汇，**难词写成 {{{{难词|中文释义}}}}**。
+    4. **Sample Answer**：针对第一个 P3 问题写一个示范回答。
     
-    <div style="background-color: #f0f7f4; padding: 20px; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333;">
-        
-        <div style="max-width: 600px; margin: 0 auto; margin-bottom: 30px; text-align: center; border-bottom: 3px solid #57a086; padding-bottom: 15px;">
-            <h1 style="color: #2d6a4f; font-size: 28px; margin-bottom: 5px; font-weight: 800;">IELTS Speaking Booster</h1>
-            <p style="color: #52b788; font-size: 14px; font-weight: bold; background-color: #d8f3dc; display: inline-block; padding: 4px 12px; border-radius: 15px;">
-                Topic: {topic_data['topic_name']}
-            </p>
-        </div>
-
-        <div style="max-width: 600px; margin: 0 auto;">
-
-            <div style="background-color: white; border-radius: 10px; padding: 20px; margin-bottom: 25px; box-shadow: 0 4px 10px rgba(87, 160, 134, 0.15);">
-                <h3 style="color: #2d6a4f; margin-top: 0; border-left: 5px solid #57a086; padding-left: 10px; font-size: 18px;">🎯 Topic Overview</h3>
-                
-                <div style="font-size: 15px; color: #333; margin-bottom: 20px; background-color: #f9fdfa; padding: 15px; border-radius: 8px; border: 1px solid #e0f2e9;">
-                    <div style="color: #2d6a4f; font-weight: bold; margin-bottom: 10px;">
-                        (请在这里填入 Part 2 的主标题，例如: Describe a friend...)
-                    </div>
-                    <ul style="color: #555; margin: 0; padding-left: 20px; line-height: 1.6;">
-                        <li>You should say: who he/she is</li>
-                        <li>(要点 2...)</li>
-                        <li>(要点 3...)</li>
-                    </ul>
-                </div>
-
-                <div style="font-size: 14px; color: #555;">
-                    <b>Selected P3 Questions:</b><br>
-                    {p3_text_list.replace(chr(10), '<br>')}
-                </div>
-            </div>
-
-            <div style="background-color: white; border-radius: 10px; padding: 20px; margin-bottom: 25px; box-shadow: 0 4px 10px rgba(87, 160, 134, 0.15);">
-                <h3 style="color: #2d6a4f; margin-top: 0; border-left: 5px solid #57a086; padding-left: 10px; font-size: 18px;">💎 Band 9 Lexical Resource</h3>
-                <p style="font-size: 14px; color: #666; margin-bottom: 15px;">Use these <b>Collocations</b> to sound native.</p>
-                <ul style="line-height: 1.8; color: #333; padding-left: 20px;">
-                    <li style="margin-bottom: 10px;">
-                        <span style="color: #2d6a4f; font-weight: bold; background-color: #d8f3dc; padding: 2px 6px; border-radius: 4px;">Collocations (English)</span>
-                        <span style="font-size: 14px;"> : 中文含义（ 这里给出英文简短例句或用法示意）</span> 
-                    </li>
-                </ul>
-            </div>
-
-            <div style="background-color: white; border-radius: 10px; padding: 20px; margin-bottom: 25px; box-shadow: 0 4px 10px rgba(87, 160, 134, 0.15);">
-                <h3 style="color: #2d6a4f; margin-top: 0; border-left: 5px solid #57a086; padding-left: 10px; font-size: 18px;">🧠 Critical Thinking</h3>
-                <p style="font-size: 14px; color: #888; margin-bottom: 15px;">Deep analysis for the topic.</p>
-                
-                <div style="margin-bottom: 20px;">
-                    <div style="font-size: 15px; color: #333; margin-bottom: 8px; font-weight: bold;">
-                        💡 思维角度：(例如：个人层面 vs 社会层面)
-                    </div>
-                    <div style="font-size: 14px; color: #444; margin-bottom: 8px; line-height: 1.6;">
-                        (这里写中文逻辑分析，解释为什么...)
-                    </div>
-                    <div style="background-color: #f0f7f4; padding: 10px; border-radius: 6px; color: #2d6a4f; font-size: 14px; line-height: 1.6; border-left: 3px solid #57a086;">
-                        🔤 <b>Express it:</b> <br>
-                        (这里写对应的英文表达句子，必须包含 <u>difficult words</u>【中文】)
-                    </div>
-                </div>
-
-                </div>
-
-            <div style="background-color: #ebfcf0; border: 2px dashed #57a086; border-radius: 10px; padding: 20px; position: relative;">
-                <div style="position: absolute; top: -12px; left: 20px; background-color: #2d6a4f; color: white; padding: 2px 10px; font-size: 12px; border-radius: 4px;">Part 3 Sample Answer</div>
-                
-                <div style="margin-top: 15px; font-weight: bold; color: #2d6a4f; font-size: 16px;">
-                    Q: {selected_p3[0]}
-                </div>
-                
-                <div style="margin-top: 10px; font-size: 16px; color: #333; line-height: 1.8;">
-                   (请生成回答，重点词汇使用 <b>bold</b>【中文】 或 <u>underline</u>【中文】)
-                </div>
-                
-                <div style="margin-top: 15px; border-top: 1px solid #b7e4c7; padding-top: 10px; font-size: 13px; color: #52b788;">
-                    💡 <b>Examiner's Note:</b> (简短点评)
-                </div>
-            </div>
-
-            <div style="text-align: center; margin-top: 40px; color: #57a086; font-size: 12px; font-style: italic;">
-                Daily Progress · {target_date.strftime('%Y.%m.%d')}
-            </div>
-
-        </div> 
-    </div>
+    【输出格式 (JSON)】：
+    {IELTS_SCHEMA}
+    """
+    return [
+        {"role": "system", "content": IELTS_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def generate_ielts_data(topic_data, selected_p3, label="afternoon"):
+    """
+    调用模型生成一份已校验的简报内容 (JSON)，失败抛异常
     """
+    # 流式生成，带首 token / 停顿超时；结构不合格会带着错误原因重试一次 (见 services/llm.py)
+    return generate_json(build_messages(topic_data, selected_p3), validate_ielts, label=label, temperature=0.3)
 
+
+@traced("generate")
+def generate_ielts_html(topic_data, selected_p3, data=None):
+    """
+    data: (可选) 提前生成好的内容，传了就不再调用模型，只按今天的日期渲染
+    """
+    target_date, _, _ = get_target_dates()
+    if data is None:
+        print("🧠 正在调用 DeepSeek 生成口语逻辑简报 (Sage Green 2.0)...")
+        try:
+            data = generate_ielts_data(topic_data, selected_p3)
+        except Exception as e:
+            print(f"❌ 生成失败: {e}")
+            return None
+    return render_ielts(data, topic_data['topic_name'], selected_p3, target_date.strftime('%Y.%m.%d'))
+
+
+# ================= 提前生成队列 =================
+def _prompt_hash(topic_data, selected_p3):
+    # 题库里这个话题的内容、P3 组合或 prompt 任何一处改了，哈希就变，旧的预生成内容随之作废
+    raw = json.dumps(build_messages(topic_data, selected_p3), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _queue_path(topic_id, selected_p3):
+    p3_hash = hashlib.sha1("\n".join(selected_p3).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(QUEUE_DIR, f"{topic_id}-{p3_hash}.json")
+
+def _read_entry(path):
     try:
-        response = client.chat.completions.create(
-            model="deepseek-reasoner",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            stream=False,
-            temperature=0.3
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"❌ 生成失败: {e}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
         return None
+
+def _entry_valid(record, topic_data):
+    """
+    预生成内容是否还能用：没过期、题库和 prompt 没变、结构仍然通过校验
+    """
+    if not record or time.time() - record.get("created", 0) > PREGEN_MAX_AGE_DAYS * 24 * 3600:
+        return False
+    if record.get("prompt_hash") != _prompt_hash(topic_data, record.get("p3", [])):
+        return False
+    try:
+        validate_ielts(record.get("data"))
+    except SchemaError:
+        return False
+    return True
+
+def _queued_files(topic_id=None):
+    if not os.path.isdir(QUEUE_DIR):
+        return []
+    prefix = f"{topic_id}-" if topic_id is not None else ""
+    return sorted(os.path.join(QUEUE_DIR, n) for n in os.listdir(QUEUE_DIR)
+                  if n.endswith(".json") and n.startswith(prefix))
+
+@traced("take_queued")
+def take_queued(topic_data):
+    """
+    取出 (并从队列删除) 这个话题提前生成好的简报，返回 (selected_p3, data)；没有可用的返回 None
+    """
+    for path in _queued_files(topic_data['id']):
+        record = _read_entry(path)
+        # 取出即删除：不管能不能用，这一份都不会再被用第二次
+        remove_quietly(path)
+        if _entry_valid(record, topic_data):
+            return record["p3"], record["data"]
+        print(f"🗑️ [Queue] 预生成内容已失效 (题库或 prompt 有变动 / 过期)，丢弃: {os.path.basename(path)}")
+    return None
+
+def _pregenerate_one(topic_data):
+    selected_p3 = select_p3(topic_data)
+    try:
+        data = generate_ielts_data(topic_data, selected_p3, label="afternoon/pregen")
+    except Exception as e:
+        print(f"⚠️ [Queue] 话题 {topic_data['id']} 预生成失败: {e}")
+        return False
+
+    path = _queue_path(topic_data['id'], selected_p3)
+    os.makedirs(QUEUE_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "topic_id": topic_data['id'],
+            "topic_name": topic_data['topic_name'],
+            "p3": selected_p3,
+            "prompt_hash": _prompt_hash(topic_data, selected_p3),
+            "created": time.time(),
+            "data": data,
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    print(f"🧺 [Queue] 已预生成话题 {topic_data['id']}: {topic_data['topic_name']}")
+    return True
+
+@traced("refill_queue")
+def refill_queue(ahead=PREGEN_AHEAD, low_water=PREGEN_LOW_WATER, workers=PREGEN_WORKERS):
+    """
+    检查接下来 ahead 个话题的预生成内容：清掉失效 / 用不上的，
+    现成的少于 low_water 时，并发 (最多 workers 个) 补齐缺的话题。返回新生成的数量。
+    """
+    topics = load_topics()
+    if not topics:
+        return 0
+    index = read_current_index() % len(topics)
+    upcoming = [topics[(index + k) % len(topics)] for k in range(min(ahead, len(topics)))]
+    by_id = {t['id']: t for t in upcoming}
+
+    ready = set()
+    for path in _queued_files():
+        record = _read_entry(path)
+        topic = by_id.get(record.get("topic_id")) if record else None
+        if topic is None or topic['id'] in ready or not _entry_valid(record, topic):
+            # 不在接下来的话题里 (已经发过 / 手动跳过了)、重复、或已失效
+            remove_quietly(path)
+            continue
+        ready.add(topic['id'])
+
+    missing = [t for t in upcoming if t['id'] not in ready]
+    if not missing or len(ready) >= low_water:
+        print(f"🧺 [Queue] 接下来 {len(upcoming)} 个话题已备好 {len(ready)} 个，无需补货。")
+        return 0
+
+    print(f"🧺 [Queue] 接下来 {len(upcoming)} 个话题只备好 {len(ready)} 个，后台补齐 {len(missing)} 个 (并发 {workers})...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(in_context(_pregenerate_one), topic) for topic in missing]
+        return sum(future.result() for future in futures)
     
 
 # run
-def run():
+@traced_run("afternoon")
+def run(status_updates=None):
+    """
+    status_updates: (可选) 和新稿一起写入 Check 表的状态改动，见 push_to_sheets
+    """
     print("☀️ 午报 Agent 启动...")
-    result = get_daily_topic()
+    topic_data, selected_p3 = get_daily_topic()
     
-    if result:
-        topic_data, selected_p3 = result
-        html_content = generate_ielts_html(topic_data, selected_p3)
+    if topic_data:
+        # 有提前生成好的就直接用 (连同它当时抽的 P3)，不用等模型
+        queued = take_queued(topic_data)
+        data = None
+        if queued:
+            selected_p3, data = queued
+            print(f"⚡️ [Queue] 使用提前生成的简报: {topic_data['topic_name']}")
+        html_content = generate_ielts_html(topic_data, selected_p3, data=data)
         
         if html_content:
 
             # 推送到 Google Sheets
+            _, today_str, _ = get_target_dates()
             subject = f"Afternoon Brief: {today_str}"
-            push_to_sheets("afternoon", subject, html_content)
+            if not push_to_sheets("afternoon", subject, html_content, status_updates=status_updates):
+                return None
             print("😏已push到Google Sheet")
-
+            # 队列补货不在这里做 (重写和集中生成都走 run())，由 workflow 单独一步 main.py --pregenerate 负责
             return html_content
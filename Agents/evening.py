@@ -1,46 +1,40 @@
 # 环境配置
-import os, feedparser, smtplib, datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
-from openai import OpenAI
-from dotenv import load_dotenv
-import time
-import json
+import os
 import random
-from newspaper import Article
-import requests
-import re
+from concurrent.futures import ThreadPoolExecutor
 from services.sheets import push_to_sheets
-import datetime
-from datetime import timedelta, timezone
-
-# ================= 🇨🇳 北京时间智能日期逻辑 =================
-beijing_tz = timezone(timedelta(hours=8))
-now_in_beijing = datetime.datetime.now(beijing_tz)
-
-if now_in_beijing.hour >= 18:
-    target_date = now_in_beijing.date() + timedelta(days=1)
-else:
-    target_date = now_in_beijing.date()
-
-today_str = target_date.strftime("%Y-%m-%d")
-display_date_str = target_date.strftime('%A, %B %d, %Y')
-# =========================================================
+from services.llm import generate, generate_json
+from services.render import SchemaError, plain, validate_reading_blocks, render_evening
+from services.feeds import fetch_feeds
+from services.history import UrlHistory, canonical_url
+from services.compaction import simhash, hamming
+from services.keywords import compile_keywords, find_keyword
+from services.dates import get_target_dates
+from services.telemetry import span, traced, traced_run, in_context
+# 注意：newspaper3k (连带 lxml / nltk) 很重，只在真正下载文章时才导入
 
 # 历史记录文件 (防止发重复的)
 BASE_DIR = os.getcwd()
 # ⚠️ 注意：这是一个新文件名，GitHub 会自动创建它，不要指向你的素材源文件！
-HISTORY_FILE = os.path.join(BASE_DIR, "evening_history.json")
+# 只追加的 JSONL 日志 (见 services/history.py)；旧的 evening_history.json 会在第一次载入时自动迁移过来
+HISTORY_FILE = os.path.join(BASE_DIR, "evening_history.jsonl")
+LEGACY_HISTORY_FILE = os.path.join(BASE_DIR, "evening_history.json")
 
 # 字数限制 (单位：英文单词)
 MIN_WORDS = 600
 MAX_WORDS = 3000
 
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 并发下载候选文章的线程数
+ARTICLE_WORKERS = 6
+
+# 全文指纹 (SimHash) 与任何一篇发过的文章相差不超过这么多位，就视为同一篇 (换了链接 / 转载的新闻稿)
+SIMHASH_DISTANCE = 6
+
+# 注读分块：按自然段切成约 BLOCK_WORDS 词的阅读块，并发注读后按顺序拼回模板
+BLOCK_WORDS = 350
+ANNOTATION_WORKERS = 4
+BLOCK_RETRIES = 2   # 失败的块单独重试的轮数
+
 
 # rss信息源
 SAFE_RSS_SOURCES = [
@@ -87,19 +81,44 @@ BANNED_KEYWORDS = [
     "casino", "gambling", "betting", "lottery"
 ]
 
+# 导入时编译一次，is_content_safe 每次只需单遍扫描
+BANNED_MATCHER = compile_keywords(BANNED_KEYWORDS)
+
 
 # 获取文章 
+_history = None
+
 def load_history():
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'r') as f:
-            return set(json.load(f))
-    return set()
+    """
+    载入 (一次) 已发送记录，支持 `url in history` 查重
+    """
+    global _history
+    if _history is None:
+        # 按规范化后的链接查重 (去掉统计参数、www、镜像域名等)，旧记录载入时也会重新规范化
+        _history = UrlHistory(HISTORY_FILE, legacy_path=LEGACY_HISTORY_FILE, normalize=canonical_url)
+    return _history
+
+def save_history(url, fingerprint=None):
+    # 只往日志末尾追加一行；全文指纹一起记下，之后换了链接的同一篇文章也能认出来
+    if fingerprint is None:
+        load_history().add(url)
+    else:
+        load_history().add(url, simhash=f"{fingerprint:016x}")
 
-def save_history(url):
-    history = load_history()
-    history.add(url)
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(list(history), f)
+def load_fingerprints():
+    """
+    历史里所有文章的全文指纹 (旧记录没有指纹，只能按链接查重)
+    """
+    return [int(r["simhash"], 16) for r in load_history().records() if r.get("simhash")]
+
+def find_similar(fingerprint, fingerprints, max_distance=SIMHASH_DISTANCE):
+    """
+    返回与 fingerprint 最接近的历史指纹的距离 (不超过 max_distance 时)，否则 None
+    """
+    if fingerprint is None or not fingerprints:
+        return None
+    distance = min(hamming(fingerprint, f) for f in fingerprints)
+    return distance if distance <= max_distance else None
 
 def is_content_safe(title, text):
     """
@@ -110,180 +129,289 @@ def is_content_safe(title, text):
     # 将文本转为小写以便匹配
     content_blob = (title + " " + text).lower()
     
-    for keyword in BANNED_KEYWORDS:
-        # 使用正则进行单词边界匹配，防止误伤 (例如 banned 'sex' 不应该匹配 'essex')
-        # \b 匹配单词边界
-        if re.search(r'\b' + re.escape(keyword) + r'\b', content_blob):
-            print(f"    ⚠️ 触发敏感词拦截: [{keyword}]")
-            return False
+    # 使用单词边界匹配，防止误伤 (例如 banned 'sex' 不应该匹配 'essex')
+    # 所有违禁词已在导入时编译成一个正则，一遍扫描完成
+    keyword = find_keyword(BANNED_MATCHER, content_blob)
+    if keyword:
+        print(f"    ⚠️ 触发敏感词拦截: [{keyword}]")
+        return False
             
     return True
 
+def vet_candidate(candidate, fingerprints=()):
+    """
+    下载并审查单篇候选文章 (在线程池里跑)。
+    fingerprints: 已发文章的全文指纹，内容几乎相同的候选在调用模型之前就淘汰
+    通过返回文章数据字典，不通过返回 None。
+    """
+    from newspaper import Article
+
+    link, title = candidate["link"], candidate["title"]
+    try:
+        # 抓取全文
+        article = Article(link)
+        with span("download"):
+            article.download()
+        with span("parse"):
+            article.parse()
+        text = article.text
+        word_count = len(text.split())
+        
+        # 3. 字数检查
+        if word_count < MIN_WORDS or word_count > MAX_WORDS:
+            # print(f"    ⚠️ 字数不符 ({word_count}): {title}")
+            return None
+
+        # 4. 全文查重：链接不同但内容是发过的那篇 (镜像站点、转载的新闻稿)
+        fingerprint = simhash(text)
+        distance = find_similar(fingerprint, fingerprints)
+        if distance is not None:
+            print(f"    ♻️ 与已发文章几乎相同 (指纹相差 {distance} 位)，跳过: {title}")
+            return None
+
+        # 5. 全文深度审查 (Deep Check)
+        if not is_content_safe(title, text):
+            print(f"    ❌ 正文包含敏感词，跳过: {title}")
+            return None
+            
+        return {
+            "title": article.title,
+            "author": candidate["author"],
+            "source_name": candidate["source_name"],
+            "link": link,
+            "content": text,
+            "word_count": word_count,
+            "fingerprint": fingerprint
+        }
+    except Exception:
+        return None
+
+@traced("select_article")
 def get_filtered_article():
     print("🌙 正在全网搜寻今晚的宇宙与自然 (含安全审查)...")
     
     sent_urls = load_history()
     shuffled_sources = random.sample(SAFE_RSS_SOURCES, len(SAFE_RSS_SOURCES))
     
-    for url in shuffled_sources:
+    # 第一步：按打乱后的源顺序收集候选 (只做不需要下载的检查)
+    candidates = []
+    seen_links = set()   # 规范化后的链接，同一篇文章出现在多个源里只下载一次
+    # 与早报共用并发抓取 + 条件请求缓存 (见 services/feeds.py)，结果仍按打乱后的顺序返回
+    with span("fetch_feeds", feeds=len(shuffled_sources)):
+        fetched = fetch_feeds(shuffled_sources)
+    for url, feed in fetched:
         try:
-            print(f"  - 正在扫描源: {url} ...")
-            feed = feedparser.parse(url)
-            if not feed.entries: continue
+            if feed is None or not feed.entries: continue
             
             # 每个源只看前 3 篇，避免浪费时间
             for entry in feed.entries[:3]:
                 link = entry.link
                 title = entry.title
                 
-                # 1. 历史查重
-                if link in sent_urls: continue
+                # 1. 历史查重 (按规范化后的链接)
+                canonical = canonical_url(link)
+                if canonical in sent_urls or canonical in seen_links: continue
                 
                 # 2. 标题初步审查 (省流量)
                 if not is_content_safe(title, ""):
                     print(f"    ❌ 标题包含敏感词，跳过: {title}")
                     continue
 
-                try:
-                    # 抓取全文
-                    article = Article(link)
-                    article.download()
-                    article.parse()
-                    text = article.text
-                    word_count = len(text.split())
-                    
-                    # 3. 字数检查
-                    if word_count < MIN_WORDS or word_count > MAX_WORDS:
-                        # print(f"    ⚠️ 字数不符 ({word_count}): {title}")
-                        continue
-                    
-                    # 4. 全文深度审查 (Deep Check)
-                    if not is_content_safe(title, text):
-                        print(f"    ❌ 正文包含敏感词，跳过: {title}")
-                        continue
-                        
-                    # ✅ 完美通过
-                    print(f"    ✅ 选中文章 ({word_count}词): {title}")
-                    return {
-                        "title": article.title,
-                        "author": entry.get("author", "Unknown"),
-                        "source_name": feed.feed.get("title", "Science/Nature Source"),
-                        "link": link,
-                        "content": text
-                    }
-                    
-                except Exception as e:
-                    continue
+                seen_links.add(canonical)
+                candidates.append({
+                    "link": link,
+                    "title": title,
+                    "author": entry.get("author", "Unknown"),
+                    "source_name": feed.feed.get("title", "Science/Nature Source")
+                })
                     
         except Exception:
             continue
-            
+
+    # 第二步：并发下载 + 审查 (含全文指纹查重)，但按优先级顺序取结果
+    article_data = vet_candidates(candidates, load_fingerprints()) if candidates else None
+    if article_data:
+        return article_data
+
     print("😭 未找到合适文章。")
     return None
 
 
+@traced("vet_articles")
+def vet_candidates(candidates, fingerprints=()):
+    """
+    并发下载 + 审查候选文章，按优先级顺序取结果：
+    排在前面的候选只要通过就是赢家；后面的即使先下载完也要等前面的出结论
+    """
+    print(f"  - 📥 并发审查 {len(candidates)} 篇候选文章...")
+    pool = ThreadPoolExecutor(max_workers=min(ARTICLE_WORKERS, len(candidates)))
+    futures = [pool.submit(in_context(vet_candidate), c, fingerprints) for c in candidates]
+    try:
+        for future in futures:
+            article_data = future.result()
+            if article_data:
+                # ✅ 完美通过
+                print(f"    ✅ 选中文章 ({article_data.pop('word_count')}词): {article_data['title']}")
+                return article_data
+    finally:
+        # 赢家已定 (或全部失败)：取消还没开始的，正在下载的直接丢弃
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return None
+
+
 # generate_evening_html
-def generate_evening_html(article_data):
-    print("🕯️ DeepSeek 正在为你拆解文章，准备伴读 (注读版)...")
-    
-    # --- System Prompt ---
-    system_prompt = """
-    你是一位温暖、博学的“晚间阅读伴侣”。
-    你的任务是将一篇英文文章转化为“注读版”网页，供用户睡前阅读。
-    
-    【排版核心指令】：
-    1. **绝对禁止 Markdown**。必须输出纯 HTML 代码。
-    2. **视觉风格**：莫兰迪暖咖色 (#fdfbf7)，字体强制使用 Times New Roman。
-    3. **结构逻辑**：不要强制分为 Part 1/2/3。请根据文章的自然段落逻辑，将其拆分为若干个“阅读块”（每个块包含 1-2 个自然段）。
+# 模型只返回 JSON (带行内释义标记的段落 + 可选的语法卡片)，暖咖色模板由 services/render.py 在本地渲染
+EVENING_SYSTEM_PROMPT = """
+你是一位温暖、博学的“晚间阅读伴侣”。
+你的任务是把一篇英文文章的其中一部分转化为“注读版”内容，供用户睡前阅读。
+
+【核心指令】：
+1. 只输出一个 JSON 对象，不要输出 HTML、Markdown 或任何解释文字，排版由程序完成。
+2. **结构逻辑**：根据给定片段的自然段落逻辑，将其拆分为若干个“阅读块”（每个块包含 1-2 个自然段）。
+"""
+
+READING_BLOCK_SCHEMA = """{"blocks": [
+      {"paragraphs": ["原文段落... 遇到难词写成 {{word|中文}} ..."],
+       "grammar": {"sentence": "段落中的长难句原文", "analysis": "简要分析语法结构，如定语从句、倒装等"}}
+    ]}"""
+
+# 注读后的正文 (去掉标记) 至少要保留原片段这么多的词，防止模型删减或截断
+MIN_COVERAGE = 0.8
+
+
+def split_blocks(text, target_words=BLOCK_WORDS):
+    """
+    按自然段切块：段落依次累加，超过 target_words 就开始新的一块 (不会把一个段落拆开)
+    """
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    blocks, current, count = [], [], 0
+    for paragraph in paragraphs:
+        current.append(paragraph)
+        count += len(paragraph.split())
+        if count >= target_words:
+            blocks.append("\n\n".join(current))
+            current, count = [], 0
+    if current:
+        # 最后剩下的零头太短就并入上一块
+        if blocks and count < target_words // 3:
+            blocks[-1] += "\n\n" + "\n\n".join(current)
+        else:
+            blocks.append("\n\n".join(current))
+    return blocks
+
+
+def annotate_block(article_data, index, total, block_text):
+    """
+    注读一个片段，返回已校验的阅读块列表。失败直接抛异常，由调用方决定是否重试。
     """
-    
-    # --- User Prompt ---
     user_prompt = f"""
     【文章信息】：
     Title: {article_data['title']}
-    Author: {article_data['author']}
     Source: {article_data['source_name']}
-    Original Link: {article_data['link']}
-    
-    【文章内容】：
-    {article_data['content']}
-    
+    这是全文的第 {index + 1}/{total} 部分，前后部分由其他人处理，请只处理下面这段文字，不要增删内容。
+
+    【片段内容】：
+    {block_text}
+
     【处理要求】：
-    请严格按照下方 HTML 模板结构输出完整代码。
-    
     1. **正文处理 (Inline Annotations)**：
-       - 保持英文原文流畅。
-       - 遇到高阶词汇/难词时，**直接在单词后**添加中文释义。
-       - 格式要求：使用 `<b>单词</b><span style="color:#bc8a86; font-size: 0.9em;">【中文】</span>`。
-       - 例如：The sunset was <b>ephemeral</b><span style="color:#bc8a86; font-size: 0.9em;">【短暂的】</span>...
+       - 保持英文原文流畅，完整保留原文。
+       - 遇到高阶词汇/难词时，**直接把单词写成** {{{{单词|中文}}}}。
+       - 例如：The sunset was {{{{ephemeral|短暂的}}}}...
        
     2. **按需语法卡片 (Conditional Grammar Card)**：
-       - 分析当前段落是否存在**长难句**（结构复杂或倒装/虚拟语气等）。
-       - **如果有**：在段落下方插入一个“语法解析卡片”，解释该句子的结构。
-       - **如果没有**：不要插入卡片，直接继续下一段。
-       
-    3. **结尾**：
-       - 提取一句最治愈的金句 (Golden Quote)。
+       - 分析当前阅读块是否存在**长难句**（结构复杂或倒装/虚拟语气等）。
+       - **如果有**：在 grammar 里引用该句子并解释结构。
+       - **如果没有**：grammar 写 null。
 
-    【HTML 模板代码 (请循环生成中间的阅读块)】：
-    
-    <div style="background-color: #fdfbf7; padding: 40px 20px; font-family: 'Times New Roman', Times, serif; color: #2c2c2c; line-height: 2.0;">
-        
-        <div style="max-width: 650px; margin: 0 auto; text-align: center; margin-bottom: 50px; border-bottom: 1px solid #dcc1be; padding-bottom: 20px;">
-            <div style="font-size: 12px; letter-spacing: 2px; color: #bc8a86; text-transform: uppercase; margin-bottom: 10px; font-family: sans-serif;">The Evening Read</div>
-            <h1 style="font-size: 32px; color: #5d4037; margin-bottom: 15px; font-weight: normal; font-style: italic;">{article_data['title']}</h1>
-            <p style="font-size: 14px; color: #999; font-family: sans-serif;">
-                By {article_data['author']}
-                <br><a href="{article_data['link']}" style="color: #bc8a86; text-decoration: none;">Read Original Source</a>
-            </p>
-        </div>
-
-        <div style="max-width: 650px; margin: 0 auto;">
-            
-            <div style="margin-bottom: 35px;">
-                
-                <p style="font-size: 19px; text-align: justify; margin-bottom: 15px;">
-                    (这里填入原文段落... 遇到难词请使用 <b>word</b><span style="color:#bc8a86; font-size: 0.9em;">【中文】</span> 格式标注...)
-                </p>
-                
-                <div style="background-color: #f3ebe9; padding: 15px 20px; border-radius: 4px; font-family: sans-serif; font-size: 14px; color: #5d4037; border-left: 4px solid #bc8a86; margin-top: 10px;">
-                    <div style="font-weight: bold; color: #bc8a86; margin-bottom: 5px;">🦉 Long Sentence Breakdown</div>
-                    <div style="line-height: 1.6;">
-                        (这里引用那个长难句)<br>
-                        <span style="color: #888;">👉 解析：(简要分析语法结构，如定语从句、倒装等)</span>
-                    </div>
-                </div>
-
-            </div>
-            <div style="text-align: center; margin-top: 60px; padding-top: 30px; border-top: 1px solid #dcc1be;">
-                <p style="font-size: 20px; font-style: italic; color: #8d6e63; margin-bottom: 15px;">
-                    " (请摘录金句) "
-                </p>
-                <div style="font-size: 12px; color: #bc8a86; text-transform: uppercase; letter-spacing: 1px; font-family: sans-serif;">Goodnight & Sweet Dreams</div>
-            </div>
-
-        </div>
-    </div>
+    【输出格式 (JSON)】：
+    {READING_BLOCK_SCHEMA}
     """
 
+    def validate(obj):
+        blocks = validate_reading_blocks(obj)
+        kept = sum(len(plain(p).split()) for block in blocks for p in block["paragraphs"])
+        if kept < MIN_COVERAGE * len(block_text.split()):
+            raise SchemaError(f"正文不完整 (只保留了 {kept}/{len(block_text.split())} 词)，请完整保留原文")
+        return blocks
+
+    return generate_json(
+        [
+            {"role": "system", "content": EVENING_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        validate,
+        label=f"evening/block{index + 1}",
+        retries=0,  # 失败的块由 generate_evening_html 单独重试
+        temperature=0.3
+    )
+
+
+def extract_golden_quote(article_data):
+    """
+    额外的小调用：只摘录一句金句 (纯文本)，失败返回 None
+    """
     try:
-        response = client.chat.completions.create(
-            model="deepseek-reasoner",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
+        quote = generate(
+            [
+                {"role": "system", "content": "你是一位温暖、博学的“晚间阅读伴侣”。"},
+                {"role": "user", "content": f"请从下面这篇文章中摘录一句最治愈的英文原句 (Golden Quote)。"
+                                            f"只输出这句话本身，不要引号、不要翻译、不要任何解释。\n\n{article_data['content']}"},
             ],
-            stream=False,
+            label="evening/quote",
             temperature=0.3
         )
-        return response.choices[0].message.content
+        quote = quote.strip().strip('`').strip().strip('"“”')
+        return quote or None
     except Exception as e:
-        print(f"❌ 生成失败: {e}")
+        print(f"⚠️ 金句提取失败: {e}")
+        return None
+
+
+@traced("generate")
+def generate_evening_html(article_data):
+    """
+    分块注读：文章按自然段切成片段并发注读，金句单独一个小调用，最后按顺序渲染进暖咖色模板。
+    失败的块单独重试 BLOCK_RETRIES 轮；仍有块失败就返回 None (不发缺段落的文章)。
+    """
+    blocks = split_blocks(article_data['content'])
+    print(f"🕯️ DeepSeek 正在为你拆解文章，准备伴读 (注读版，{len(blocks)} 个片段并发)...")
+
+    results = [None] * len(blocks)
+    with ThreadPoolExecutor(max_workers=min(ANNOTATION_WORKERS, len(blocks)) + 1) as pool:
+        quote_future = pool.submit(in_context(extract_golden_quote), article_data)
+
+        pending = list(range(len(blocks)))
+        for attempt in range(BLOCK_RETRIES + 1):
+            if attempt:
+                print(f"🔁 第 {attempt} 轮重试 {len(pending)} 个失败片段: {[i + 1 for i in pending]}")
+            futures = {i: pool.submit(in_context(annotate_block), article_data, i, len(blocks), blocks[i]) for i in pending}
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"⚠️ 片段 {i + 1}/{len(blocks)} 注读失败: {e}")
+            pending = [i for i in pending if results[i] is None]
+            if not pending:
+                break
+
+        quote = quote_future.result()
+
+    if pending:
+        print(f"❌ 生成失败: 片段 {[i + 1 for i in pending]} 重试后仍未完成")
         return None
+
+    return render_evening(article_data, [block for annotated in results for block in annotated], quote)
     
 
 # run
-def run():
+@traced_run("evening")
+def run(status_updates=None):
+    """
+    status_updates: (可选) 和新稿一起写入 Check 表的状态改动，见 push_to_sheets
+    """
     print("🌙 晚报 Agent 启动...")
     article_data = get_filtered_article() 
     
@@ -294,11 +422,13 @@ def run():
             
             # 只有生成成功才保存历史
             if article_data.get('link'):
-                save_history(article_data['link'])
+                save_history(article_data['link'], article_data.get('fingerprint'))
             
             # 推送到 Google Sheets
+            _, today_str, _ = get_target_dates()
             subject = f"Evening Brief: {today_str}"
-            push_to_sheets("evening", subject, html_content)
+            if not push_to_sheets("evening", subject, html_content, status_updates=status_updates):
+                return None
             print("😏已push到Google Sheet")
             
             return html_content
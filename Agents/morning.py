@@ -1,59 +1,60 @@
 # 环境配置
-import os, feedparser, smtplib, datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
-from openai import OpenAI
-from dotenv import load_dotenv
+import datetime
 import time
-from newspaper import Article
+from concurrent.futures import ThreadPoolExecutor
 from services.sheets import push_to_sheets
-import datetime
-from datetime import timedelta, timezone
-load_dotenv() # 加载你的 .env 文件
-print("环境配置已加载")
-
-# ================= 🇨🇳 北京时间智能日期逻辑 (新增) =================
-# 1. 强制创建一个北京时区 (UTC+8)
-beijing_tz = timezone(timedelta(hours=8))
-
-# 2. 获取当前的北京时间
-now_in_beijing = datetime.datetime.now(beijing_tz)
-
-# 3. 核心判断逻辑：
-# 如果北京时间超过 18:00 (晚上6点)，系统认为这是在"为明天备稿" -> 日期 +1
-# 如果北京时间没到 18:00 (比如上午补发)，系统认为这是"当日急救" -> 日期不变
-if now_in_beijing.hour >= 18:
-    target_date = now_in_beijing.date() + timedelta(days=1)
-else:
-    target_date = now_in_beijing.date()
-
-# 生成两种格式供下面使用
-today_str = target_date.strftime("%Y-%m-%d")  # 格式：2026-01-20
-display_date_str = target_date.strftime('%A, %B %d, %Y') # 格式：Tuesday, January 20, 2026
-# ================================================================
-
-
-# RSS信息源
-RSS_URLS = [
-    # 💵 市场与经济 (Market & Economy)
-    "https://www.cnbc.com/id/10000664/device/rss/rss.html", # CNBC Finance
-    "https://feeds.bloomberg.com/markets/news.rss",        # Bloomberg Markets
-    # 🚀 科技 (Technology)
-    "https://techcrunch.com/feed/",                         # TechCrunch
-    "https://www.theverge.com/rss/index.xml",               # The Verge
-    # 🎬 娱乐 (Entertainment) - 还是保留一点轻松的
-    "https://www.eonline.com/news/rss.xml",                 # E! Online
-    "https://variety.com/feed/",                            # Variety (偏产业向的娱乐新闻)
-    # 🎨 文化 (Culture)
-    "https://www.newyorker.com/feed/culture",               # New Yorker Culture
-    "https://www.theguardian.com/culture/rss",              # Guardian Culture
+from services.llm import generate_json
+from services.feeds import fetch_feeds
+from services.dates import get_target_dates
+from services.compaction import compact_news, format_snippets, estimate_tokens
+from services.render import validate_stories, render_morning
+from services.telemetry import span, traced, traced_run, in_context
+# 注意：.env 由入口 (main.py / dispatcher.py) 统一加载，日期和客户端都在第一次使用时才创建
+
+
+# RSS信息源 (按早报的四个板块分组)
+MORNING_SECTIONS = [
+    {
+        "key": "market", "title": "💵 Market & Economy", "name": "市场与经济", "color": "#2c5282",
+        "feeds": [
+            "https://www.cnbc.com/id/10000664/device/rss/rss.html", # CNBC Finance
+            "https://feeds.bloomberg.com/markets/news.rss",        # Bloomberg Markets
+        ],
+    },
+    {
+        "key": "technology", "title": "🚀 Technology", "name": "科技前沿", "color": "#2b6cb0",
+        "feeds": [
+            "https://techcrunch.com/feed/",                         # TechCrunch
+            "https://www.theverge.com/rss/index.xml",               # The Verge
+        ],
+    },
+    {
+        # 还是保留一点轻松的
+        "key": "entertainment", "title": "🎬 Entertainment", "name": "娱乐动态", "color": "#3182ce",
+        "feeds": [
+            "https://www.eonline.com/news/rss.xml",                 # E! Online
+            "https://variety.com/feed/",                            # Variety (偏产业向的娱乐新闻)
+        ],
+    },
+    {
+        "key": "culture", "title": "🎨 Culture", "name": "文化观察", "color": "#4299e1",
+        "feeds": [
+            "https://www.newyorker.com/feed/culture",               # New Yorker Culture
+            "https://www.theguardian.com/culture/rss",              # Guardian Culture
+        ],
+    },
 ]
 
+RSS_URLS = [url for section in MORNING_SECTIONS for url in section["feeds"]]
+
+# True: 四个板块拆成四个并发的小调用，本地拼接模板；False: 一次调用生成整份早报 (旧模式)
+SECTION_PARALLEL = True
+STORIES_PER_SECTION = 3
+
 
 TIME_WINDOW_HOURS = 24
 
-# get_rss_news
+# get_rss_items
 def is_recent(entry_date):
     """
     判断新闻是否在时间窗口内 (过去 24 小时)
@@ -79,16 +80,25 @@ def is_recent(entry_date):
         # 如果时间格式解析比对出错，为了保险起见，保留该条目
         return True
 
-def get_rss_news(urls):
+@traced("collect_items")
+def get_rss_items(urls):
+    """
+    抓取各源过去 24 小时的新闻条目，返回原始 items (还没清洗和去重)
+    """
     print(f"🔍 正在扫描过去 {TIME_WINDOW_HOURS} 小时的新闻概要...")
     
-    all_snippets = []
+    items = []
     
-    for url in urls:
+    # 所有源并发抓取，每个源有独立超时，整体有总预算 (见 services/feeds.py)
+    with span("fetch_feeds", feeds=len(urls)) as s:
+        fetched = fetch_feeds(urls)
+        s.set(ok=sum(1 for _, feed in fetched if feed is not None))
+
+    for url, feed in fetched:
+        if feed is None:
+            continue
+
         try:
-            print(f"  - 正在读取: {url} ...")
-            feed = feedparser.parse(url)
-            
             count = 0
             for entry in feed.entries:
                 # 1. 解析时间
@@ -104,18 +114,15 @@ def get_rss_news(urls):
                     continue # 太旧了，跳过
                 
                 # 3. 提取摘要 (仅摘要，不要正文)
-                title = entry.title
-                link = entry.link
                 # 有些源把摘要放在 summary，有些在 description
-                summary = entry.get('summary', entry.get('description', 'No summary'))
-                
-                # 清洗一下 HTML 标签 (简单处理，主要靠 LLM 读)
-                # 截取前 300 个字符，只要大意
-                clean_summary = summary[:300].replace('\n', ' ')
-                
-                # 格式化成一段小文本
-                snippet = f"【标题】{title}\n【来源】{feed.feed.get('title', 'Unknown')}\n【摘要】{clean_summary}\n【链接】{link}\n"
-                all_snippets.append(snippet)
+                items.append({
+                    "title": entry.title,
+                    "source": feed.feed.get('title', 'Unknown'),
+                    "summary": entry.get('summary', entry.get('description', 'No summary')),
+                    "link": entry.link,
+                    "published": published_date,
+                    "feed_url": url,
+                })
                 count += 1
                 
                 # 每个源最多取前 5 条最新的，防止某个源刷屏
@@ -123,146 +130,203 @@ def get_rss_news(urls):
                     break
                     
         except Exception as e:
-            print(f"❌ 读取失败: {url} - {e}")
+            print(f"❌ 解析失败: {url} - {e}")
             continue
 
-    if not all_snippets:
-        return None
-        
-    print(f"⚡️ 扫描完成！共获取 {len(all_snippets)} 条最新资讯。")
-    # 将列表拼成一个长字符串给 AI
-    return "\n\n".join(all_snippets)
+    return items
+
+@traced("compact")
+def compact_items(items):
+    """
+    压缩阶段：去 HTML -> 跨源近似重复聚类 -> 每组保留一条 -> 排序 (见 services/compaction.py)
+    """
+    # 压缩前的体积按旧做法 (直接截取原始摘要前 300 字符) 估算
+    raw_text = "\n\n".join(f"【标题】{it['title']}\n【来源】{it['source']}\n【摘要】{it['summary'][:300]}\n【链接】{it['link']}\n" for it in items)
+    compacted = compact_news(items)
 
+    before, after = estimate_tokens(raw_text), estimate_tokens(format_snippets(compacted))
+    print(f"⚡️ 扫描完成！共获取 {len(items)} 条资讯，去重后 {len(compacted)} 条。")
+    print(f"🗜️ 资讯池约 {before} → {after} tokens (减少 {before - after}，{(before - after) / max(before, 1):.0%})")
+    return compacted
 
-# get_news_summary
+
+# ================= 结构化输出 =================
+# 模型只返回 JSON (新闻概述、划线词、释义)，深蓝模板由 services/render.py 在本地渲染并校验结构。
+# 带 style= 的 HTML 外壳不再占用输出 token。
+
+SYSTEM_PROMPT = """
+你是一位视野开阔的《全球晨报》主编。
+你的任务是从杂乱的资讯中筛选出最具价值的新闻，并将其归类整理。
+你的文风简洁、专业，适合商务人士快速阅读。
+同时，你也是一位语言专家，会在每条新闻后顺带提炼一个地道的英语表达（Idiom/Term）。
+切记：先用英文给出概括，在已概括的文本上选取重难点表达/词汇进行讲解，并在英文概括部分把对应的表达用下划线给出（如果涉及短语，就把整个短语用下划线给出）。
+千万“不允许”出现选取的重难点表达/词汇“不存在”英文概括中 的情况。
+"""
+
+STORY_SCHEMA = """{"en": "新闻概述（用英文,3-4句话）。撰写完成后挑选 3-5 个值得讲解的重难点词汇/短语，在原文中用 [[ ]] 包裹，例如 The company decided to [[pivot]] its strategy.",
+     "zh": "把英文的新闻概述翻译成中文",
+     "terms": [{"term": "pivot", "meaning": "中文释义", "example": "简短例句或用法"}]}"""
+
+OUTPUT_RULES = """
+    - 只输出一个 JSON 对象，不要输出 HTML、Markdown 或任何解释文字，排版由程序完成。
+    - terms 与 en 中用 [[ ]] 包裹的表达一一对应，term 必须原样出现在 en 里。
+"""
+
+
+@traced("generate")
 def get_news_summary(raw_text):
-    print("🧠 正在生成【早报：四大板块新闻】（深蓝商务版）...")
-    
-    client = OpenAI(
-        api_key=os.getenv("DEEPSEEK_API_KEY"),
-        base_url="https://api.deepseek.com"
-    )
-
-    # --- 1. System Prompt: 国际新闻主编人设 ---
-    system_prompt = """
-    你是一位视野开阔的《全球晨报》主编。
-    你的任务是从杂乱的资讯中筛选出最具价值的新闻，并将其归类整理。
-    你的文风简洁、专业，适合商务人士快速阅读。
-    同时，你也是一位语言专家，会在每条新闻后顺带提炼一个地道的英语表达（Idiom/Term）。
-    切记：先用英文给出概括，在已概括的文本上选取重难点表达/词汇进行讲解，并在英文概括部分把对应的表达用下划线给出（如果涉及短语，就把整个短语用下划线给出）。
-    千万“不允许”出现选取的重难点表达/词汇“不存在”英文概括中 的情况。
     """
+    旧模式：一次调用生成四个板块 (SECTION_PARALLEL = False 时使用)。失败返回 None。
+    """
+    print("🧠 正在生成【早报：四大板块新闻】（深蓝商务版）...")
+    _, today_str, display_date_str = get_target_dates()
 
-    # --- 2. User Prompt: 定义深蓝色皮肤与四大板块结构 ---
     user_prompt = f"""
     今天是 {today_str}。
     
     【任务目标】：
     请阅读以下原始资讯池，筛选并整理出 **4 个固定板块** 的新闻内容。
-    每个板块筛选 **3 条** 最重要的新闻。
+    每个板块筛选 **{STORIES_PER_SECTION} 条** 最重要的新闻。
     
-    【板块顺序】：
-    1. 💵 市场与经济 (Market & Economy)
-    2. 🚀 科技前沿 (Technology)
-    3. 🎬 娱乐动态 (Entertainment)
-    4. 🎨 文化观察 (Culture)
+    【板块】：
+    {chr(10).join(f"    - {section['key']}: {section['name']} ({section['title']})" for section in MORNING_SECTIONS)}
 
     【原始资讯池】：
     {raw_text}
 
-    【输出格式要求 - 必须严格遵守 HTML 格式】：
-    请输出一段完整的 HTML 代码。不要使用 Markdown。
-    
-    请严格按照以下结构生成，**必须将所有内容包裹在指定的深蓝色背景容器中**：
-
-    <div style="background-color: #f0f4f8; padding: 20px; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333;">
-        
-        <div style="max-width: 800px; margin: 0 auto; margin-bottom: 30px; border-bottom: 4px solid #1a365d; padding-bottom: 20px;">
-            <h1 style="color: #1a365d; font-size: 36px; margin-bottom: 10px; font-weight: 900; letter-spacing: 1px;">Global Morning Brief</h1>
-            <p style="color: #4a5568; font-size: 16px; font-weight: 500;">
-                {display_date_str} | 每日精选，洞见全球
-            </p>
-        </div>
-
-        <div style="max-width: 800px; margin: 0 auto;">
-
-            <div style="margin-bottom: 40px;">
-                <h2 style="background-color: #2c5282; color: white; padding: 10px 15px; border-radius: 6px; font-size: 20px; display: inline-block;">💵 Market & Economy</h2>
-                <hr style="border: 0; border-top: 2px solid #2c5282; margin-top: 0; margin-bottom: 20px;">
-                
-                <div style="background-color: white; border-left: 5px solid #2c5282; padding: 15px; margin-bottom: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
-                    <div style="font-size: 16px; font-weight: bold; color: #2d3748; margin-bottom: 8px;">
-                        新闻概述（用英文,3-4句话。<b>⚠️ 重要指令：在**撰写完成后**，请务必挑选 3-5 个值得讲解的重难点词汇（挑选的词汇必须是来自撰写完成后的新闻概述），并直接用 &lt;u&gt;单词&lt;/u&gt; 标签包裹它们。</b>例如：The company decided to &lt;u&gt;pivot&lt;/u&gt; its strategy...)
-                    </div>
-                    <div style="font-size: 14px; color: #4a5568; line-height: 1.6; margin-bottom: 10px;">
-                        把英文的新闻概述翻译成中文。
-                    </div>
-
-
-                    <div style="background-color: #ebf8ff; padding: 15px; border-radius: 6px; font-size: 14px; color: #2c5282; border: 1px solid #bee3f8;">
-                        <div style="font-weight: bold; margin-bottom: 8px; font-size: 14px;">💡 表达积累：</div>
-                        <ul style="margin: 0; padding-left: 20px; list-style-type: disc; line-height: 1.6;">
-                            对英文新闻概述中出现并挑选出来的重难点表达/词汇进行讲解，讲解不限个数，按照以下格式：
-                            <li><span style="font-family: monospace; font-weight: bold; color: #2b6cb0;">Word/Phrase 1</span>: 中文释义 <span style="color: #718096;">( 简短例句或用法)</span></li>
-                            <li><span style="font-family: monospace; font-weight: bold; color: #2b6cb0;">Word/Phrase 2</span>: 中文释义 <span style="color: #718096;">( 简短例句或用法)</span></li>
-                            <li><span style="font-family: monospace; font-weight: bold; color: #2b6cb0;">Word/Phrase 3</span>: 中文释义 <span style="color: #718096;">( 简短例句或用法)</span></li>
-                            ...（如果有更多讲解同理按照上面格式）
-                            </ul>
-                    </div>
-
-                </div>
-                </div>
-
-            <div style="margin-bottom: 40px;">
-                <h2 style="background-color: #2b6cb0; color: white; padding: 10px 15px; border-radius: 6px; font-size: 20px; display: inline-block;">🚀 Technology</h2>
-                <hr style="border: 0; border-top: 2px solid #2b6cb0; margin-top: 0; margin-bottom: 20px;">
-                </div>
-
-            <div style="margin-bottom: 40px;">
-                <h2 style="background-color: #3182ce; color: white; padding: 10px 15px; border-radius: 6px; font-size: 20px; display: inline-block;">🎬 Entertainment</h2>
-                <hr style="border: 0; border-top: 2px solid #3182ce; margin-top: 0; margin-bottom: 20px;">
-                </div>
-
-            <div style="margin-bottom: 40px;">
-                <h2 style="background-color: #4299e1; color: white; padding: 10px 15px; border-radius: 6px; font-size: 20px; display: inline-block;">🎨 Culture</h2>
-                <hr style="border: 0; border-top: 2px solid #4299e1; margin-top: 0; margin-bottom: 20px;">
-                </div>
-
-            <div style="text-align: center; margin-top: 50px; border-top: 1px solid #cbd5e0; padding-top: 20px; color: #718096; font-size: 12px;">
-                © 2026 Daily Briefing
-            </div>
-
-        </div> 
-    </div>
+    【输出格式要求 - JSON】：
+    {{"market": {{"stories": [新闻, ...]}}, "technology": {{...}}, "entertainment": {{...}}, "culture": {{...}}}}
+    其中每条新闻的结构：
+    {STORY_SCHEMA}
+    {OUTPUT_RULES}
     """
 
+    def validate(obj):
+        return [(section, validate_stories(obj.get(section["key"]), STORIES_PER_SECTION)) for section in MORNING_SECTIONS]
+
     try:
-        response = client.chat.completions.create(
-            model="deepseek-reasoner", # 这种结构化总结用 V3 (chat) 足够了，速度快
-            messages=[
-                {"role": "system", "content": system_prompt},
+        # 流式生成，带首 token / 停顿超时；结构不合格会带着错误原因重试一次 (见 services/llm.py)
+        sections = generate_json(
+            [
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt},
             ],
-            stream=False,
+            validate,
+            label="morning",
             temperature=0.2,
             max_tokens=8000
         )
-        return response.choices[0].message.content
     except Exception as e:
         print(f"❌ AI 总结失败: {e}")
-        return "AI 暂时无法处理。"
-    
+        return None
+    return render_morning(display_date_str, sections)
+
+
+# ================= 分板块并发生成 =================
+# 四个板块各发一个小调用 (只生成该板块的 3 条新闻)，结果在本地按顺序渲染。
+# 总耗时约等于最慢的那个板块，而不是一次性生成整份早报的耗时。
+
+def group_by_section(items):
+    """
+    按来源 feed 把压缩后的资讯分到四个板块，保持压缩阶段的排序
+    """
+    section_of = {url: section["key"] for section in MORNING_SECTIONS for url in section["feeds"]}
+    grouped = {section["key"]: [] for section in MORNING_SECTIONS}
+    for item in items:
+        key = section_of.get(item.get("feed_url"))
+        if key:
+            grouped[key].append(item)
+    return grouped
+
+
+def generate_section_stories(section, items, today_str, retries=1):
+    """
+    为一个板块生成最多 STORIES_PER_SECTION 条新闻 (已校验的 stories 列表)。
+    调用失败或结构不合格会重试 retries 次，仍失败返回 None。
+    """
+    user_prompt = f"""
+    今天是 {today_str}。
+
+    【任务目标】：
+    你负责 **{section['name']} ({section['title']})** 板块。
+    请阅读以下资讯，筛选出 **{STORIES_PER_SECTION} 条** 最重要的新闻 (资讯不足时有几条写几条)。
+
+    【资讯】：
+    {format_snippets(items)}
+
+    【输出格式要求 - JSON】：
+    {{"stories": [新闻, ...]}}
+    其中每条新闻的结构：
+    {STORY_SCHEMA}
+    {OUTPUT_RULES}
+    """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    try:
+        return generate_json(messages, lambda obj: validate_stories(obj, STORIES_PER_SECTION),
+                             label=f"morning/{section['key']}", retries=retries, temperature=0.2, max_tokens=3000)
+    except Exception as e:
+        print(f"⚠️ [{section['title']}] 生成失败: {e}")
+        return None
+
+
+@traced("generate")
+def get_news_summary_by_section(items):
+    """
+    四个板块并发生成，再按固定顺序渲染进深蓝模板。
+    任何一个有资讯的板块最终失败，整份早报返回 None (不发残缺的简报)。
+    """
+    print("🧠 正在分板块并发生成【早报：四大板块新闻】（深蓝商务版）...")
+    _, today_str, display_date_str = get_target_dates()
+    grouped = group_by_section(items)
+
+    active = [section for section in MORNING_SECTIONS if grouped[section["key"]]]
+    for section in MORNING_SECTIONS:
+        if not grouped[section["key"]]:
+            print(f"📭 [{section['title']}] 板块今天没有资讯，跳过")
+    if not active:
+        return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(active)) as pool:
+        futures = {section["key"]: pool.submit(in_context(generate_section_stories), section, grouped[section["key"]], today_str)
+                   for section in active}
+        stories = {key: future.result() for key, future in futures.items()}
+
+    failed = [key for key, result in stories.items() if not result]
+    if failed:
+        print(f"❌ 板块生成失败: {', '.join(failed)}")
+        return None
+
+    print(f"⏱️ 四个板块并发生成完成，用时 {time.perf_counter() - start:.1f}s")
+    return render_morning(display_date_str, [(section, stories[section["key"]]) for section in active])
 
-def run():
+@traced_run("morning")
+def run(status_updates=None):
+    """
+    status_updates: (可选) 和新稿一起写入 Check 表的状态改动，见 push_to_sheets
+    """
     print("🌅 早报 Agent 启动...")
-    raw_news = get_rss_news(RSS_URLS)
+    items = get_rss_items(RSS_URLS)
     
-    if raw_news:
-        summary_html = get_news_summary(raw_news)
+    if items:
+        compacted = compact_items(items)
+        if SECTION_PARALLEL:
+            summary_html = get_news_summary_by_section(compacted)
+        else:
+            summary_html = get_news_summary(format_snippets(compacted))
+        if not summary_html:
+            print("❌ 早报生成失败，本次不推送。")
+            return None
 
         # 推送到 Google Sheets
+        _, today_str, _ = get_target_dates()
         subject = f"Morning Brief: {today_str}"
-        push_to_sheets("morning", subject, summary_html)
+        if not push_to_sheets("morning", subject, summary_html, status_updates=status_updates):
+            return None
         print("😏已push到Google Sheet")
 
         return summary_html
@@ -0,0 +1,75 @@
+"""
+Check 表扫描对比：get_all_values() 整表读取 vs read_check_status() 只读 Date/Task/Status 列 + read_check_cells() 按需读取待发行。
+
+两种做法都通过 services/sheets.py 的真实代码路径，跑在 benchmarks/standins.py 的内存版 Google Sheets 上
+(sheets.get_client 换成 FakeGspread)：每次 API 调用按 延迟 + 载荷字节数 / 带宽 计时，
+并统计 API 调用次数和响应载荷字节数，不连真实的 Google Sheets。
+
+用法: python benchmarks/bench_check_scan.py [天数] [每次调用延迟毫秒]
+"""
+import os
+import sys
+import time
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from services import sheets
+from benchmarks.standins import FakeGspread, synthetic_check_rows
+
+
+def make_client(days, latency):
+    """
+    一年份的历史行 (每天早/午/晚三行，大多已 Sent)，最上面是今天待发的三行
+    """
+    today = datetime.date.today().strftime("%Y-%m-%d")
+    pending = [[today, task, f"{task.title()} Brief: {today}", "<div>" + "x" * 20000 + "</div>", "Pending"]
+               for task in ("evening", "afternoon", "morning")]
+    fake = FakeGspread(latency=latency)
+    fake.seed(pending + synthetic_check_rows(days * 3), [])
+    sheets.get_client = lambda force_new=False: fake
+    sheets._worksheets.clear()
+    sheets.get_worksheet("Check")  # 打开 worksheet 的元数据请求不计入两种做法
+    return fake
+
+
+def old_scan(task):
+    # 旧做法：整表读下来，在本地按 Task / Status 过滤
+    rows = sheets.with_worksheet("Check", lambda sheet: sheet.get_all_values())
+    return [(i + 1, row[2], row[3]) for i, row in enumerate(rows)
+            if i > 0 and row[1] == task and row[4] in ["Approved", "Pending"]]
+
+
+def new_scan(task):
+    # 新做法：三列投影，再只读待发行的 C:D
+    targets = [r for r, _, row_task, status in sheets.read_check_status()
+               if row_task == task and status in ["Approved", "Pending"]]
+    cells = sheets.read_check_cells(targets, "C", "D")
+    return [(r, *cells[r]) for r in targets]
+
+
+def measure(fake, scan, task):
+    calls, size = fake.calls, fake.bytes
+    start = time.perf_counter()
+    found = scan(task)
+    return found, fake.calls - calls, fake.bytes - size, (time.perf_counter() - start) * 1000
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 150) / 1000
+    fake = make_client(days, latency)
+
+    results = {name: measure(fake, scan, "morning") for name, scan in
+               [("get_all_values", old_scan), ("read_check_status + cells", new_scan)]}
+    old, new = results["get_all_values"], results["read_check_status + cells"]
+    assert [(s, h) for _, s, h in old[0]] == [(s, h) for _, s, h in new[0]], "两种做法找到的待发行不一致"
+
+    print(f"Check sheet: {days * 3 + 3} rows ({days} days), {latency * 1000:.0f} ms per API call")
+    print(f"{'scan':<30}{'calls':>7}{'payload':>14}{'wall':>12}")
+    for name, (found, calls, size, ms) in results.items():
+        print(f"{name:<30}{calls:>7}{size / 1024:>11.1f} KB{ms:>9.0f} ms")
+    print(f"reduction: {old[2] / new[2]:.0f}x fewer bytes, {old[3] / new[3]:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
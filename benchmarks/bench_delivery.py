@@ -0,0 +1,60 @@
+"""
+群发基准：单连接串行 send_email 式发送 vs deliver() 多连接并发，对着本地 SMTP 接收端测试。
+
+接收端每封信模拟一定的服务器处理延迟，不需要真实的 163 账号。
+
+用法: python benchmarks/bench_delivery.py [收件人数] [每封延迟毫秒]
+"""
+import os
+import sys
+import time
+import threading
+
+os.environ.setdefault("MAIL_USERNAME", "bench@example.com")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from services.mailer import MailSession, build_message, deliver
+from benchmarks.standins import SinkHandler, SinkServer
+
+
+def local_session(port):
+    return lambda: MailSession(server="127.0.0.1", port=port, use_ssl=False, username="bench@example.com", password="")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    SinkHandler.latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 5) / 1000
+
+    server = SinkServer(("127.0.0.1", 0), SinkHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    recipients = [f"user{i}@example.com" for i in range(count)]
+    html = "<div>" + "Daily brief content. " * 2000 + "</div>"
+    print(f"{count} recipients, {SinkHandler.latency * 1000:.0f} ms server latency per message")
+
+    # 串行：一条连接逐个发送 (等同于 send_email 的做法)
+    start = time.perf_counter()
+    session = local_session(port)()
+    payload = build_message("Bench", html)
+    for r in recipients:
+        session.send(r, payload)
+    session.close()
+    serial = time.perf_counter() - start
+    print(f"{'serial, 1 connection':<32}{serial:>8.2f}s")
+
+    for k in (4, 8):
+        start = time.perf_counter()
+        results = deliver("Bench", html, recipients, connections=k, rate=0, session_factory=local_session(port))
+        elapsed = time.perf_counter() - start
+        ok = sum(1 for err in results.values() if err is None)
+        print(f"{f'deliver, {k} connections':<32}{elapsed:>8.2f}s  ({ok}/{count} ok, {serial / elapsed:.1f}x)")
+
+    start = time.perf_counter()
+    deliver("Bench", html, recipients[:50], connections=4, rate=20, session_factory=local_session(port))
+    print(f"{'deliver, 50 msgs capped 20/s':<32}{time.perf_counter() - start:>8.2f}s  (expected >= 2.45s)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
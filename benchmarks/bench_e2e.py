@@ -0,0 +1,198 @@
+"""
+端到端基准：在本地替身上完整跑一遍 main.py 和 dispatcher.py，不需要任何真实账号。
+
+替身见 benchmarks/standins.py：合成 RSS 源 + 文章页、OpenAI 兼容的假 DeepSeek (可调首 token 延迟和输出速度)、
+内存版 Google Sheets (每次 API 调用按延迟 + 载荷计时)、本地 SMTP 接收端。
+每一轮都在同一个临时工作目录里、从相同的初始状态开始，依次执行：
+
+    main.py --task all
+    main.py --pregenerate             (和 daily_tasks.yml 一样，生成之后单独补齐午报队列)
+    dispatcher.py --mode send --task morning / afternoon / evening
+    dispatcher.py --mode monitor      (Check 表里预置了一行 Reject，会触发一次重写)
+    dispatcher.py --mode archive
+
+每一步都是独立的子进程 (和 GitHub Actions 里一样，包含解释器启动和导入)，
+最后汇总每一步的墙钟时间，以及 telemetry/runs.jsonl 里各阶段耗时的 p50 / p95。
+
+用法: python benchmarks/bench_e2e.py [--runs 3] [--feeds 50] [--subscribers 5000] [--rows 1000] ...
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO)
+from benchmarks.standins import (Corpus, ContentHandler, ContentServer, SinkHandler, SinkServer,
+                                 FakeGspread, synthetic_check_rows, synthetic_users)
+
+STATE_FILE = "bench_sheets.json"   # 工作目录里的"表格"，各子进程共用
+STEPS = [
+    ("main --task all", "main.py", ["--task", "all"]),
+    ("pregenerate", "main.py", ["--pregenerate"]),
+    ("send morning", "dispatcher.py", ["--mode", "send", "--task", "morning"]),
+    ("send afternoon", "dispatcher.py", ["--mode", "send", "--task", "afternoon"]),
+    ("send evening", "dispatcher.py", ["--mode", "send", "--task", "evening"]),
+    ("monitor", "dispatcher.py", ["--mode", "monitor"]),
+    ("archive", "dispatcher.py", ["--mode", "archive"]),
+]
+# 每轮开始前清掉的本地状态 (--warm-feeds 时保留 .feed_cache，模拟 workflow 里的 actions/cache)
+RESET_PATHS = ["evening_history.jsonl", "ielts_state.json", "artifacts", "ielts_queue"]
+
+
+def child(script, argv):
+    """
+    子进程入口：把表格客户端、RSS 源和发送限速换成替身，然后像命令行一样执行 script
+    """
+    import atexit
+    import runpy
+    from services import sheets, mailer
+    from Agents import morning, evening
+
+    fake = FakeGspread(latency=float(os.environ["BENCH_SHEETS_LATENCY"])).load(STATE_FILE)
+    sheets.get_client = lambda force_new=False: fake
+    atexit.register(fake.save, STATE_FILE)
+
+    base_url = os.environ["BENCH_CONTENT_URL"]
+    feeds = [f"{base_url}/rss/{i}.xml" for i in range(int(os.environ["BENCH_FEEDS"]))]
+    for i, section in enumerate(morning.MORNING_SECTIONS):
+        section["feeds"] = feeds[i::len(morning.MORNING_SECTIONS)]
+    morning.RSS_URLS = [url for section in morning.MORNING_SECTIONS for url in section["feeds"]]
+    evening.SAFE_RSS_SOURCES = feeds
+
+    mailer.MAX_MESSAGES_PER_SECOND = float(os.environ["BENCH_SEND_RATE"])
+
+    sys.argv = [script] + argv
+    runpy.run_path(os.path.join(REPO, script), run_name="__main__")
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"  {'':<52}{'n':>4}{'p50':>9}{'p95':>9}{'max':>9}")
+    for name, values in rows:
+        print(f"  {name:<52}{len(values):>4}{percentile(values, 50):>8.2f}s{percentile(values, 95):>8.2f}s{max(values):>8.2f}s")
+
+
+def stage_rows(telemetry_file):
+    """
+    按 (run, 阶段) 汇总 runs.jsonl；同一次运行里出现多次的阶段 (例如每个候选文章的 download) 分别计入
+    """
+    durations = {}
+    with open(telemetry_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            durations.setdefault((record["run"], "(total)"), []).append(record["duration"])
+            for entry in record["spans"]:
+                durations.setdefault((record["run"], entry["name"]), []).append(entry["duration"])
+    return [(f"{run_name} :: {name}", values) for (run_name, name), values in sorted(durations.items())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="main.py + dispatcher.py 端到端基准 (本地替身)")
+    parser.add_argument("--runs", type=int, default=3, help="重复几轮")
+    parser.add_argument("--feeds", type=int, default=50, help="RSS 源数量 (早报和晚报共用)")
+    parser.add_argument("--subscribers", type=int, default=5000, help="Users 表里的有效订阅人数")
+    parser.add_argument("--rows", type=int, default=1000, help="Check 表里预置的历史行数")
+    parser.add_argument("--llm-ttft", type=float, default=2.0, help="假模型首 token 延迟 (秒)")
+    parser.add_argument("--llm-tps", type=float, default=100.0, help="假模型输出速度 (tokens/s)")
+    parser.add_argument("--http-latency", type=float, default=0.05, help="RSS / 文章页面的服务器延迟 (秒)")
+    parser.add_argument("--sheets-latency", type=float, default=0.15, help="每次 Sheets API 调用的延迟 (秒)")
+    parser.add_argument("--smtp-latency", type=float, default=0.0, help="SMTP 每封信的服务器处理延迟 (秒)")
+    parser.add_argument("--send-rate", type=float, default=0, help="群发限速 (封/秒，0 表示不限速)")
+    parser.add_argument("--warm-feeds", action="store_true", help="各轮之间保留 .feed_cache (条件请求命中 304)")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录 (日志、稿件、telemetry)")
+    parser.add_argument("--verbose", action="store_true", help="直接输出各步骤的日志")
+    args = parser.parse_args()
+
+    # 1. 启动替身服务
+    ContentHandler.corpus = Corpus(args.feeds)
+    ContentHandler.http_latency = args.http_latency
+    ContentHandler.llm_ttft = args.llm_ttft
+    ContentHandler.llm_tps = args.llm_tps
+    SinkHandler.latency = args.smtp_latency
+    content = ContentServer(("127.0.0.1", 0), ContentHandler)
+    sink = SinkServer(("127.0.0.1", 0), SinkHandler)
+    for server in (content, sink):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    content_url = f"http://127.0.0.1:{content.server_address[1]}"
+
+    # 2. 临时工作目录：各模块的状态文件都按 cwd 定位
+    workdir = tempfile.mkdtemp(prefix="bench-e2e-")
+    os.symlink(os.path.join(REPO, "IELTS Speaking Materials"), os.path.join(workdir, "IELTS Speaking Materials"))
+    os.makedirs(os.path.join(workdir, "logs"))
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        NO_PROXY="127.0.0.1,localhost", no_proxy="127.0.0.1,localhost",
+        DEEPSEEK_BASE_URL=f"{content_url}/v1", DEEPSEEK_API_KEY="bench",
+        MAIL_USERNAME="bench@example.com", MAIL_PASSWORD="bench", MAIL_RECIPIENTS="preview@example.com",
+        MAIL_SMTP_SERVER="127.0.0.1", MAIL_SMTP_PORT=str(sink.server_address[1]), MAIL_SMTP_SSL="0",
+        BENCH_CONTENT_URL=content_url, BENCH_FEEDS=str(args.feeds),
+        BENCH_SHEETS_LATENCY=str(args.sheets_latency), BENCH_SEND_RATE=str(args.send_rate),
+    )
+    print(f"🧪 {args.runs} 轮 | {args.feeds} 个源 | {args.subscribers} 位订阅者 | Check 表 {args.rows} 行 | "
+          f"LLM 首 token {args.llm_ttft}s、{args.llm_tps:.0f} tok/s | Sheets {args.sheets_latency * 1000:.0f}ms/次")
+    print(f"📁 工作目录: {workdir}")
+
+    # 3. 逐轮执行
+    users = synthetic_users(args.subscribers)
+    wall = {name: [] for name, _, _ in STEPS}
+    totals, failures = [], []
+    try:
+        for n in range(args.runs):
+            sheets = FakeGspread()
+            sheets.seed(synthetic_check_rows(args.rows, reject=1), users)
+            sheets.save(os.path.join(workdir, STATE_FILE))
+            for name in RESET_PATHS + ([] if args.warm_feeds else [".feed_cache"]):
+                path = os.path.join(workdir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+            sent_before = SinkHandler.received
+            run_start = time.monotonic()
+            for name, script, argv in STEPS:
+                log_path = os.path.join(workdir, "logs", f"{n + 1}-{name.replace(' ', '_')}.log")
+                start = time.monotonic()
+                with open(log_path, 'w', encoding='utf-8') as log:
+                    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", script, *argv],
+                                          cwd=workdir, env=env,
+                                          stdout=None if args.verbose else log, stderr=subprocess.STDOUT)
+                wall[name].append(time.monotonic() - start)
+                if proc.returncode != 0:
+                    failures.append(f"第 {n + 1} 轮 {name} 退出码 {proc.returncode} (日志: {log_path})")
+            totals.append(time.monotonic() - run_start)
+            print(f"  - 第 {n + 1} 轮: {totals[-1]:.1f}s, SMTP 接收 {SinkHandler.received - sent_before} 封")
+
+        # 4. 汇总
+        print_table("⏱️ 各步骤墙钟时间 (含进程启动):", [(name, values) for name, values in wall.items()]
+                    + [("(整轮)", totals)])
+        telemetry_file = os.path.join(workdir, "telemetry", "runs.jsonl")
+        if os.path.exists(telemetry_file):
+            print_table("📈 各阶段耗时 (telemetry/runs.jsonl):", stage_rows(telemetry_file))
+        for failure in failures:
+            print(f"❌ {failure}")
+    finally:
+        if args.keep or failures:
+            print(f"\n📁 工作目录已保留: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3:])
+    else:
+        main()
@@ -0,0 +1,64 @@
+"""
+晚报历史记录：旧做法 (整份 JSON 列表，查重读一次、保存时再读一次并整份重写) vs 只追加的 JSONL 日志 (services/history.py)。
+
+模拟一次晚报运行：载入历史 -> 查重若干候选链接 -> 记录一篇新文章。
+
+用法: python benchmarks/bench_history.py [已有记录数]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from services.history import UrlHistory
+
+
+def legacy_run(path, candidates, new_url):
+    with open(path, 'r') as f:
+        sent = set(json.load(f))
+    hits = sum(1 for url in candidates if url in sent)
+    # save_history: 再读一次，整份重写
+    with open(path, 'r') as f:
+        history = set(json.load(f))
+    history.add(new_url)
+    with open(path, 'w') as f:
+        json.dump(list(history), f)
+    return hits
+
+
+def log_run(path, candidates, new_url):
+    history = UrlHistory(path)
+    hits = sum(1 for url in candidates if url in history)
+    history.add(new_url)
+    return hits
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    urls = [f"https://www.nasa.gov/news/{i:06d}-a-fairly-typical-article-slug/" for i in range(count)]
+    candidates = urls[-20:] + [f"https://science.nasa.gov/new/{i}/" for i in range(20)]
+    workdir = tempfile.mkdtemp(prefix="bench-history-")
+    legacy_path = os.path.join(workdir, "evening_history.json")
+    log_path = os.path.join(workdir, "evening_history.jsonl")
+    with open(legacy_path, 'w') as f:
+        json.dump(urls, f)
+    with open(log_path, 'w') as f:
+        now = int(time.time())
+        f.writelines(json.dumps({"url": url, "ts": now}) + "\n" for url in urls)
+
+    print(f"{count} URLs in history, {len(candidates)} candidates per run")
+    for name, fn, path in (("legacy JSON list", legacy_run, legacy_path), ("append-only JSONL", log_run, log_path)):
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        runs = 20
+        for i in range(runs):
+            fn(path, candidates, f"https://www.nasa.gov/fresh/{name[0]}{i}/")
+        elapsed = (time.perf_counter() - start) / runs * 1000
+        written = os.path.getsize(path) - size if fn is log_run else os.path.getsize(path)
+        print(f"{name:<20} {elapsed:8.1f} ms/run   bytes written per run: {written // (runs if fn is log_run else 1):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+违禁词匹配微基准：旧的逐词 re.search 循环 vs 导入时编译的单遍匹配器。
+
+用法: python benchmarks/bench_keywords.py
+"""
+import os
+import re
+import ast
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from services.keywords import compile_keywords, find_keyword
+
+
+def load_banned_keywords():
+    # 直接从源码里读词表，不导入 Agents.evening (避免依赖 openai / newspaper)
+    path = os.path.join(os.path.dirname(__file__), "..", "Agents", "evening.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "BANNED_KEYWORDS":
+            return ast.literal_eval(node.value)
+    raise RuntimeError("BANNED_KEYWORDS not found")
+
+
+def legacy_find(keywords, text):
+    for keyword in keywords:
+        if re.search(r'\b' + re.escape(keyword) + r'\b', text):
+            return keyword
+    return None
+
+
+def make_article(words, inject=None):
+    vocab = ("the telescope observed distant galaxy light years across space while scientists "
+             "measured volcanic activity beneath ocean floor ecosystems coral reef wetlands habitat "
+             "species migration climate aurora essex sextant warden gunnel").split()
+    rng = random.Random(words)
+    tokens = [rng.choice(vocab) for _ in range(words)]
+    if inject:
+        tokens[int(words * 0.8)] = inject
+    return " ".join(tokens).lower()
+
+
+def main():
+    keywords = load_banned_keywords()
+    matcher = compile_keywords(keywords)
+
+    print(f"{'case':<28}{'legacy (ms)':>14}{'compiled (ms)':>16}{'speedup':>10}")
+    for words in (600, 1500, 3000):
+        for label, inject in (("clean", None), ("hit 'white house'", "white house")):
+            text = make_article(words, inject)
+            assert legacy_find(keywords, text) == find_keyword(matcher, text)
+
+            n = 200
+            legacy = timeit.timeit(lambda: legacy_find(keywords, text), number=n) / n * 1000
+            compiled = timeit.timeit(lambda: find_keyword(matcher, text), number=n) / n * 1000
+            print(f"{f'{words} words, {label}':<28}{legacy:>14.3f}{compiled:>16.3f}{legacy / compiled:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
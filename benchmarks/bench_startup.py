@@ -0,0 +1,80 @@
+"""
+启动开销基线检查：用 python -X importtime 测量入口模块的导入耗时，并确认重依赖没有被提前加载。
+
+  python benchmarks/bench_startup.py            # 与 startup_baseline.json 对比，超出容差则以非零状态退出
+  python benchmarks/bench_startup.py --update   # 重新记录基线
+"""
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+
+# 被测的导入语句 -> 导入后不允许出现的重依赖
+TARGETS = {
+    "import main": ["openai", "gspread", "oauth2client", "newspaper", "feedparser", "lxml"],
+    "import dispatcher": ["openai", "gspread", "oauth2client", "newspaper", "feedparser", "lxml"],
+    "import Agents.morning": ["openai", "gspread", "newspaper", "feedparser"],
+    "import Agents.afternoon": ["openai", "gspread", "newspaper", "feedparser"],
+    "import Agents.evening": ["openai", "gspread", "newspaper", "feedparser"],
+}
+TOLERANCE = 1.5   # 允许比基线慢 50%，且至少慢 30ms 才算退化 (CI 机器抖动较大)
+MIN_REGRESSION_MS = 30
+RUNS = 5
+
+
+def measure(statement):
+    """
+    返回 (最小总导入耗时毫秒, 导入过的顶层包集合)
+    """
+    best, modules = None, set()
+    for _ in range(RUNS):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                              cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{statement} failed:\n{proc.stderr[-2000:]}")
+        total = 0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+            modules.add(name.split(".")[0])
+            # 只累加顶层导入；site 是解释器自身启动 (含 .pth 钩子)，与项目代码无关
+            if not line.split("|")[2].startswith("  ") and name != "site":
+                total += int(cumulative)
+        best = total if best is None else min(best, total)
+    return best / 1000, modules
+
+
+def main():
+    update = "--update" in sys.argv
+    baseline = {}
+    if os.path.exists(BASELINE_FILE) and not update:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    failed = False
+    results = {}
+    print(f"{'statement':<28}{'import ms':>11}{'baseline':>11}  heavy modules loaded")
+    for statement, forbidden in TARGETS.items():
+        ms, modules = measure(statement)
+        results[statement] = round(ms, 1)
+        heavy = sorted(set(forbidden) & modules)
+        base = baseline.get(statement)
+        too_slow = base is not None and ms > base * TOLERANCE and ms - base > MIN_REGRESSION_MS
+        failed = failed or bool(heavy) or too_slow
+        print(f"{statement:<28}{ms:>11.1f}{(base if base is not None else '-'):>11}  "
+              f"{', '.join(heavy) or '-'}{'  ⚠️ slower than baseline' if too_slow else ''}")
+
+    if update:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {BASELINE_FILE}")
+    elif failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+结构化输出的收益：模型输出整份 HTML (旧做法) vs 只输出 JSON、本地渲染 (services/render.py)。
+
+用与近期真实简报同等篇幅的合成内容构造三份简报的 JSON，渲染出完全相同的邮件 HTML，
+再让 benchmarks/standins.py 的假 DeepSeek 分别把 HTML 和 JSON 流式输出一遍，
+通过 services/llm.generate() 的真实流式代码路径实测耗时 (首 token 延迟和输出速度可调)：
+旧做法每份简报一次调用输出整份 HTML；新做法和各 Agent 一样并发发出每个分块的 JSON 调用。
+输出 token 数由替身按 DeepSeek 官方的经验比例估算 (1 个英文字符 ≈ 0.3 token，1 个中文字符 ≈ 0.6 token)。
+各份简报的两种做法同时测量 (替身对每条流独立限速)，整个基准只需要跑最慢那一条的时间。
+
+用法: python benchmarks/bench_structured_output.py [--ttft 2.0] [--tps 100]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from services import llm
+from services.render import (validate_stories, validate_ielts, validate_reading_blocks,
+                             render_morning, render_ielts, render_evening)
+from benchmarks.standins import ContentHandler, ContentServer
+
+SECTIONS = [
+    {"key": "market", "title": "💵 Market & Economy", "color": "#2c5282"},
+    {"key": "technology", "title": "🚀 Technology", "color": "#2b6cb0"},
+    {"key": "entertainment", "title": "🎬 Entertainment", "color": "#3182ce"},
+    {"key": "culture", "title": "🎨 Culture", "color": "#4299e1"},
+]
+
+EN_SENTENCE = "Central banks signalled a cautious [[pivot]] as inflation showed signs of [[tapering off]] across major economies. "
+ZH_SENTENCE = "各国央行在主要经济体通胀出现放缓迹象之际，释放出谨慎转向的信号。"
+ARTICLE_SENTENCE = "The telescope captured a faint glow from a galaxy whose light began its {{journey|旅程}} billions of years ago. "
+
+
+def morning():
+    story = {
+        "en": EN_SENTENCE * 3,
+        "zh": ZH_SENTENCE * 3,
+        "terms": [{"term": t, "meaning": "转向；政策调整", "example": "The firm decided to pivot to AI."}
+                  for t in ("pivot", "tapering off", "signalled")],
+    }
+    payloads = [{"stories": [story] * 3} for _ in SECTIONS]
+    html = render_morning("Sunday, October 18, 2026", [(s, validate_stories(p)) for s, p in zip(SECTIONS, payloads)])
+    return payloads, html
+
+
+def afternoon():
+    payload = {
+        "part2_title": "Describe a friend who you think is a good leader.",
+        "part2_points": ["You should say: who this person is", "how you knew this person",
+                         "what leadership qualities this person has", "and explain why you think this person is a good leader"],
+        "collocations": [{"en": "strike up a friendship", "zh": "结交朋友", "example": "We struck up a friendship at university."}] * 12,
+        "thinking": [{"angle": "个人层面 vs 社会层面",
+                      "analysis": "领导力既体现在个人魅力上，也依赖制度环境的支持，两者相辅相成。" * 2,
+                      "express": "Leadership is not merely {{innate|天生的}} charisma; it is {{nurtured|培养}} by the environment. " * 2}] * 6,
+        "sample_answer": "I'd {{argue|认为}} that leadership can be learned through experience and reflection. " * 8,
+        "examiner_note": "Clear position, well-developed reasoning and a good range of collocations.",
+    }
+    html = render_ielts(validate_ielts(payload), "Leadership", ["Can leadership be learned?", "Q2?", "Q3?"], "2026.10.18")
+    return [payload], html
+
+
+def evening():
+    # 约 2000 词的文章，切成 6 个片段，每个片段 2 个阅读块
+    block = {"paragraphs": [ARTICLE_SENTENCE * 9] * 2,
+             "grammar": {"sentence": ARTICLE_SENTENCE.strip(), "analysis": "whose 引导定语从句，修饰 galaxy。"}}
+    payloads = [{"blocks": [block, dict(block, grammar=None)]} for _ in range(6)]
+    article = {"title": "Webb Spots a Galaxy at Cosmic Dawn", "author": "NASA", "link": "https://www.nasa.gov/"}
+    blocks = [b for p in payloads for b in validate_reading_blocks(p)]
+    return payloads, render_evening(article, blocks, "Every photon carries a story older than our planet.")
+
+
+def stream(label):
+    """
+    让替身流式输出 label 对应的文本 (见 main 里的 replies)，返回 (耗时秒数, 输出 token 数)
+    """
+    start = time.monotonic()
+    llm.generate([{"role": "user", "content": label}], label=label, hedge=False, budget=None, retries=0,
+                 extra_headers={"X-Bench-Reply": label})
+    record = next(r for r in reversed(llm.call_stats) if r["label"] == label)
+    return time.monotonic() - start, record["completion_tokens"]
+
+
+def measure(name, payloads):
+    # 旧做法：一次调用输出整份 HTML
+    html_seconds, html_tokens = stream(f"{name}/html")
+    # 新做法：每个分块一次 JSON 调用，并发发出
+    with ThreadPoolExecutor(max_workers=len(payloads)) as pool:
+        start = time.monotonic()
+        parts = list(pool.map(lambda k: stream(f"{name}/json-{k}"), range(len(payloads))))
+        json_seconds = time.monotonic() - start
+    return name, html_tokens, html_seconds, sum(t for _, t in parts), len(parts), json_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结构化输出 vs 整份 HTML：对着假 DeepSeek 实测生成耗时")
+    parser.add_argument("--ttft", type=float, default=2.0, help="假模型首 token 延迟 (秒)")
+    parser.add_argument("--tps", type=float, default=100.0, help="假模型输出速度 (tokens/s，每条流独立)")
+    args = parser.parse_args()
+
+    # 每个请求按 X-Bench-Reply 头 (即 label) 取回对应的文本
+    briefs = {name: build() for name, build in (("morning", morning), ("afternoon", afternoon), ("evening", evening))}
+    replies = {}
+    for name, (payloads, html) in briefs.items():
+        replies[f"{name}/html"] = html
+        replies.update({f"{name}/json-{k}": json.dumps(p, ensure_ascii=False) for k, p in enumerate(payloads)})
+
+    class ReplyHandler(ContentHandler):
+        llm_ttft, llm_tps = args.ttft, args.tps
+
+        def do_POST(self):
+            self.fixed_reply = replies[self.headers.get("X-Bench-Reply")]
+            super().do_POST()
+
+    server = ContentServer(("127.0.0.1", 0), ReplyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update(DEEPSEEK_BASE_URL=f"http://127.0.0.1:{server.server_address[1]}/v1", DEEPSEEK_API_KEY="bench",
+                      NO_PROXY="127.0.0.1,localhost", no_proxy="127.0.0.1,localhost")
+    print(f"fake DeepSeek: first token {args.ttft:.1f}s, {args.tps:.0f} output tokens/s per stream")
+    with tempfile.TemporaryDirectory(prefix="bench-llm-") as tmp:
+        # 耗时历史写到临时目录，不碰仓库里的 .llm_latency.json
+        llm.LATENCY_HISTORY_FILE = os.path.join(tmp, ".llm_latency.json")
+        with ThreadPoolExecutor(max_workers=len(briefs)) as pool:
+            rows = list(pool.map(lambda item: measure(item[0], item[1][0]), briefs.items()))
+
+    print(f"\n{'brief':<12}{'HTML tokens':>13}{'HTML gen':>11}{'JSON tokens':>13}{'calls':>7}{'JSON gen':>11}{'saved':>8}")
+    for name, html_tokens, html_seconds, json_tokens, calls, json_seconds in rows:
+        print(f"{name:<12}{html_tokens:>13}{html_seconds:>10.1f}s{json_tokens:>13}{calls:>7}{json_seconds:>10.1f}s"
+              f"{1 - json_seconds / html_seconds:>8.0%}")
+    print("(tokens are the stand-in's estimate; times are measured through services.llm.generate)")
+
+
+if __name__ == "__main__":
+    main()
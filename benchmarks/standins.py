@@ -0,0 +1,475 @@
+"""
+端到端基准用的本地替身：不需要 DeepSeek / Google Sheets / 163 邮箱账号。
+
+- ContentServer    本地 HTTP 服务：合成的 RSS 源 (支持 ETag / 304)、文章页面，以及 OpenAI 兼容的
+                   /v1/chat/completions 流式接口 (可配置首 token 延迟和输出速度)
+- FakeGspread      内存里的 gspread 替身 (Check / Users / 归档表)，每次 API 调用按延迟 + 载荷大小计时
+- SinkServer       最小可用的 SMTP 接收端 (bench_delivery.py 也用它)
+"""
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import datetime
+import threading
+import socketserver
+from email.utils import format_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# ================= SMTP 接收端 =================
+class SinkHandler(socketserver.StreamRequestHandler):
+    """
+    最小可用的 SMTP 接收端：应答所有命令，收完 DATA 后按设定延迟再回 250
+    """
+    latency = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.strip().upper()
+            if cmd.startswith(b"EHLO") or cmd.startswith(b"HELO"):
+                self.reply("250-sink")
+                self.reply("250-AUTH PLAIN")
+                self.reply("250 8BITMIME")
+            elif cmd.startswith(b"AUTH"):
+                self.reply("235 accepted")
+            elif cmd == b"DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                time.sleep(self.latency)
+                with SinkHandler.lock:
+                    SinkHandler.received += 1
+                self.reply("250 queued")
+            elif cmd == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# ================= 合成内容 =================
+# 只用中性的科普 / 商业词汇，保证能通过晚报的违禁词过滤
+WORDS = ("telescope galaxy ocean forest river mountain glacier coral reef satellite orbit comet "
+         "nebula volcano canyon meadow harbor lighthouse market startup design gallery museum "
+         "orchestra festival library garden bridge island harvest season morning evening signal "
+         "pattern research discovery measure gentle bright quiet ancient modern distant careful "
+         "remarkable steady patient curious vivid subtle").split()
+
+
+# newspaper3k 靠停用词密度识别正文，纯随机词串会被当成噪音丢掉，所以句子里穿插虚词
+GLUE = "the of and in to is was that with for on as it by from at which their".split()
+
+
+def sentence(rng, n=18):
+    words = [rng.choice(WORDS) if i % 2 else rng.choice(GLUE) for i in range(n)]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng, sentences=5):
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+
+class Corpus:
+    """
+    feeds 个 RSS 源，每个 entries 条；不同源之间有一部分相同的新闻 (用来触发跨源去重)
+    """
+    def __init__(self, feeds, entries=10, article_paragraphs=14, seed=2026):
+        rng = random.Random(seed)
+        self.feeds = feeds
+        self.stories = [(sentence(rng, 8)[:-1], paragraph(rng, 3)) for _ in range(max(feeds * entries // 2, 1))]
+        self.articles = {}
+        self.feed_items = {}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for f in range(feeds):
+            items = []
+            for e in range(entries):
+                title, summary = self.stories[rng.randrange(len(self.stories))] if rng.random() < 0.3 \
+                    else (sentence(rng, 8)[:-1], paragraph(rng, 3))
+                slug = f"{f}-{e}"
+                self.articles[slug] = (title, [paragraph(rng) for _ in range(article_paragraphs)])
+                items.append((title, summary, slug, now - datetime.timedelta(hours=e + 1)))
+            self.feed_items[f] = items
+
+    def rss(self, base_url, f):
+        items = "".join(f"""
+    <item>
+      <title>{title}</title>
+      <link>{base_url}/article/{slug}.html</link>
+      <description><![CDATA[<p>{summary}</p><p>The post {title} appeared first on Bench News.</p>]]></description>
+      <author>bench@example.com (Bench Writer)</author>
+      <pubDate>{format_datetime(published)}</pubDate>
+    </item>""" for title, summary, slug, published in self.feed_items[f])
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Bench Feed {f}</title><link>{base_url}/</link>
+  <description>Synthetic feed {f}</description>{items}
+</channel></rss>"""
+
+    def article(self, slug):
+        title, paragraphs = self.articles[slug]
+        body = "".join(f"<p>{p}</p>\n" for p in paragraphs)
+        return f"""<!DOCTYPE html><html><head><title>{title}</title>
+<meta name="author" content="Bench Writer"><meta property="og:title" content="{title}"></head>
+<body><nav>Home | Science | Nature</nav><article><h1>{title}</h1>{body}</article>
+<footer>Bench News</footer></body></html>"""
+
+
+# ================= 假的 DeepSeek (OpenAI 兼容) =================
+def _fake_reply(messages, rng):
+    """
+    按 prompt 的类型返回结构合法的 JSON (见 Agents/*.py 和 services/render.py)
+    """
+    prompt = next((m["content"] for m in messages if m["role"] == "user"), "")
+
+    def story():
+        a, b = rng.sample(WORDS, 2)
+        return {"en": f"{sentence(rng)} The [[{a}]] and the [[{b}]] moved together. {sentence(rng)}",
+                "zh": "这是一段用于基准测试的中文翻译，长度与真实简报大致相当。" * 2,
+                "terms": [{"term": a, "meaning": "释义", "example": sentence(rng, 8)},
+                          {"term": b, "meaning": "释义", "example": sentence(rng, 8)}]}
+
+    if "Golden Quote" in prompt:
+        return sentence(rng, 14)
+    if '"market": {"stories"' in prompt:
+        return json.dumps({k: {"stories": [story() for _ in range(3)]}
+                           for k in ("market", "technology", "entertainment", "culture")}, ensure_ascii=False)
+    if '{"stories"' in prompt:
+        return json.dumps({"stories": [story() for _ in range(3)]}, ensure_ascii=False)
+    if "part2_title" in prompt:
+        return json.dumps({
+            "part2_title": "Describe a place you would like to visit.",
+            "part2_points": ["You should say: where it is", "how you know it", "what you would do there",
+                             "and explain why you would like to visit it"],
+            "collocations": [{"en": f"{rng.choice(WORDS)} {rng.choice(WORDS)}", "zh": "中文含义",
+                              "example": sentence(rng, 10)} for _ in range(12)],
+            "thinking": [{"angle": "个人层面 vs 社会层面", "analysis": "逻辑分析。" * 12,
+                          "express": f"{sentence(rng)} It is {{{{{rng.choice(WORDS)}|释义}}}} indeed."} for _ in range(6)],
+            "sample_answer": " ".join(sentence(rng) for _ in range(8)) + " I {{reckon|认为}} so.",
+            "examiner_note": sentence(rng, 12),
+        }, ensure_ascii=False)
+    if '"blocks"' in prompt:
+        source = prompt.split("【片段内容】：", 1)[-1].split("【处理要求】", 1)[0]
+        paragraphs = [p.strip() for p in source.split("\n\n") if p.strip()]
+        glossed = [re.sub(r"\b(remarkable|ancient|telescope|glacier)\b", r"{{\1|释义}}", p, count=2) for p in paragraphs]
+        blocks = [{"paragraphs": glossed[i:i + 2],
+                   "grammar": {"sentence": sentence(rng), "analysis": "定语从句修饰主语。"} if i % 4 == 0 else None}
+                  for i in range(0, len(glossed), 2)]
+        return json.dumps({"blocks": blocks}, ensure_ascii=False)
+    return "OK"
+
+
+def estimate_tokens(text):
+    """
+    按 DeepSeek 官方的经验比例估算 token 数：1 个英文字符 ≈ 0.3 token，1 个中文字符 ≈ 0.6 token
+    """
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿" or "　" <= ch <= "〿" or "＀" <= ch <= "￯")
+    return round((len(text) - cjk) * 0.3 + cjk * 0.6)
+
+
+def _token_chunks(text, tokens_per_chunk=8):
+    """
+    把回复切成每块约 tokens_per_chunk 个 token (中文字符按更多 token 计)
+    """
+    start, weight = 0, 0.0
+    for k, ch in enumerate(text):
+        weight += 0.6 if "一" <= ch <= "鿿" or "　" <= ch <= "〿" or "＀" <= ch <= "￯" else 0.3
+        if weight >= tokens_per_chunk:
+            yield text[start:k + 1]
+            start, weight = k + 1, 0.0
+    if start < len(text):
+        yield text[start:]
+
+
+def _chunk(model, delta=None, usage=None):
+    body = {"id": "bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": None}]}
+    if usage:
+        body["usage"] = usage
+    return f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class ContentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    corpus = None
+    http_latency = 0.0     # RSS / 文章页面的服务器延迟 (秒)
+    llm_ttft = 1.0         # 假模型的首 token 延迟 (期间持续输出 reasoning_content)
+    llm_tps = 200.0        # 假模型的输出速度 (tokens/s)
+    fixed_reply = None     # 设置后所有对话请求都返回这段文本 (基准里指定模型要输出的内容)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.http_latency)
+        base_url = f"http://{self.headers.get('Host')}"
+        path = self.path.split("?", 1)[0]
+        m = re.match(r"^/rss/(\d+)\.xml$", path)
+        if m and int(m.group(1)) < self.corpus.feeds:
+            body = self.corpus.rss(base_url, int(m.group(1))).encode("utf-8")
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            return self._send(200, body, "application/rss+xml; charset=utf-8", {"ETag": etag})
+        m = re.match(r"^/article/([\d-]+)\.html$", path)
+        if m and m.group(1) in self.corpus.articles:
+            return self._send(200, self.corpus.article(m.group(1)).encode("utf-8"))
+        self._send(404, b"not found")
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, b"not found")
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        rng = random.Random(hashlib.sha1(json.dumps(request["messages"]).encode("utf-8")).hexdigest())
+        text = self.fixed_reply if self.fixed_reply is not None else _fake_reply(request["messages"], rng)
+        model = request.get("model", "deepseek-reasoner")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            # 思考阶段：每 0.5s 一块 reasoning_content，模拟 reasoner
+            deadline = time.monotonic() + self.llm_ttft
+            while time.monotonic() < deadline:
+                write(_chunk(model, {"role": "assistant", "content": None, "reasoning_content": "..."}))
+                time.sleep(min(0.5, max(0, deadline - time.monotonic())))
+            # 输出阶段：每块约 8 个 token，按 llm_tps 限速 (按目标时间推进，不累积 sleep 误差)
+            emit_at = time.monotonic()
+            for piece in _token_chunks(text):
+                write(_chunk(model, {"content": piece}))
+                emit_at += estimate_tokens(piece) / self.llm_tps
+                time.sleep(max(0, emit_at - time.monotonic()))
+            prompt_tokens = sum(estimate_tokens(m["content"]) for m in request["messages"])
+            completion_tokens = estimate_tokens(text)
+            write(_chunk(model, usage={"prompt_tokens": prompt_tokens,
+                                       "completion_tokens": completion_tokens,
+                                       "total_tokens": prompt_tokens + completion_tokens,
+                                       "prompt_cache_hit_tokens": 0}))
+            write(b"data: [DONE]\n\n")
+            write(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # 客户端取消了 (对冲请求输掉 / 超时)
+
+
+class ContentServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开 (晚报选中文章后丢弃其余下载、对冲请求被取消) 是正常情况
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+# ================= gspread 替身 =================
+def _col(letter):
+    return ord(letter) - ord("A")
+
+
+def _parse_range(a1):
+    """
+    "A2:B" / "E2:E" / "C5:D5" / "E7" -> (首列, 末列, 首行, 末行或 None)，行列都是 0-based
+    """
+    m = re.match(r"^([A-Z])(\d+)(?::([A-Z])(\d*))?$", a1)
+    first_col, first_row = _col(m.group(1)), int(m.group(2)) - 1
+    last_col = _col(m.group(3)) if m.group(3) else first_col
+    last_row = (int(m.group(4)) - 1 if m.group(4) else None) if m.group(3) else first_row
+    return first_col, last_col, first_row, last_row
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.rows = rows or []
+
+    def _cost(self, payload):
+        self.spreadsheet.client.charge(payload)
+
+    def _read(self, a1):
+        first_col, last_col, first_row, last_row = _parse_range(a1)
+        end = len(self.rows) if last_row is None else min(last_row + 1, len(self.rows))
+        values = [row[first_col:last_col + 1] for row in self.rows[first_row:end]]
+        # 和真实 API 一样，去掉末尾的空单元格 / 空行
+        values = [[str(v) for v in row] for row in values]
+        while values and not any(values[-1]):
+            values.pop()
+        return values
+
+    def batch_get(self, ranges):
+        result = [self._read(r) for r in ranges]
+        self._cost(result)
+        return result
+
+    def get_all_values(self):
+        result = [[str(v) for v in row] for row in self.rows]
+        self._cost(result)
+        return result
+
+    def _write(self, a1, values):
+        first_col, _, first_row, _ = _parse_range(a1)
+        for i, row in enumerate(values):
+            while len(self.rows) <= first_row + i:
+                self.rows.append([])
+            target = self.rows[first_row + i]
+            while len(target) < first_col + len(row):
+                target.append("")
+            target[first_col:first_col + len(row)] = row
+
+    def batch_update(self, data):
+        self._cost(data)
+        with self.spreadsheet.lock:
+            for item in data:
+                self._write(item["range"], item["values"])
+
+    def update(self, range_name, values):
+        self._cost(values)
+        with self.spreadsheet.lock:
+            self._write(range_name, values)
+
+    def append_rows(self, values, value_input_option=None):
+        self._cost(values)
+        with self.spreadsheet.lock:
+            self.rows.extend([list(row) for row in values])
+
+
+class FakeSpreadsheet:
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.sheets = {}
+
+    def add_worksheet(self, title, rows=1, cols=5):
+        self.client.charge(title)
+        sheet = FakeWorksheet(self, len(self.sheets), title)
+        self.sheets[title] = sheet
+        return sheet
+
+    def worksheet(self, title):
+        import gspread
+        self.client.charge(title)
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def batch_update(self, body):
+        self.client.charge(body)
+        by_id = {sheet.id: sheet for sheet in self.sheets.values()}
+        with self.lock:
+            for request in body["requests"]:
+                if "insertDimension" in request:
+                    r = request["insertDimension"]["range"]
+                    sheet = by_id[r["sheetId"]]
+                    for _ in range(r["endIndex"] - r["startIndex"]):
+                        sheet.rows.insert(r["startIndex"], [])
+                elif "deleteDimension" in request:
+                    r = request["deleteDimension"]["range"]
+                    del by_id[r["sheetId"]].rows[r["startIndex"]:r["endIndex"]]
+                elif "updateCells" in request:
+                    u = request["updateCells"]
+                    sheet = by_id[u["start"]["sheetId"]]
+                    for i, row in enumerate(u["rows"]):
+                        values = [next(iter(cell["userEnteredValue"].values())) for cell in row["values"]]
+                        sheet._write(f"{chr(ord('A') + u['start']['columnIndex'])}{u['start']['rowIndex'] + i + 1}", [values])
+
+
+class FakeGspread:
+    """
+    替代 gspread.authorize() 返回的客户端。
+    每次 API 调用耗时 = latency + 载荷字节数 / bandwidth，近似真实 Sheets API 的网络开销。
+    """
+    def __init__(self, latency=0.15, bandwidth=5 * 1024 * 1024):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.spreadsheet = FakeSpreadsheet(self)
+        self.calls = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def charge(self, payload):
+        size = len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+        time.sleep(self.latency + size / self.bandwidth)
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+    def seed(self, check_rows, users):
+        """
+        重建 Check / Users 表 (每轮基准前调用，保证每轮起点一样)
+        """
+        header = ["Date", "Task", "Subject", "Content", "Status"]
+        self.spreadsheet.sheets.clear()
+        self.spreadsheet.sheets["Check"] = FakeWorksheet(self.spreadsheet, 0, "Check", [header] + [list(r) for r in check_rows])
+        self.spreadsheet.sheets["Users"] = FakeWorksheet(self.spreadsheet, 1, "Users",
+                                                         [["Email", "Name", "Start", "Expiry"]] + [list(u) for u in users])
+
+    def save(self, path):
+        """
+        表格内容落盘：main.py 和 dispatcher.py 在不同的进程里跑，靠这个文件共享同一份"表格"
+        """
+        state = [{"id": s.id, "title": s.title, "rows": s.rows} for s in self.spreadsheet.sheets.values()]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    def load(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.spreadsheet.sheets = {s["title"]: FakeWorksheet(self.spreadsheet, s["id"], s["title"], s["rows"]) for s in state}
+        return self
+
+
+def synthetic_check_rows(count, today=None, reject=0, seed=7):
+    """
+    count 行历史简报 (每天早 / 午 / 晚三行，新的在上)，状态大多是 Sent；最新的 reject 行标成 Reject
+    """
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    sizes = {"morning": 24000, "afternoon": 11000, "evening": 38000}
+    rows = []
+    for k in range(count):
+        task = ("evening", "afternoon", "morning")[k % 3]
+        date_str = (today - datetime.timedelta(days=k // 3 + 1)).strftime("%Y-%m-%d")
+        html = "<div style=\"color: #333;\">" + "x" * int(sizes[task] * rng.uniform(0.8, 1.2)) + "</div>"
+        status = "Reject" if k < reject else rng.choice(["Sent"] * 9 + ["Regenerated"])
+        rows.append([date_str, task, f"{task.title()} Brief: {date_str}", html, status])
+    return rows
+
+
+def synthetic_users(count):
+    expiry = (datetime.date.today() + datetime.timedelta(days=365)).strftime("%Y-%m-%d")
+    return [[f"user{i}@example.com", f"User {i}", "2026-01-01", expiry] for i in range(count)]
@@ -1,9 +1,85 @@
 import argparse
-import subprocess
-import datetime
-from services.sheets import get_client, SHEET_ID, get_active_users
-from services.mailer import send_email
+import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from services.sheets import get_worksheet, get_active_users, read_check_status, read_check_cells, StatusBatch, archive_check_rows, ARCHIVE_AFTER_DAYS, FAILED_COL
+from services.mailer import deliver
+from services.telemetry import run, span, traced, profiling
 
+# monitor 模式下最多同时重写几个任务 (每个任务都是一次很慢的 reasoner 调用)
+REGEN_CONCURRENCY = 3
+AGENT_TASKS = ['morning', 'afternoon', 'evening']
+# 部分收件人没送达的行标成 Retry，之后的发送只补发给他们；同一行最多群发这么多次 (含第一次)
+SEND_STATUSES = ["Approved", "Pending", "Retry"]
+MAX_SEND_ATTEMPTS = 3
+
+def parse_retry(raw):
+    """
+    F 列的未送达名单: {"recipients": [...], "attempts": 已群发次数}，读不出来返回 None
+    """
+    try:
+        retry = json.loads(raw)
+        return retry if isinstance(retry, dict) and isinstance(retry.get("recipients"), list) else None
+    except (TypeError, ValueError):
+        return None
+
+def regenerate_task_rows(task, rows):
+    """
+    在当前进程内依次重写同一任务的若干被拒绝行 (同一个 Agent 不并发，避免抢同一份进度文件)。
+    rows: [(行号, (日期, 任务, 标题, 状态)), ...]
+    返回 {行号: None (成功) 或 错误信息}
+    """
+    results = {}
+    if task not in AGENT_TASKS:
+        return {r: f"未知任务类型: {task}" for r, _ in rows}
+    try:
+        agent = importlib.import_module(f"Agents.{task}")
+    except Exception as e:
+        return {r: f"无法加载 Agent: {e}" for r, _ in rows}
+
+    for row_number, identity in rows:
+        try:
+            # 旧行的 Regenerated 标记和新行插入由 push_to_sheets 在同一次写入完成，
+            # 所以只有新行真正写进表格后，旧行才会被标记；写入前按 identity 重新定位旧行 (行号可能已经变了)
+            # 注意：这里可能生成的是"今天"的日期，如果介意日期问题，后续需优化
+            if agent.run(status_updates=[(row_number, "Regenerated", identity)]):
+                results[row_number] = None
+            else:
+                results[row_number] = "生成或写入表格失败"
+        except Exception as e:
+            results[row_number] = str(e)
+    return results
+
+def regenerate_rows(targets, identities, max_workers=REGEN_CONCURRENCY):
+    """
+    monitor 模式：直接调用各 Agent 的 run()，不再为每一行启动一个 main.py 子进程。
+    不同任务并发重写 (最多 max_workers 个)，逐行报告结果。
+    identities: {行号: (日期, 任务, 标题, 状态)}，扫描时这一行的内容
+    """
+    by_task = {}
+    for row_number, task in targets:
+        by_task.setdefault(task, []).append((row_number, identities[row_number]))
+    if not by_task:
+        return {}
+
+    print(f"🔄 正在并发重生成 {len(targets)} 行 (任务: {', '.join(by_task)})...")
+    results = {}
+    # 不把调度员的 run 带进线程：每次 Agent.run() 各自记一条运行记录
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(regenerate_task_rows, task, rows): task for task, rows in by_task.items()}
+        for future in as_completed(futures):
+            results.update(future.result())
+
+    for row_number, task in targets:
+        error = results.get(row_number)
+        if error:
+            print(f"❌ 第 {row_number} 行 ({task}) 重生成失败: {error}")
+        else:
+            print(f"✅ 第 {row_number} 行 ({task}) 重写完成！请检查邮箱预览。")
+    return results
+
+@traced("check_and_dispatch")
 def check_and_dispatch(mode, target_task=None):
     """
     mode: 'send' (只负责发送 Pending 的特定任务) 或 'monitor' (只负责重写 Reject 的任务)
@@ -11,73 +87,129 @@ def check_and_dispatch(mode, target_task=None):
     """
     print(f"🔎 [调度员] 启动模式: {mode.upper()}, 目标任务: {target_task if target_task else 'ALL'}")
     
-    client = get_client()
-    if not client: return
-    
     try:
-        sheet = client.open_by_key(SHEET_ID).worksheet("Check")
-        rows = sheet.get_all_values()
+        with span("connect"):
+            sheet = get_worksheet("Check")
+        if not sheet: return
+        
+        # 只读 Date/Task/Status 三列；D 列存着每篇简报的完整 HTML，整表读取会越来越大
+        with span("read_status"):
+            status_rows = read_check_status()
         
         # 获取用户 (仅在发送模式下需要，监控模式不需要发给用户，只需要发预览给自己)
         recipients = []
         if mode == 'send':
-            recipients = get_active_users()
+            with span("get_users"):
+                recipients = get_active_users()
             if not recipients:
                 print("⚠️ 无有效订阅用户，跳过发送。")
                 return
 
-        # 遍历表格 (从最新的一行开始往回看可能更高效，这里保持顺序遍历)
-        # 注意：我们只处理"今天"或"明天"的任务？其实只要状态对就行。
-        for i in range(1, len(rows)):
-            row = rows[i]
-            if not row or len(row) < 5: continue
-            
-            # 数据列: 0:Date, 1:Task, 2:Subject, 3:Content, 4:Status
-            row_task = row[1].lower()
-            subject = row[2]
-            html_content = row[3]
-            status = row[4].strip()
-            
-            # ================= 模式 1: 定点发送 (Send) =================
-            if mode == 'send' and target_task:
-                # 只有当 任务类型匹配 且 状态是 Approved/Pending 时才发
-                if row_task == target_task and status in ["Approved", "Pending"]:
+        # 先根据状态挑出需要处理的行，再只为这些行读取 Subject / Content
+        # 数据列: 0:Date, 1:Task, 2:Subject, 3:Content, 4:Status
+        if mode == 'send' and target_task:
+            # 只有当 任务类型匹配 且 状态是 Approved/Pending (或待补发的 Retry) 时才发
+            targets = [(r, task.lower()) for r, _, task, status in status_rows
+                       if task.lower() == target_task and status.strip() in SEND_STATUSES]
+            with span("read_cells", rows=len(targets)):
+                cells = read_check_cells([r for r, _ in targets], "C", FAILED_COL)
+        elif mode == 'monitor':
+            # 只要状态是 Reject，不管是早中晚报，立刻重写 (只需要标题用于日志)
+            targets = [(r, task.lower()) for r, _, task, status in status_rows
+                       if task and status.strip().lower() == "reject"]
+            with span("read_cells", rows=len(targets)):
+                cells = read_check_cells([r for r, _ in targets], "C", "C")
+        else:
+            targets, cells = [], {}
+
+        # ================= 模式 2: 监控拒绝 (Monitor) =================
+        if mode == 'monitor':
+            scanned = {r: (date, task, status) for r, date, task, status in status_rows}
+            identities = {}
+            for row_number, row_task in targets:
+                date, task, status = scanned[row_number]
+                identities[row_number] = (date, task, cells[row_number][0], status)
+                print(f"\n🛑 [监控] 发现被拒绝任务: 【{cells[row_number][0]}】 (Task: {row_task})")
+            with span("regenerate", rows=len(targets)):
+                regenerate_rows(targets, identities)
+            return
+
+        # ================= 模式 1: 定点发送 (Send) =================
+        # 遍历表格 (保持从上到下的顺序)
+        # 每行群发一结束就立刻写回状态：群发一行要好几分钟，不能等到最后 (进程被杀或超时会导致整批重发)
+        with StatusBatch(sheet) as batch:
+            active = set(recipients)
+            for row_number, row_task in targets:
+                subject, html_content, status, failed_raw = cells[row_number]
+                retry = parse_retry(failed_raw) if status.strip() == "Retry" else None
+                if status.strip() == "Retry" and retry is None:
+                    # 名单读不出来就不能补发，否则已收到的人会再收到一遍
+                    print(f"\n⚠️ 第 {row_number} 行是 Retry，但 F 列的未送达名单无法解析，跳过。")
+                    continue
+                if retry:
+                    # 补发：只发给上次没送达、且仍在订阅期内的人
+                    row_recipients = [r for r in retry["recipients"] if r in active]
+                    print(f"\n🔁 [定时发送] 补发任务: 【{subject}】 (第 {retry.get('attempts', 1) + 1} 次，{len(row_recipients)} 位收件人)")
+                else:
+                    row_recipients = recipients
                     print(f"\n🚀 [定时发送] 发现待发任务: 【{subject}】")
-                    
-                    if send_email(subject, html_content, to_emails=recipients):
-                        sheet.update_cell(i+1, 5, "Sent") 
-                        print(f"✅ 发送成功，状态已更新为 Sent。")
-                    else:
-                        print(f"❌ 发送失败。")
-            
-            # ================= 模式 2: 监控拒绝 (Monitor) =================
-            elif mode == 'monitor':
-                # 只要状态是 Reject，不管是早中晚报，立刻重写
-                if status.lower() == "reject":
-                    print(f"\n🛑 [监控] 发现被拒绝任务: 【{subject}】")
-                    print(f"🔄 正在触发重生成 (Task: {row_task})...")
-                    
-                    try:
-                        # 标记旧行为 Regenerated
-                        sheet.update_cell(i+1, 5, "Regenerated")
-                        
-                        # 调用 main.py 重写 (生成新的一行 Pending + 预览邮件)
-                        # 注意：这里可能生成的是"今天"的日期，如果介意日期问题，后续需优化 main.py
-                        subprocess.run(["python", "main.py", "--task", row_task], check=True)
-                        print("✅ 重写完成！请检查邮箱预览。")
-                        
-                    except Exception as e:
-                        print(f"❌ 重生成失败: {e}")
+                
+                # 多连接并发 + 限速群发，逐个收件人返回结果
+                results = deliver(subject, html_content, row_recipients)
+                failed = [r for r, err in results.items() if err]
+                attempts = (retry.get("attempts", 1) if retry else 0) + 1
+                if failed and len(failed) == len(results) and not retry:
+                    # 一个都没发出去：保持原状态，下次整行重发
+                    print("❌ 发送失败。")
+                    continue
+
+                if not failed:
+                    batch.set(row_number, "Sent", "" if retry else None)
+                    message = "状态已更新为 Sent"
+                elif attempts >= MAX_SEND_ATTEMPTS:
+                    # 已经补发够多次，不再重试；名单留在 F 列备查
+                    batch.set(row_number, "Sent", json.dumps({"recipients": failed, "attempts": attempts}))
+                    message = f"仍有 {len(failed)} 人未送达，已达 {MAX_SEND_ATTEMPTS} 次上限，状态更新为 Sent"
+                else:
+                    # 已收到的人不会再收到；没送达的记进 F 列，下次发送时补发
+                    batch.set(row_number, "Retry", json.dumps({"recipients": failed, "attempts": attempts}))
+                    message = f"{len(failed)} 人未送达，状态更新为 Retry，下次补发"
+                try:
+                    batch.flush()
+                    print(f"✅ 发送完成，{message}。")
+                except Exception as e:
+                    # 没写进去的改动留在 batch 里，下一行发完 (或退出时) 再一起重试
+                    print(f"⚠️ 发送完成，但状态暂未写入 ({message}): {e}")
 
     except Exception as e:
         import traceback
         print(f"❌ 调度出错: {e}")
         traceback.print_exc()
 
+def archive(days):
+    """
+    mode='archive': 把已结束且超过 days 天的行搬到按月分区的归档表，保持 Check 表精简
+    """
+    print(f"🔎 [调度员] 启动模式: ARCHIVE, 保留最近 {days} 天")
+    try:
+        archive_check_rows(days)
+    except Exception as e:
+        import traceback
+        print(f"❌ 归档出错: {e}")
+        traceback.print_exc()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--mode", choices=['send', 'monitor'], required=True, help="运行模式: send(发送) 或 monitor(监控拒绝)")
-    parser.add_argument("--task", choices=['morning', 'afternoon', 'evening'], help="指定发送的任务类型 (仅在 send 模式下生效)")
+    parser.add_argument("--mode", choices=['send', 'monitor', 'archive'], required=True, help="运行模式: send(发送)、monitor(监控拒绝) 或 archive(归档旧行)")
+    parser.add_argument("--task", choices=AGENT_TASKS, help="指定发送的任务类型 (仅在 send 模式下生效)")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="归档多少天之前的已结束任务 (仅在 archive 模式下生效)")
+    parser.add_argument("--profile", action="store_true", help="输出 cProfile / tracemalloc 分析结果")
     args = parser.parse_args()
+
+    load_dotenv() # 加载你的 .env 文件
     
-    check_and_dispatch(args.mode, args.task)
+    with profiling(f"dispatcher-{args.mode}", enabled=args.profile), run(f"dispatch {args.mode}"):
+        if args.mode == 'archive':
+            archive(args.days)
+        else:
+            check_and_dispatch(args.mode, args.task)
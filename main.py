@@ -1,40 +1,183 @@
 import argparse
 import sys
-import os
+import time
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from services import llm
+from services import telemetry
+from services.telemetry import profiling
 
-# 导入我们的三个 Agent 模块
-from Agents import morning, afternoon, evening
+# 三个 Agent 模块按需导入：只跑早报就不用加载 newspaper3k 等晚报依赖
+AGENTS = ['morning', 'afternoon', 'evening']
+
+def run_task(task, status_updates=None):
+    """
+    执行单个任务，返回 (是否成功写入表格, 耗时秒数)
+    """
+    start = time.monotonic()
+    result = None
+    try:
+        agent = importlib.import_module(f"Agents.{task}")
+        result = agent.run(status_updates)
+    except Exception as e:
+        print(f"❌ [{task}] 程序运行出错: {e}")
+        # 这里以后可以加个 发送报错邮件给管理员 的功能
+    return bool(result), time.monotonic() - start
+
+def resume(tasks):
+    """
+    --resume: 把本地仓库里还没投递成功的稿件重新推到表格 / 发预览邮件，不调用模型。
+    已经过了目标日期的、被更新的稿件取代的都不再重推；推表格前先查 Check 表里是否已有同一份稿件
+    (本地标记来自 actions/cache，可能比表格旧)。
+    返回是否全部成功
+    """
+    import datetime
+    from services.artifacts import pending_artifacts, mark_artifact
+    from services.sheets import push_to_sheets, find_check_rows
+    from services.mailer import send_email
+    from services.dates import BEIJING_TZ
+
+    today = datetime.datetime.now(BEIJING_TZ).strftime("%Y-%m-%d")
+    pending = pending_artifacts(tasks, not_before=today)
+    if not pending:
+        print("✅ 没有待重推的稿件。")
+        return True
+
+    ok = True
+    for path, record in pending:
+        print(f"\n♻️ 重推稿件: {record['task']} {record['date']} ({record['sha256'][:16]})")
+        if not record.get("pushed"):
+            try:
+                existing = find_check_rows(record["date"], record["task"], record["subject"], record["html"])
+            except Exception as e:
+                print(f"❌ 无法确认表格里是否已有这份稿件，下次再试: {e}")
+                ok = False
+                continue
+            if existing:
+                print(f"✅ 表格第 {existing[0]} 行已有这份稿件，不再重复插入。")
+                mark_artifact(path, pushed=True)
+                record["pushed"] = True
+
+        if not record.get("pushed"):
+            # push_to_sheets 会同时补发预览邮件并更新稿件状态
+            # 一起重放这份稿件的状态改动 (例如把 Reject 行标成 Regenerated)，按行内容重新定位；
+            # 没带行内容的改动只有当时的行号，现在已经不可靠，不重放
+            status_updates = [(row, status, tuple(identity[0])) for row, status, *identity in record.get("status_updates") or []
+                              if identity and identity[0]]
+            ok = push_to_sheets(record["task"], record["subject"], record["html"],
+                                status_updates=status_updates, date_str=record["date"]) and ok
+        elif not record.get("emailed"):
+            # 表格已经有了，只差预览邮件
+            emailed = send_email(f"【预览 Preview】{record['subject']}", record["html"])
+            mark_artifact(path, emailed=emailed)
+            ok = emailed and ok
+    return ok
 
 def main():
     # 1. 创建参数解析器
     parser = argparse.ArgumentParser(description="AI News Agent Controller")
     
-    # 定义一个叫 --task 的参数
+    # 定义一个叫 --task 的参数 (可以传多个，或者用 all 一次跑完三个)
     parser.add_argument(
         '--task', 
         type=str, 
-        required=True, 
-        choices=['morning', 'afternoon', 'evening'],
-        help="请选择要执行的任务: morning, afternoon, 或 evening"
+        nargs='+',
+        choices=['morning', 'afternoon', 'evening', 'all'],
+        help="请选择要执行的任务: morning, afternoon, evening (可多选)，或 all"
+    )
+
+    # 手动重写某一行：新稿写入表格时，顺便把该行标记为 Regenerated (同一次写入)
+    parser.add_argument(
+        '--replace-row',
+        type=int,
+        help="被重写的 Check 表行号 (可选，只能配合单个任务使用)"
+    )
+
+    # 表格或邮件失败时，用本地保存的稿件重推，不再调用模型
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="重推本地稿件仓库中未投递成功的简报 (可配合 --task 只重推指定任务)"
+    )
+
+    # 提前生成接下来几天的午报 (雅思话题顺序固定)，之后当天和被拒重写时直接取用
+    parser.add_argument(
+        '--pregenerate',
+        action='store_true',
+        help="补齐午报的提前生成队列 (见 Agents/afternoon.py)，不推送任何内容"
+    )
+
+    # CPU / 内存热点分析 (cProfile 覆盖所有线程 + tracemalloc)，结果存到 telemetry/profiles/
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="输出 cProfile / tracemalloc 分析结果"
     )
 
     # 2. 获取用户输入的参数
     args = parser.parse_args()
+    if not args.task and not args.resume and not args.pregenerate:
+        parser.error("请指定 --task，或使用 --resume / --pregenerate")
+    load_dotenv() # 加载你的 .env 文件
 
-    print(f"🚀 收到指令，正在启动任务: {args.task} ...")
+    tasks = []
+    for task in (args.task or ['all']):
+        for t in (AGENTS if task == 'all' else [task]):
+            if t not in tasks:
+                tasks.append(t)
 
-    # 3. 根据参数调用对应的 run() 函数
-    try:
-        if args.task == 'morning':
-            morning.run()
-        elif args.task == 'afternoon':
-            afternoon.run()
-        elif args.task == 'evening':
-            evening.run()
-            
-    except Exception as e:
-        print(f"❌ 程序运行出错: {e}")
-        # 这里以后可以加个 发送报错邮件给管理员 的功能
+    if args.replace_row and len(tasks) > 1:
+        parser.error("--replace-row 只能配合单个任务使用")
+
+    if args.resume:
+        if not resume(tasks):
+            sys.exit(1)
+        return
+
+    if args.pregenerate:
+        from Agents import afternoon
+        with profiling("pregenerate", enabled=args.profile), telemetry.run("afternoon pregenerate"):
+            afternoon.refill_queue()
+        return
+
+    print(f"🚀 收到指令，正在启动任务: {', '.join(tasks)} ...")
+
+    status_updates = None
+    if args.replace_row:
+        # 记下这一行的内容，写入前 (包括之后 --resume 重推时) 按内容重新定位，行号变了也不会标错行
+        from services.sheets import read_check_cells
+        date, task, subject, _, status = read_check_cells([args.replace_row], "A", "E")[args.replace_row]
+        status_updates = [(args.replace_row, "Regenerated", (date, task, subject, status))]
+
+    # 3. 调用对应的 run() 函数
+    # 多个任务在同一进程里并发执行：共用 DeepSeek / Sheets / SMTP 客户端，
+    # 抓取和 LLM 这些等待网络的阶段互相重叠，总耗时约等于最慢的那个任务
+    # 每个 Agent.run() 各自记一条运行记录 (阶段耗时 + token)，见 services/telemetry.py
+    start = time.monotonic()
+    with profiling("main", enabled=args.profile):
+        if len(tasks) == 1:
+            results = {tasks[0]: run_task(tasks[0], status_updates)}
+        else:
+            with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+                futures = {task: pool.submit(run_task, task) for task in tasks}
+                results = {task: future.result() for task, future in futures.items()}
+
+    print("\n📊 任务汇总:")
+    for task, (ok, elapsed) in results.items():
+        print(f"  {'✅' if ok else '❌'} {task:<10} {elapsed:7.1f}s")
+    print(f"  ⏱️ 总耗时 {time.monotonic() - start:.1f}s")
+
+    llm_stats = llm.stats_summary()
+    if llm_stats:
+        print("\n🧾 LLM 调用汇总:")
+        for label, row in sorted(llm_stats.items()):
+            print(f"  {label:<22} {row['ok']}/{row['calls']} 成功  对冲 {row['hedged']}  降级 {row['fallback']}  "
+                  f"P50 {row['p50']:.1f}s  P95 {row['p95']:.1f}s")
+
+    # 任何一个任务没写入表格就以非零状态退出
+    if not all(ok for ok, _ in results.values()):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
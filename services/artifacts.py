@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import datetime
+
+# ================= 本地稿件仓库 =================
+# 生成好的简报在发往任何网络服务之前先落盘，按 (任务, 目标日期, 内容哈希) 存放：
+#   artifacts/<task>/<YYYY-MM-DD>/<sha256 前 16 位>.json
+# 表格或邮件失败时可以用 main.py --resume 直接重推，不用再花一次 reasoner 调用
+ARTIFACT_DIR = os.path.join(os.getcwd(), "artifacts")
+ARTIFACT_RETENTION_DAYS = 14   # 目标日期早于 N 天的稿件整目录删除
+MAX_ARTIFACTS_PER_DAY = 5      # 同一任务同一天最多保留几份 (多次重写时只留最新的)
+# ===============================================
+
+
+def _artifact_path(task, date_str, digest):
+    return os.path.join(ARTIFACT_DIR, task, date_str, digest[:16] + ".json")
+
+
+def _write(path, record):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def save_artifact(task, date_str, subject, html_content, status_updates=None):
+    """
+    保存一份稿件，返回它的路径。内容相同的稿件只会存一份 (内容寻址)。
+    status_updates: (可选) 和这份稿件一起写入 Check 表的状态改动 (见 push_to_sheets)，重推时一并重放
+    """
+    digest = hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+    path = _artifact_path(task, date_str, digest)
+    updates = [list(u) for u in (status_updates or [])]
+    if not os.path.exists(path):
+        _write(path, {
+            "task": task,
+            "date": date_str,
+            "subject": subject,
+            "sha256": digest,
+            "created": time.time(),
+            "pushed": False,
+            "emailed": False,
+            "status_updates": updates,
+            "html": html_content,
+        })
+        print(f"💾 [Artifacts] 已保存稿件: {os.path.relpath(path)}")
+        prune_artifacts()
+    elif updates:
+        mark_artifact(path, status_updates=updates)
+    return path
+
+
+def mark_artifact(path, **flags):
+    """
+    更新稿件的投递状态 (pushed / emailed)
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        record.update(flags)
+        _write(path, record)
+    except Exception as e:
+        print(f"⚠️ [Artifacts] 状态更新失败: {path} - {e}")
+
+
+def pending_artifacts(tasks=None, not_before=None):
+    """
+    列出还没完全投递 (表格或预览邮件失败) 的稿件，按生成时间排序。
+    跳过目标日期早于 not_before (YYYY-MM-DD) 的稿件，以及同一 (任务, 日期) 已有更新的稿件推送成功的旧稿。
+    同一 (任务, 日期) 有多份没推上表格的稿件时只返回最新的一份：旧稿标记为 superseded，
+    它们的状态改动 (例如把 Reject 行标成 Regenerated) 合并到最新那份里，重推时一起写入。
+    返回 [(path, record), ...]
+    """
+    found = []
+    if not os.path.isdir(ARTIFACT_DIR):
+        return found
+
+    records = []
+    for task in sorted(os.listdir(ARTIFACT_DIR)):
+        if tasks and task not in tasks:
+            continue
+        for root, _, files in os.walk(os.path.join(ARTIFACT_DIR, task)):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        records.append((path, json.load(f)))
+                except Exception:
+                    continue
+
+    # 每个 (任务, 日期) 最新一份已推送稿件的生成时间
+    latest_pushed = {}
+    for _, record in records:
+        if record.get("pushed"):
+            key = (record.get("task"), record.get("date"))
+            latest_pushed[key] = max(latest_pushed.get(key, 0), record.get("created", 0))
+
+    unpushed = {}
+    for path, record in records:
+        if (record.get("pushed") and record.get("emailed")) or record.get("superseded"):
+            continue
+        if not_before and record.get("date", "") < not_before:
+            continue
+        key = (record.get("task"), record.get("date"))
+        if record.get("created", 0) < latest_pushed.get(key, 0):
+            if not record.get("pushed"):
+                mark_artifact(path, superseded=True)
+            continue
+        if record.get("pushed"):
+            found.append((path, record))
+        else:
+            unpushed.setdefault(key, []).append((path, record))
+
+    for items in unpushed.values():
+        items.sort(key=lambda item: item[1].get("created", 0))
+        newest_path, newest = items[-1]
+        updates = list(newest.get("status_updates") or [])
+        for path, record in items[:-1]:
+            updates.extend(u for u in record.get("status_updates") or [] if u not in updates)
+            mark_artifact(path, superseded=True)
+        if updates != (newest.get("status_updates") or []):
+            newest["status_updates"] = updates
+            mark_artifact(newest_path, status_updates=updates)
+        found.append((newest_path, newest))
+    return sorted(found, key=lambda item: item[1].get("created", 0))
+
+
+def prune_artifacts(retention_days=ARTIFACT_RETENTION_DAYS, max_per_day=MAX_ARTIFACTS_PER_DAY):
+    """
+    保持仓库大小有界：删掉过期日期的目录，同一天只保留最新的 max_per_day 份
+    """
+    if not os.path.isdir(ARTIFACT_DIR):
+        return
+
+    cutoff = datetime.date.today() - datetime.timedelta(days=retention_days)
+    for task in os.listdir(ARTIFACT_DIR):
+        task_dir = os.path.join(ARTIFACT_DIR, task)
+        if not os.path.isdir(task_dir):
+            continue
+        for date_str in os.listdir(task_dir):
+            day_dir = os.path.join(task_dir, date_str)
+            try:
+                expired = datetime.datetime.strptime(date_str, "%Y-%m-%d").date() < cutoff
+            except ValueError:
+                continue
+            if expired:
+                shutil.rmtree(day_dir, ignore_errors=True)
+                continue
+
+            files = sorted((os.path.join(day_dir, n) for n in os.listdir(day_dir) if n.endswith(".json")),
+                           key=os.path.getmtime, reverse=True)
+            for path in files[max_per_day:]:
+                os.remove(path)
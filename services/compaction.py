@@ -0,0 +1,144 @@
+import re
+import html
+import zlib
+import random
+import hashlib
+
+# ================= 压缩配置 =================
+SUMMARY_CHARS = 300          # 去掉 HTML 之后，每条摘要保留的字符数
+NUM_PERM = 64                # MinHash 签名长度
+SHINGLE_WORDS = 2            # 以相邻两个词为一个 shingle
+DUPLICATE_THRESHOLD = 0.4    # 估计的 Jaccard 相似度超过它就视为同一条新闻
+CHARS_PER_TOKEN = 4          # 英文大约 4 个字符一个 token，仅用于估算
+SIMHASH_BITS = 64            # 全文指纹长度 (晚报文章查重用)
+SIMHASH_SHINGLE_WORDS = 3    # 全文比摘要长得多，用相邻三个词做特征更能区分不同文章
+# ===========================================
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(20260118)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_BOILERPLATE_RE = re.compile(r'(the post .+? appeared first on .+?\.|continue reading\.*|read more\.*|\[…\]|\[\.\.\.\])', re.I)
+
+
+def strip_markup(text):
+    """
+    去掉 HTML 标签、实体和常见的 RSS 尾巴 ("The post ... appeared first on ...")
+    """
+    text = _TAG_RE.sub(' ', text or '')
+    text = html.unescape(text)
+    text = _BOILERPLATE_RE.sub(' ', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def _shingles(text):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(text):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in _shingles(text)]
+    if not hashes:
+        return None
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(sig_a, sig_b):
+    if sig_a is None or sig_b is None:
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def simhash(text):
+    """
+    全文的 SimHash 指纹 (SIMHASH_BITS 位整数)：内容几乎相同的文章 (换了链接、转载、小修改) 指纹只差几位。
+    文本太短没有特征时返回 None。
+    """
+    words = _WORD_RE.findall(text.lower())
+    n = SIMHASH_SHINGLE_WORDS
+    features = {}
+    for i in range(max(len(words) - n + 1, 1 if words else 0)):
+        shingle = " ".join(words[i:i + n])
+        features[shingle] = features.get(shingle, 0) + 1
+    if not features:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in features.items():
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=SIMHASH_BITS // 8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def compact_news(items, now=None):
+    """
+    新闻压缩：清洗摘要 -> 跨源近似重复聚类 -> 每组保留一条代表 -> 按热度和时效排序。
+    items: [{"title", "source", "summary", "link", "published" (datetime 或 None)}, ...]
+    返回压缩后的 items (每条多一个 "also_in"：同一新闻出现过的其他来源)。
+    """
+    for item in items:
+        item["summary"] = strip_markup(item["summary"])[:SUMMARY_CHARS]
+        item["title"] = strip_markup(item["title"])
+        item["_sig"] = minhash(f"{item['title']} {item['summary']}")
+
+    # 1. 两两比较 MinHash 签名，用并查集合并成簇 (每天最多几十条，O(n²) 足够)
+    parent = list(range(len(items)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(items)):
+        for j in range(i + 1, len(items)):
+            if similarity(items[i]["_sig"], items[j]["_sig"]) >= DUPLICATE_THRESHOLD:
+                parent[find(j)] = find(i)
+
+    clusters = {}
+    for i, item in enumerate(items):
+        clusters.setdefault(find(i), []).append(item)
+
+    # 2. 每簇选一条代表：优先最新的，其次摘要最完整的
+    def freshness(item):
+        return item["published"].timestamp() if item.get("published") else 0
+
+    compacted = []
+    for members in clusters.values():
+        best = max(members, key=lambda it: (freshness(it), len(it["summary"])))
+        best["also_in"] = sorted({m["source"] for m in members if m["source"] != best["source"]})
+        compacted.append(best)
+
+    # 3. 排序：被越多来源报道越重要，同等情况下越新越靠前
+    compacted.sort(key=lambda it: (len(it["also_in"]), freshness(it)), reverse=True)
+
+    for item in items:
+        item.pop("_sig", None)
+    return compacted
+
+
+def format_snippets(items):
+    """
+    拼成给 LLM 的资讯池文本 (格式与原来一致)
+    """
+    snippets = []
+    for item in items:
+        source = item["source"]
+        if item.get("also_in"):
+            source += f" (另见: {', '.join(item['also_in'])})"
+        snippets.append(f"【标题】{item['title']}\n【来源】{source}\n【摘要】{item['summary']}\n【链接】{item['link']}\n")
+    return "\n\n".join(snippets)
@@ -0,0 +1,30 @@
+import datetime
+from datetime import timedelta, timezone
+
+# ================= 🇨🇳 北京时间智能日期逻辑 =================
+# 1. 强制创建一个北京时区 (UTC+8)
+BEIJING_TZ = timezone(timedelta(hours=8))
+# 2. 北京时间过了这个钟点，就认为是在"为明天备稿"
+PREPARE_TOMORROW_HOUR = 18
+# =========================================================
+
+
+def get_target_date():
+    """
+    返回这份简报对应的日期 (在调用时计算，而不是导入模块时)。
+    如果北京时间超过 18:00 (晚上6点)，系统认为这是在"为明天备稿" -> 日期 +1
+    如果北京时间没到 18:00 (比如上午补发)，系统认为这是"当日急救" -> 日期不变
+    """
+    now_in_beijing = datetime.datetime.now(BEIJING_TZ)
+    if now_in_beijing.hour >= PREPARE_TOMORROW_HOUR:
+        return now_in_beijing.date() + timedelta(days=1)
+    return now_in_beijing.date()
+
+
+def get_target_dates():
+    """
+    返回 (target_date, today_str, display_date_str)
+    today_str 格式：2026-01-20；display_date_str 格式：Tuesday, January 20, 2026
+    """
+    target_date = get_target_date()
+    return target_date, target_date.strftime("%Y-%m-%d"), target_date.strftime('%A, %B %d, %Y')
@@ -0,0 +1,197 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from services.fsutil import remove_quietly
+
+# ================= 抓取配置 =================
+FEED_TIMEOUT_SECONDS = 15    # 单个源的截止时间 (连接 + 整个下载过程)
+FEED_STALL_SECONDS = 5       # 单次 socket 读取最多等多久 (截止时间在每块数据之间检查，超出最多这么久)
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+FETCH_BUDGET_SECONDS = 45    # 所有源加起来的总预算
+MAX_FETCH_WORKERS = 8        # 并发线程上限
+USER_AGENT = "Mozilla/5.0 (compatible; DailyBriefingBot/1.0)"
+# ============================================
+
+# ================= 本地缓存配置 =================
+# 早报和晚报共用，按 URL 缓存 ETag / Last-Modified 和解析好的 entries
+CACHE_DIR = os.path.join(os.getcwd(), ".feed_cache")
+CACHE_TTL_SECONDS = 7 * 24 * 3600     # 超过 7 天没用到的缓存直接删除
+CACHE_MAX_BYTES = 20 * 1024 * 1024    # 缓存目录总大小上限 (20MB)，超出时先删最旧的
+# ===============================================
+
+_stats_lock = threading.Lock()
+cache_stats = {"hit": 0, "miss": 0, "bytes_saved": 0}
+
+
+def _cache_path(url):
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".pkl")
+
+
+def _load_cache(url):
+    path = _cache_path(url)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # 缓存文件损坏就当没有
+        return None
+
+
+def _save_cache(url, entry):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = _cache_path(url) + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f)
+        os.replace(tmp_path, _cache_path(url))
+    except Exception as e:
+        print(f"  - ⚠️ 缓存写入失败: {url} - {e}")
+
+
+def _record(kind, saved_bytes=0):
+    with _stats_lock:
+        cache_stats[kind] += 1
+        cache_stats["bytes_saved"] += saved_bytes
+
+
+def evict_cache(ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+    """
+    清理缓存目录：先按 TTL 删除过期文件，再按总大小从最旧的开始删。
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    now = time.time()
+    files = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if now - stat.st_mtime > ttl:
+            remove_quietly(path)
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        remove_quietly(path)
+        total -= size
+
+
+def _download(url, headers, deadline):
+    """
+    流式下载，按 deadline (time.monotonic()) 限制总耗时：requests 的 timeout 只管连接和单次读取，
+    一个一点点往外吐数据的源可以远远超出它。返回 (状态码, 响应头, 正文 bytes)
+    """
+    import requests
+
+    def remaining():
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError("超出截止时间")
+        return left
+
+    with requests.get(url, headers=headers, stream=True,
+                      timeout=(remaining(), min(FEED_STALL_SECONDS, remaining()))) as resp:
+        if resp.status_code == 304:
+            return resp.status_code, resp.headers, b""
+        resp.raise_for_status()
+        # read1 有多少读多少 (最多一次 socket 读取)；iter_content 会一直攒满一整块才返回，慢源永远走不到截止检查
+        read1 = getattr(resp.raw, "read1", None)   # urllib3 2.x
+        chunks = (iter(lambda: read1(DOWNLOAD_CHUNK_BYTES, decode_content=True), b"") if read1
+                  else resp.iter_content(DOWNLOAD_CHUNK_BYTES))
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            remaining()   # 超时就抛出，with 退出时关闭连接
+        return resp.status_code, resp.headers, b"".join(parts)
+
+
+def fetch_feed(url, timeout=FEED_TIMEOUT_SECONDS, deadline=None):
+    """
+    抓取并解析单个 RSS 源，返回 (feed, 耗时秒数)。
+    feedparser.parse(url) 自己不支持超时，所以先用 requests 下载再交给 feedparser 解析。
+    整个下载不超过 timeout 秒，也不超过 deadline (time.monotonic()，fetch_feeds 的总预算)。
+    """
+    import feedparser
+
+    start = time.monotonic()
+    deadline = min(start + timeout, deadline) if deadline else start + timeout
+    cached = _load_cache(url)
+
+    # 带上上次的 ETag / Last-Modified，源没更新时服务器只回一个 304
+    headers = {"User-Agent": USER_AGENT}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("modified"):
+            headers["If-Modified-Since"] = cached["modified"]
+
+    status, resp_headers, content = _download(url, headers, deadline)
+
+    if status == 304 and cached:
+        _record("hit", cached.get("size", 0))
+        os.utime(_cache_path(url))  # 刷新时间，避免被 TTL 清掉
+        return cached["feed"], time.monotonic() - start
+
+    feed = feedparser.parse(content)
+    _record("miss")
+
+    if resp_headers.get("ETag") or resp_headers.get("Last-Modified"):
+        _save_cache(url, {
+            "etag": resp_headers.get("ETag"),
+            "modified": resp_headers.get("Last-Modified"),
+            "size": len(content),
+            "feed": feed,
+        })
+    return feed, time.monotonic() - start
+
+
+def fetch_feeds(urls, timeout=FEED_TIMEOUT_SECONDS, budget=FETCH_BUDGET_SECONDS, max_workers=MAX_FETCH_WORKERS):
+    """
+    并发抓取多个 RSS 源。
+    返回列表，顺序与 urls 一致，每项为 (url, feed)；失败或超出总预算的源 feed 为 None。
+    """
+    results = {url: None for url in urls}
+    if not urls:
+        return []
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    start = time.monotonic()
+    # 每个线程都带着总预算的截止时间，到点自己结束 (shutdown 停不掉已经在跑的线程，退出解释器时还要等它们)
+    deadline = start + budget
+    futures = {pool.submit(fetch_feed, url, timeout, deadline): url for url in urls}
+
+    try:
+        done, not_done = wait(futures, timeout=budget)
+
+        for future in done:
+            url = futures[future]
+            try:
+                feed, latency = future.result()
+                results[url] = feed
+                print(f"  - ⏱️ {url} ({len(feed.entries)} 条, {latency:.2f}s)")
+            except Exception as e:
+                print(f"  - ❌ 读取失败: {url} - {e}")
+
+        for future in not_done:
+            future.cancel()
+            print(f"  - ⌛ 超出总预算 {budget}s，放弃: {futures[future]}")
+    finally:
+        # 不等待超时的线程：它们最迟在截止时间后 FEED_STALL_SECONDS 内自行结束
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    print(f"⚡️ 并发抓取完成: {len(urls)} 个源，总耗时 {time.monotonic() - start:.2f}s")
+    print(f"🗄️ 缓存命中 {cache_stats['hit']} / 未命中 {cache_stats['miss']}，节省下载 {cache_stats['bytes_saved'] / 1024:.1f} KB")
+
+    evict_cache()
+    return [(url, results[url]) for url in urls]
@@ -0,0 +1,11 @@
+import os
+
+
+def remove_quietly(path):
+    """
+    删除文件，文件不存在或删不掉都忽略 (缓存 / 队列这类删不掉也无所谓的文件)
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# ================= 历史记录 (只追加的 JSONL 日志) =================
+# 每行一条记录 {"url", "ts", ...}：新增一条只追加一行，不再整份读出来再重写 (文件每晚都会提交回 git，追加也让 diff 最小)
+# 载入时在内存里按 url 建索引，查重 O(1)；过期条目和被覆盖的旧行由后台线程压缩掉 (重写后原子替换)
+HISTORY_RETENTION_DAYS = 365   # 超过这么多天的记录淘汰 (RSS 源早就不会再出现这些文章)
+COMPACT_MIN_LINES = 200        # 日志少于这么多行时不值得压缩 (除非有过期条目)
+COMPACT_RATIO = 2              # 日志行数超过有效条目数的这么多倍就压缩
+# =================================================================
+
+# ================= URL 规范化 =================
+# 同一篇文章常见的不同写法：http/https、www、结尾斜杠、#锚点、统计参数、镜像站点
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "ref", "ref_src", "cmpid", "sr_share"}
+TRACKING_PREFIXES = ("utm_",)
+HOST_ALIASES = {
+    # 同一内容的镜像 / 旧域名 -> 统一的主机名
+    "science.nasa.gov": "nasa.gov",
+    "new.nsf.gov": "nsf.gov",
+}
+# ==============================================
+
+
+def canonical_url(url):
+    """
+    把链接规范化成查重用的形式：
+    https://www.nasa.gov/missions/x/?utm_source=rss#top  ->  https://nasa.gov/missions/x
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except (AttributeError, ValueError):
+        return url
+    if not parts.netloc:
+        return url
+
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    host = HOST_ALIASES.get(host, host)
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ))
+    return urlunsplit(("https", host, path, query, ""))
+
+
+class UrlHistory:
+    """
+    path: JSONL 日志文件
+    legacy_path: (可选) 旧格式 (整份 JSON 列表) 的文件，日志还不存在时导入一次，导入后删除
+    normalize: (可选) 索引和查重前对 url 做的规范化 (例如 canonical_url)，旧记录载入时也会按它重新索引
+    """
+    def __init__(self, path, legacy_path=None, retention_days=HISTORY_RETENTION_DAYS, normalize=None):
+        self.path = path
+        self.normalize = normalize or (lambda url: url)
+        self.retention_seconds = retention_days * 24 * 3600
+        self.entries = {}           # url -> 记录
+        self.lines = 0              # 日志里的有效行数 (含已被覆盖 / 过期的)
+        self.lock = threading.Lock()
+        self.compactor = None
+        self._needs_newline = False  # 上次写到一半被打断，最后一行没有换行
+        if legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+            self._migrate(legacy_path)
+        self._load()
+
+    def __contains__(self, url):
+        return self.normalize(url) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def records(self):
+        with self.lock:
+            return list(self.entries.values())
+
+    def _cutoff(self):
+        return time.time() - self.retention_seconds
+
+    def _migrate(self, legacy_path):
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            urls = list(dict.fromkeys(json.load(f)))
+        # 旧格式没有时间，按迁移时刻记，保留期从现在开始算
+        now = int(time.time())
+        self._rewrite([{"url": url, "ts": now} for url in urls])
+        os.remove(legacy_path)
+        print(f"🗃️ [History] 已从 {os.path.basename(legacy_path)} 迁移 {len(urls)} 条记录到 {os.path.basename(self.path)}")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        self._needs_newline = bool(content) and not content.endswith("\n")
+        lines = [line for line in content.splitlines() if line.strip()]
+        try:
+            # 快路径：整份一次解析 (比逐行 json.loads 快几倍)
+            records = json.loads("[" + ",".join(lines) + "]")
+        except ValueError:
+            # 有写到一半被打断的行：逐行解析并跳过坏行，压缩时自然丢掉
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        for record in records:
+            if isinstance(record, dict) and "url" in record:
+                self.lines += 1
+                self.entries[self.normalize(record["url"])] = record
+
+        cutoff = self._cutoff()
+        expired = [url for url, record in self.entries.items() if record.get("ts", 0) < cutoff]
+        for url in expired:
+            del self.entries[url]
+
+        if expired or (self.lines >= COMPACT_MIN_LINES and self.lines > COMPACT_RATIO * len(self.entries)):
+            # 压缩放到后台，不挡住选文章；不是守护线程，进程退出前一定会写完
+            self.compactor = threading.Thread(target=self.compact, name="history-compact")
+            self.compactor.start()
+
+    def add(self, url, **fields):
+        """
+        追加一条记录 (同一 url 再次添加时以最新的为准)
+        """
+        url = self.normalize(url)
+        record = {"url": url, "ts": int(time.time()), **fields}
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(("\n" if self._needs_newline else "") + json.dumps(record, ensure_ascii=False) + "\n")
+            self._needs_newline = False
+            self.entries[url] = record
+            self.lines += 1
+
+    def compact(self):
+        """
+        淘汰过期条目，把日志重写成每个 url 只剩最新一行
+        """
+        with self.lock:
+            cutoff = self._cutoff()
+            live = [record for record in self.entries.values() if record.get("ts", 0) >= cutoff]
+            before = self.lines
+            self.entries = {self.normalize(record["url"]): record for record in live}
+            try:
+                self._rewrite(live)
+                print(f"🗃️ [History] 压缩完成: {before} 行 → {len(live)} 行")
+            except OSError as e:
+                print(f"⚠️ [History] 压缩失败 (日志保持原样): {e}")
+
+    def _rewrite(self, records):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self.lines = len(records)
+        self._needs_newline = False
@@ -0,0 +1,37 @@
+import re
+
+
+def compile_keywords(keywords):
+    """
+    把关键词表编译成一个带单词边界的大正则，只需扫描一遍文本。
+    返回 (pattern, 优先级表)，优先级就是关键词在原列表中的下标。
+    整个正则是零宽的前瞻 (?=...)，文本的每个位置都会尝试一次 (长词不会"吃掉"里面或重叠的短词)；
+    分支按原列表顺序排列，同一位置能匹配多个关键词 (例如 "war" 和 "war crimes") 时取排在前面的那个。
+    """
+    priority = {}
+    for i, keyword in enumerate(keywords):
+        priority.setdefault(keyword.lower(), i)
+
+    alternation = "|".join(re.escape(k) for k in priority)   # dict 保持插入顺序 = 优先级顺序
+    pattern = re.compile(r'(?=\b(' + alternation + r')\b)')
+    return pattern, priority
+
+
+def find_keyword(matcher, text):
+    """
+    在 (已小写的) 文本中查找关键词。
+    命中多个时返回在原列表中排最前的那个，和逐个 re.search 的旧写法结果一致：
+    排最前的关键词出现的位置上，前瞻一定会报告它或者比它更靠前的关键词。没命中返回 None。
+    """
+    pattern, priority = matcher
+    best = None
+    for match in pattern.finditer(text):
+        rank = priority[match.group(1)]
+        if best is None or rank < best:
+            best = rank
+            if rank == 0:
+                break
+
+    if best is None:
+        return None
+    return next(k for k, i in priority.items() if i == best)  # 只在命中时执行一次
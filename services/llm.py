@@ -0,0 +1,362 @@
+import os
+import json
+import time
+import queue
+import random
+import threading
+from services import telemetry
+
+# ================= DeepSeek 配置 =================
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+# ================================================
+
+_lock = threading.Lock()
+_client = None
+
+
+def get_client():
+    """
+    进程内共享的 DeepSeek (OpenAI 兼容) 客户端，第一次使用时创建。
+    同一进程里并发跑多个 Agent 时共用同一个连接池。
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(
+                api_key=os.getenv("DEEPSEEK_API_KEY"),
+                # 可用 DEEPSEEK_BASE_URL 环境变量改连其他兼容端点 (例如 benchmarks/ 里的本地假服务)
+                base_url=os.getenv("DEEPSEEK_BASE_URL") or DEEPSEEK_BASE_URL
+            )
+        return _client
+
+
+# ================= 流式生成配置 =================
+REASONER_MODEL = "deepseek-reasoner"
+FALLBACK_MODEL = "deepseek-chat"
+FIRST_TOKEN_TIMEOUT = 120   # 发出请求后多久还没收到第一个 token (含思考过程) 就放弃
+STALL_TIMEOUT = 60          # 两个数据块之间最多允许停顿多久
+CONNECT_TIMEOUT = 10
+# ==============================================
+
+# ================= 重试 / 对冲 / 降级 =================
+MAX_RETRIES = 2             # 可重试的失败 (超时、连接中断、429、5xx、空回复) 最多重试几次
+BACKOFF_BASE = 2            # 退避基数 (秒)：第 n 次重试前随机等待 0 ~ min(BACKOFF_MAX, BACKOFF_BASE * 2^n)
+BACKOFF_MAX = 30
+HEDGE_PERCENTILE = 95       # 主请求耗时超过历史 P95 仍未完成，就再发一个相同的请求，谁先完成用谁
+HEDGE_MIN_SAMPLES = 5       # 历史样本不足时不对冲
+LATENCY_HISTORY_SIZE = 50   # 每个 (label, model) 保留最近多少次成功调用的耗时
+LATENCY_HISTORY_FILE = os.path.join(os.getcwd(), ".llm_latency.json")  # 跨运行保留 (workflow 里用 actions/cache)
+REASONER_BUDGET = 300       # reasoner 超过这么多秒还没出结果，就并行发一个 FALLBACK_MODEL 请求兜底
+# ===================================================
+
+_stats_lock = threading.Lock()
+call_stats = []  # 每次请求 (含重试、对冲、降级) 一条记录，见 _stream_once()
+call_log = []    # 每次 generate() 一条记录：最终结果、总耗时、尝试次数、是否对冲 / 降级
+_latency_history = None
+
+
+class EmptyCompletion(RuntimeError):
+    """
+    模型正常结束但没有返回任何正文
+    """
+
+
+def _watch(stream, started, state, stop, cancel, first_token_timeout, stall_timeout):
+    """
+    看门狗线程：首 token 或数据块间隔超时 (或请求被取消) 就关闭连接，让读取线程的迭代立刻结束
+    """
+    while not stop.wait(0.5):
+        now = time.monotonic()
+        if cancel.is_set():
+            state["cancelled"] = True
+        elif state["first"] is None and now - started > first_token_timeout:
+            state["timeout"] = f"{first_token_timeout}s 内没有收到首个 token"
+        elif state["first"] is not None and now - state["last"] > stall_timeout:
+            state["timeout"] = f"数据流停顿超过 {stall_timeout}s"
+        else:
+            continue
+        stream.close()
+        return
+
+
+def _stream_once(messages, label, model, kind, cancel, first_token_timeout, stall_timeout, **params):
+    """
+    发一次流式请求并逐块拼出完整回复。
+    - 首 token 超时 / 数据流停顿超时抛出 TimeoutError，空回复抛出 EmptyCompletion
+    - 记录首 token 时间 (TTFT)、总耗时、token 用量和结果，追加到 call_stats
+    """
+    import httpx
+
+    started = time.monotonic()
+    record = {"label": label, "model": model, "kind": kind, "ttft": None, "total": None,
+              "prompt_tokens": None, "completion_tokens": None, "cache_hit_tokens": None, "outcome": "error"}
+    state = {"first": None, "last": started, "timeout": None, "cancelled": False}
+    stop = threading.Event()
+    parts, usage = [], None
+    try:
+        stream = get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            # 兜底：即使看门狗没来得及启动，单次读取也不会无限等待
+            timeout=httpx.Timeout(max(first_token_timeout, stall_timeout), connect=CONNECT_TIMEOUT),
+            **params
+        )
+        threading.Thread(target=_watch, args=(stream, started, state, stop, cancel, first_token_timeout, stall_timeout),
+                         daemon=True).start()
+
+        try:
+            for chunk in stream:
+                now = time.monotonic()
+                state["last"] = now
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                # reasoner 会先输出思考过程 (reasoning_content)，同样算作"模型还活着"
+                if state["first"] is None and (delta.content or getattr(delta, "reasoning_content", None)):
+                    state["first"] = now
+                if delta.content:
+                    parts.append(delta.content)
+        except Exception as e:
+            if state["timeout"]:
+                raise TimeoutError(state["timeout"]) from e
+            raise
+        if state["timeout"]:
+            raise TimeoutError(state["timeout"])
+        if state["cancelled"]:
+            raise InterruptedError("已被更快的请求取代")
+        text = "".join(parts)
+        if not text.strip():
+            raise EmptyCompletion("模型返回为空")
+        record["outcome"] = "ok"
+        return text
+    except Exception as e:
+        record["outcome"] = "cancelled" if state["cancelled"] or cancel.is_set() else "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stop.set()
+        record.update({
+            "ttft": round(state["first"] - started, 2) if state["first"] else None,
+            "total": round(time.monotonic() - started, 2),
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "cache_hit_tokens": getattr(usage, "prompt_cache_hit_tokens", None),
+        })
+        with _stats_lock:
+            call_stats.append(record)
+        if usage is not None:
+            telemetry.record_usage(record["prompt_tokens"], record["completion_tokens"], record["cache_hit_tokens"])
+        if record["outcome"] == "ok":
+            print(f"🧾 [LLM] {label} ({model}{'' if kind == 'primary' else ', ' + kind}): 首 token {record['ttft']}s, "
+                  f"总耗时 {record['total']}s, tokens 输入 {record['prompt_tokens']} (缓存命中 {record['cache_hit_tokens']}) "
+                  f"/ 输出 {record['completion_tokens']}")
+        elif record["outcome"] == "error":
+            print(f"⚠️ [LLM] {label} ({model}, {kind}) 失败 ({record['total']}s): {record['error']}")
+
+
+def _retryable(e):
+    """
+    超时、连接中断、空回复、429 和 5xx 值得重试；参数错误、鉴权失败之类的重试也没用
+    """
+    if isinstance(e, (TimeoutError, ConnectionError, EmptyCompletion)):
+        return True
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    # openai 的连接 / 超时异常没有 status_code；流读到一半断开是 httpx / httpcore 的异常
+    return type(e).__module__.split(".")[0] in ("openai", "httpx", "httpcore")
+
+
+def _backoff(failures):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** failures))
+
+
+def _history_key(label, model):
+    # evening/block1、evening/block2 ... 共用一组样本
+    return f"{label.rstrip('0123456789')}|{model}"
+
+
+def _load_history():
+    global _latency_history
+    if _latency_history is None:
+        try:
+            with open(LATENCY_HISTORY_FILE, 'r', encoding='utf-8') as f:
+                _latency_history = json.load(f)
+        except (OSError, ValueError):
+            _latency_history = {}
+    return _latency_history
+
+
+def _hedge_delay(label, model):
+    """
+    该 label 历史成功耗时的 HEDGE_PERCENTILE 分位数；样本不足返回 None (不对冲)
+    """
+    with _stats_lock:
+        samples = sorted(_load_history().get(_history_key(label, model), []))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))]
+
+
+def _remember_latency(label, model, seconds):
+    with _stats_lock:
+        history = _load_history()
+        samples = history.setdefault(_history_key(label, model), [])
+        samples.append(round(seconds, 2))
+        del samples[:-LATENCY_HISTORY_SIZE]
+        try:
+            tmp_path = LATENCY_HISTORY_FILE + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(history, f)
+            os.replace(tmp_path, LATENCY_HISTORY_FILE)
+        except OSError:
+            pass
+
+
+def generate(messages, label="llm", **kwargs):
+    """
+    三个 Agent 共用的 LLM 调用入口，返回完整回复文本；所有尝试都失败时抛出最后一个异常 (绝不返回占位文字)。
+    参数见 _generate()；整个调用 (含重试 / 对冲 / 降级) 记为一个 span，token 用量记在它下面。
+    """
+    with telemetry.span(f"llm {label.replace('/', ':')}") as trace:
+        return _generate(messages, label=label, trace=trace, **kwargs)
+
+
+def _generate(messages, label="llm", model=REASONER_MODEL, fallback_model=FALLBACK_MODEL,
+              budget=REASONER_BUDGET, retries=MAX_RETRIES, hedge=True, trace=None,
+              first_token_timeout=FIRST_TOKEN_TIMEOUT, stall_timeout=STALL_TIMEOUT, **params):
+    """
+    一次逻辑调用 = 主请求 + 按需的重试 / 对冲 / 降级请求：
+    - 可重试的失败按抖动指数退避重试，最多 retries 次
+    - 主请求超过该 label 历史耗时的 P95 仍未完成，再发一个相同请求 (对冲)，先完成的胜出，其余取消
+    - 超过 budget 秒还没结果 (或重试用尽)，改用 fallback_model 兜底；budget=None 关闭降级
+    其他参数 (temperature、max_tokens 等) 原样传给 chat.completions.create。
+    """
+    started = time.monotonic()
+    results = queue.Queue()
+    running = {}   # 尝试编号 -> 取消信号
+    attempts = []
+
+    def launch(use_model, kind):
+        attempt_id, cancel = len(attempts), threading.Event()
+        attempts.append(kind)
+        running[attempt_id] = cancel
+
+        def worker():
+            try:
+                results.put((attempt_id, use_model, _stream_once(messages, label, use_model, kind, cancel,
+                                                                first_token_timeout, stall_timeout, **params), None))
+            except Exception as e:
+                results.put((attempt_id, use_model, None, e))
+        threading.Thread(target=telemetry.in_context(worker), daemon=True).start()
+
+    def finish(outcome, used_model):
+        for cancel in running.values():
+            cancel.set()
+        entry = {
+            "label": label, "model": used_model, "outcome": outcome,
+            "total": round(time.monotonic() - started, 2), "attempts": len(attempts),
+            "hedged": "hedge" in attempts, "fallback": "fallback" in attempts,
+        }
+        with _stats_lock:
+            call_log.append(entry)
+        if trace is not None:
+            trace.set(model=used_model, attempts=entry["attempts"], hedged=entry["hedged"], fallback=entry["fallback"])
+        return entry
+
+    current_model = model
+    hedge_at = _hedge_delay(label, model) if hedge else None
+    budget_at = budget if fallback_model and fallback_model != model else None
+    retry_at, failures, last_error = None, 0, None
+    launch(model, "primary")
+
+    while True:
+        elapsed = time.monotonic() - started
+        deadlines = [t for t in (hedge_at if running else None, budget_at, retry_at) if t is not None]
+        try:
+            attempt_id, used_model, text, error = results.get(timeout=max(0, min(deadlines) - elapsed) if deadlines else None)
+        except queue.Empty:
+            elapsed = time.monotonic() - started
+            if retry_at is not None and elapsed >= retry_at:
+                retry_at = None
+                launch(current_model, "retry")
+            if hedge_at is not None and running and elapsed >= hedge_at:
+                hedge_at = None
+                print(f"🐢 [LLM] {label}: 已超过历史 P{HEDGE_PERCENTILE} ({elapsed:.0f}s)，发出对冲请求")
+                launch(current_model, "hedge")
+            if budget_at is not None and elapsed >= budget_at:
+                budget_at, hedge_at, retry_at, current_model = None, None, None, fallback_model
+                print(f"⏳ [LLM] {label}: {model} 超过 {budget}s 预算，改用 {fallback_model} 兜底")
+                launch(fallback_model, "fallback")
+            continue
+
+        running.pop(attempt_id, None)
+        if error is None:
+            finish("ok", used_model)
+            _remember_latency(label, used_model, time.monotonic() - started)
+            return text
+
+        last_error = error
+        if isinstance(error, InterruptedError):
+            continue
+        failures += 1
+        if running or retry_at is not None:
+            continue  # 还有别的请求在跑 / 已排好重试，等它们的结果
+
+        if _retryable(error) and failures <= retries:
+            retry_at = time.monotonic() - started + _backoff(failures)
+            print(f"🔁 [LLM] {label}: {retry_at - (time.monotonic() - started):.1f}s 后第 {failures} 次重试")
+        elif budget_at is not None:
+            # 重试用尽 (或不可重试)：直接用兜底模型
+            budget_at, hedge_at, current_model = None, None, fallback_model
+            print(f"⏳ [LLM] {label}: {model} 调用失败，改用 {fallback_model} 兜底")
+            launch(fallback_model, "fallback")
+        else:
+            finish("error", used_model)
+            raise last_error
+
+
+def stats_summary():
+    """
+    按 label 汇总 call_log：调用次数、成功 / 失败、对冲 / 降级次数、耗时 P50 / P95
+    """
+    with _stats_lock:
+        log = list(call_log)
+    summary = {}
+    for entry in log:
+        row = summary.setdefault(entry["label"], {"calls": 0, "ok": 0, "error": 0, "hedged": 0, "fallback": 0, "latencies": []})
+        row["calls"] += 1
+        row[entry["outcome"]] += 1
+        row["hedged"] += entry["hedged"]
+        row["fallback"] += entry["fallback"]
+        row["latencies"].append(entry["total"])
+    for row in summary.values():
+        latencies = sorted(row.pop("latencies"))
+        row["p50"] = latencies[len(latencies) // 2]
+        row["p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return summary
+
+def generate_json(messages, validate, label="llm", retries=1, **params):
+    """
+    结构化输出：调用 generate()，把回复解析成 JSON 再交给 validate 校验 (见 services/render.py)。
+    解析或校验失败 (SchemaError) 时带着错误原因重新生成，最多 retries 次；仍失败则抛出最后一次的 SchemaError。
+    """
+    from services.render import parse_json, SchemaError
+
+    for attempt in range(retries + 1):
+        text = generate(messages, label=label, **params)
+        try:
+            return validate(parse_json(text))
+        except SchemaError as e:
+            print(f"⚠️ [LLM] {label}: 输出结构不合格 (第 {attempt + 1} 次): {e}")
+            if attempt == retries:
+                raise
+            messages = messages + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": f"上面的输出不符合要求：{e}。请修正后重新输出完整的 JSON，不要输出其他内容。"},
+            ]
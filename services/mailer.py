@@ -2,19 +2,144 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr
+from email.policy import compat32
 import os
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
+import time
+import socket
+import atexit
+import threading
+from services.telemetry import traced
 
 # ================= 配置区域 (163版) =================
 SMTP_SERVER = "smtp.163.com"
 SMTP_PORT = 465  # 网易邮箱推荐使用 SSL 加密端口
-SENDER_EMAIL = os.getenv("MAIL_USERNAME")
-SENDER_PASSWORD = os.getenv("MAIL_PASSWORD")
+# 账号密码在使用时才从环境变量读取 (.env 由入口脚本加载)
+SENDER_EMAIL_ENV = "MAIL_USERNAME"
+SENDER_PASSWORD_ENV = "MAIL_PASSWORD"
+# 可选：改连别的 SMTP 服务 (例如 benchmarks/ 里的本地接收端)，MAIL_SMTP_SSL=0 表示不用 SSL
+SMTP_SERVER_ENV = "MAIL_SMTP_SERVER"
+SMTP_PORT_ENV = "MAIL_SMTP_PORT"
+SMTP_SSL_ENV = "MAIL_SMTP_SSL"
+
+KEEPALIVE_SECONDS = 30  # 连接空闲超过这个时间，发送前先 NOOP 探活
+SMTP_POLICY = compat32.clone(linesep="\r\n")  # SMTP 要求 CRLF 换行
+
+# 群发配置：并发连接数、全局每秒发送上限 (163 邮箱对频率比较敏感)、单个收件人的重试次数
+DELIVERY_CONNECTIONS = 4
+MAX_MESSAGES_PER_SECOND = 5
+DELIVERY_RETRIES = 2
 # =================================================
 
+
+def build_message(subject, html_content):
+    """
+    每篇简报只构建并编码一次 MIME 正文 (不含 To 头)，返回 bytes。
+    发送时只在最前面拼上各自的 To 头，不再为每个收件人重新编码 HTML。
+    """
+    msg = MIMEMultipart()
+    # 发件人显示设置
+    msg['From'] = formataddr(("Tony’s Daily Briefing", os.getenv(SENDER_EMAIL_ENV)))
+    msg['Subject'] = subject
+
+    # 邮件正文
+    msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+    return msg.as_bytes(policy=SMTP_POLICY)
+
+
+def with_recipient(payload, recipient):
+    return f"To: {recipient}\r\n".encode("utf-8") + payload
+
+
+class MailSession:
+    """
+    可复用的 SMTP 会话：只在第一次发送时连接并登录，之后同一进程里的
+    预览邮件和调度员的正式发送都共用这条连接。
+    连接被服务器断开时自动重连，空闲太久先用 NOOP 探活。
+    """
+    def __init__(self, server=None, port=None, use_ssl=None,
+                 username=None, password=None):
+        self.server_addr = server or os.getenv(SMTP_SERVER_ENV) or SMTP_SERVER
+        self.port = port or int(os.getenv(SMTP_PORT_ENV) or SMTP_PORT)
+        self.use_ssl = use_ssl if use_ssl is not None else os.getenv(SMTP_SSL_ENV, "1") != "0"
+        self.username = username or os.getenv(SENDER_EMAIL_ENV)
+        self.password = password or os.getenv(SENDER_PASSWORD_ENV)
+        self.server = None
+        self.last_used = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        self.close()
+        # 1. 连接服务器 (默认使用 SSL)
+        if self.use_ssl:
+            self.server = smtplib.SMTP_SSL(self.server_addr, self.port)
+        else:
+            self.server = smtplib.SMTP(self.server_addr, self.port)
+        # 2. 登录
+        if self.username and self.password:
+            self.server.login(self.username, self.password)
+        self.last_used = time.monotonic()
+
+    def ensure_connected(self):
+        if self.server is None:
+            self.connect()
+        elif time.monotonic() - self.last_used > KEEPALIVE_SECONDS:
+            try:
+                code, _ = self.server.noop()
+                if code != 250:
+                    self.connect()
+            except smtplib.SMTPException:
+                self.connect()
+
+    def send(self, recipient, payload):
+        """
+        发送已编码好的 payload 给单个收件人；连接被断开时重连一次再发
+        """
+        with self.lock:
+            for attempt in range(2):
+                self.ensure_connected()
+                try:
+                    self.server.sendmail(self.username, recipient, with_recipient(payload, recipient))
+                    self.last_used = time.monotonic()
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    self.discard()
+                    if attempt == 1:
+                        raise
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def discard(self):
+        """
+        出错后丢弃连接：直接关闭 socket (不发 QUIT，对方可能已经没有响应)，下一次发送时重连
+        """
+        if self.server is not None:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+            self.server = None
+
+
+_session = None
+
+def get_session():
+    """
+    进程内共享的 MailSession (第一次调用时创建，进程退出时关闭)
+    """
+    global _session
+    if _session is None:
+        _session = MailSession()
+        atexit.register(_session.close)
+    return _session
+
+
+@traced("send_email")
 def send_email(subject, html_content, to_emails=None):
     """
     发送 HTML 邮件 (适配 163 邮箱)
@@ -31,31 +156,125 @@ def send_email(subject, html_content, to_emails=None):
     print(f"📧 [163 Mail] 正在发送邮件: '{subject}' 给 {len(to_emails)} 位用户...")
 
     try:
-        # 1. 连接服务器 (使用 SSL)
-        server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT)
-        
-        # 2. 登录
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        
-        # 3. 循环发送
+        # 1. 正文只编码一次
+        payload = build_message(subject, html_content)
+
+        # 2. 复用同一条已登录的连接，循环发送
+        session = get_session()
         for recipient in to_emails:
-            msg = MIMEMultipart()
-            # 发件人显示设置
-            msg['From'] = formataddr(("Tony’s Daily Briefing", SENDER_EMAIL))
-            msg['To'] = recipient
-            msg['Subject'] = subject
-
-            # 邮件正文
-            msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-            
-            # 发送指令
-            server.sendmail(SENDER_EMAIL, recipient, msg.as_string())
+            session.send(recipient, payload)
         
-        # 4. 退出
-        server.quit()
         print("✅ 邮件发送成功！")
         return True
 
     except Exception as e:
         print(f"❌ 邮件发送失败: {e}")
         return False
+
+
+class RateLimiter:
+    """
+    多线程共享的简单限速器：保证全局发送间隔不小于 1/rate 秒
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+
+def _delivery_error_kind(e):
+    """
+    群发时的错误分类：
+    - "fatal": 登录失败 / 连不上服务器，换哪个收件人都一样，继续只会反复登录 (163 可能因此锁号)，整次群发中止
+    - "retry": 连接被断开、4xx 临时错误，重连后对同一收件人重试
+    - "fail": 其他错误 (地址被拒、5xx 等)，这个收件人记为失败，不重试
+    """
+    if isinstance(e, (smtplib.SMTPAuthenticationError, smtplib.SMTPConnectError,
+                      ConnectionRefusedError, socket.gaierror)):
+        return "fatal"
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return "retry"
+    code = getattr(e, "smtp_code", None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return "retry"
+    return "fail"
+
+
+@traced("deliver")
+def deliver(subject, html_content, to_emails, connections=None,
+            rate=None, retries=DELIVERY_RETRIES, session_factory=MailSession):
+    """
+    大批量群发：收件人分片到多条并发 SMTP 连接，全局限速，每个收件人单独重试。
+    某个收件人失败不影响其他人；登录失败 / 连不上服务器时整次中止，剩下的收件人都记为未发送。connections / rate 不传时使用模块配置 (调用时读取)。
+    返回 {收件人: None (成功) 或 错误信息字符串}
+    """
+    results = {}
+    if not to_emails:
+        return results
+    connections = connections or DELIVERY_CONNECTIONS
+    rate = MAX_MESSAGES_PER_SECOND if rate is None else rate
+
+    print(f"📧 [163 Mail] 群发 '{subject}' 给 {len(to_emails)} 位用户 ({connections} 条连接, {f'每秒最多 {rate} 封' if rate else '不限速'})...")
+    start = time.monotonic()
+    payload = build_message(subject, html_content)
+    limiter = RateLimiter(rate)
+    shards = [to_emails[k::connections] for k in range(connections)]
+    aborted = []   # 第一个致命错误；设置后所有连接停止发送
+
+    def worker(shard):
+        session = session_factory()
+        try:
+            for recipient in shard:
+                if aborted:
+                    break
+                error = None
+                for attempt in range(retries + 1):
+                    limiter.wait()
+                    try:
+                        session.send(recipient, payload)
+                        error = None
+                        break
+                    except Exception as e:
+                        error = str(e)
+                        kind = _delivery_error_kind(e)
+                        session.discard()  # 关闭出错的连接，下一次重连
+                        if kind == "fatal":
+                            aborted.append(f"{type(e).__name__}: {e}")
+                            break
+                        if kind != "retry":
+                            break
+                        time.sleep(0.5 * (attempt + 1))
+                if aborted and error:
+                    break   # 致命错误：这个收件人和剩下的都算未发送
+                results[recipient] = error
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker, args=(shard,)) for shard in shards if shard]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    unsent = [r for r in to_emails if r not in results]
+    for recipient in unsent:
+        results[recipient] = f"未发送 (群发已中止: {aborted[0]})"
+
+    failed = [r for r, err in results.items() if err]
+    print(f"✅ 群发完成: 成功 {len(results) - len(failed)} / 失败 {len(failed)}，耗时 {time.monotonic() - start:.1f}s")
+    if unsent:
+        print(f"  - 🛑 群发中止 ({aborted[0]})，{len(unsent)} 位收件人未发送")
+    unsent = set(unsent)
+    for recipient in failed:
+        if recipient not in unsent:
+            print(f"  - ❌ {recipient}: {results[recipient]}")
+    return results
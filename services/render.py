@@ -0,0 +1,348 @@
+import re
+import json
+import html
+
+# ================= 结构化输出 + 本地渲染 =================
+# 模型只返回紧凑的 JSON (新闻、划线词、释义、范文...)，所有带 style= 的 HTML 外壳都在这里生成。
+# 正文里的行内标记 (模型输出，渲染时展开)：
+#   [[phrase]]         -> 下划线
+#   {{phrase|释义}}    -> 加粗/下划线 + 【释义】，具体样式由各简报决定
+# ======================================================
+
+_UNDERLINE_RE = re.compile(r'\[\[(.+?)\]\]')
+_GLOSS_RE = re.compile(r'\{\{([^{}|]+?)\|([^{}]+?)\}\}')
+
+MORNING_GLOSS = '<u>{term}</u>'
+AFTERNOON_GLOSS = '<u>{term}</u>【{meaning}】'
+AFTERNOON_ANSWER_GLOSS = '<b>{term}</b>【{meaning}】'
+EVENING_GLOSS = '<b>{term}</b><span style="color:#bc8a86; font-size: 0.9em;">【{meaning}】</span>'
+
+
+class SchemaError(ValueError):
+    """
+    模型返回的内容不是约定结构的 JSON
+    """
+
+
+def parse_json(text):
+    """
+    解析模型回复里的 JSON 对象 (容忍 ```json 包裹和前后的多余文字)
+    """
+    text = (text or "").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise SchemaError("回复里没有 JSON 对象")
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise SchemaError(f"JSON 解析失败: {e}") from e
+
+
+def inline(text, gloss=EVENING_GLOSS):
+    """
+    转义正文并展开行内标记
+    """
+    out = html.escape(text, quote=False)
+    out = _GLOSS_RE.sub(lambda m: gloss.format(term=m.group(1).strip(), meaning=m.group(2).strip()), out)
+    return _UNDERLINE_RE.sub(r'<u>\1</u>', out)
+
+
+def plain(text):
+    """
+    去掉行内标记，只留原文
+    """
+    text = _GLOSS_RE.sub(lambda m: m.group(1), text)
+    return _UNDERLINE_RE.sub(lambda m: m.group(1), text)
+
+
+def _esc(text):
+    return html.escape(text, quote=False)
+
+
+# ---------------- 结构校验 ----------------
+def _text(obj, key, where, required=True):
+    value = obj.get(key) if isinstance(obj, dict) else None
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or not value.strip():
+        raise SchemaError(f"{where}.{key} 必须是非空字符串")
+    return value.strip()
+
+
+def _items(obj, key, where, min_items=1, max_items=None):
+    value = obj.get(key) if isinstance(obj, dict) else None
+    if not isinstance(value, list) or len(value) < min_items:
+        raise SchemaError(f"{where}.{key} 至少需要 {min_items} 项")
+    return value[:max_items] if max_items else value
+
+
+def validate_stories(obj, max_stories=3):
+    """
+    早报一个板块: {"stories": [{"en", "zh", "terms": [{"term", "meaning", "example"}]}]}
+    每个讲解的表达都必须在英文概述里出现 (原来写在 prompt 里的硬性要求，现在由程序检查)。
+    """
+    stories = []
+    for i, story in enumerate(_items(obj, "stories", "stories", max_items=max_stories)):
+        where = f"stories[{i}]"
+        en, zh = _text(story, "en", where), _text(story, "zh", where)
+        terms = []
+        for j, term in enumerate(_items(story, "terms", where)):
+            entry = {
+                "term": _text(term, "term", f"{where}.terms[{j}]"),
+                "meaning": _text(term, "meaning", f"{where}.terms[{j}]"),
+                "example": _text(term, "example", f"{where}.terms[{j}]", required=False),
+            }
+            if entry["term"].lower() not in plain(en).lower():
+                raise SchemaError(f"{where}: 讲解的表达 '{entry['term']}' 不在英文概述里")
+            terms.append(entry)
+        stories.append({"en": en, "zh": zh, "terms": terms})
+    return stories
+
+
+def validate_ielts(obj, min_collocations=10, min_angles=5):
+    """
+    午报: part2_title / part2_points / collocations / thinking / sample_answer / examiner_note
+    """
+    return {
+        "part2_title": _text(obj, "part2_title", "ielts"),
+        "part2_points": [_text({"p": p}, "p", f"part2_points[{i}]")
+                         for i, p in enumerate(_items(obj, "part2_points", "ielts"))],
+        "collocations": [{
+            "en": _text(c, "en", f"collocations[{i}]"),
+            "zh": _text(c, "zh", f"collocations[{i}]"),
+            "example": _text(c, "example", f"collocations[{i}]", required=False),
+        } for i, c in enumerate(_items(obj, "collocations", "ielts", min_items=min_collocations))],
+        "thinking": [{
+            "angle": _text(t, "angle", f"thinking[{i}]"),
+            "analysis": _text(t, "analysis", f"thinking[{i}]"),
+            "express": _text(t, "express", f"thinking[{i}]"),
+        } for i, t in enumerate(_items(obj, "thinking", "ielts", min_items=min_angles))],
+        "sample_answer": _text(obj, "sample_answer", "ielts"),
+        "examiner_note": _text(obj, "examiner_note", "ielts"),
+    }
+
+
+def validate_reading_blocks(obj):
+    """
+    晚报一个片段: {"blocks": [{"paragraphs": [...], "grammar": {"sentence", "analysis"} 或 null}]}
+    """
+    blocks = []
+    for i, block in enumerate(_items(obj, "blocks", "blocks")):
+        where = f"blocks[{i}]"
+        paragraphs = [_text({"p": p}, "p", f"{where}.paragraphs[{j}]")
+                      for j, p in enumerate(_items(block, "paragraphs", where))]
+        grammar = block.get("grammar")
+        if grammar:
+            grammar = {
+                "sentence": _text(grammar, "sentence", f"{where}.grammar"),
+                "analysis": _text(grammar, "analysis", f"{where}.grammar"),
+            }
+        blocks.append({"paragraphs": paragraphs, "grammar": grammar or None})
+    return blocks
+
+
+# ---------------- 早报 (深蓝商务版) ----------------
+def render_story(story, color):
+    terms = "".join(
+        f"""
+            <li><span style="font-family: monospace; font-weight: bold; color: #2b6cb0;">{_esc(t['term'])}</span>: {_esc(t['meaning'])}"""
+        + (f""" <span style="color: #718096;">( {_esc(t['example'])})</span>""" if t.get("example") else "")
+        + "</li>"
+        for t in story["terms"]
+    )
+    return f"""
+<div style="background-color: white; border-left: 5px solid {color}; padding: 15px; margin-bottom: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
+    <div style="font-size: 16px; font-weight: bold; color: #2d3748; margin-bottom: 8px;">
+        {inline(story['en'], MORNING_GLOSS)}
+    </div>
+    <div style="font-size: 14px; color: #4a5568; line-height: 1.6; margin-bottom: 10px;">
+        {_esc(story['zh'])}
+    </div>
+
+    <div style="background-color: #ebf8ff; padding: 15px; border-radius: 6px; font-size: 14px; color: #2c5282; border: 1px solid #bee3f8;">
+        <div style="font-weight: bold; margin-bottom: 8px; font-size: 14px;">💡 表达积累：</div>
+        <ul style="margin: 0; padding-left: 20px; list-style-type: disc; line-height: 1.6;">{terms}
+        </ul>
+    </div>
+</div>
+"""
+
+
+def render_morning_section(section, stories):
+    cards = "".join(render_story(story, section["color"]) for story in stories)
+    return f"""
+            <div style="margin-bottom: 40px;">
+                <h2 style="background-color: {section['color']}; color: white; padding: 10px 15px; border-radius: 6px; font-size: 20px; display: inline-block;">{section['title']}</h2>
+                <hr style="border: 0; border-top: 2px solid {section['color']}; margin-top: 0; margin-bottom: 20px;">
+                {cards}
+            </div>
+"""
+
+
+def render_morning(display_date_str, sections):
+    """
+    sections: [(板块定义, 已校验的 stories), ...]，按顺序渲染
+    """
+    return f"""<div style="background-color: #f0f4f8; padding: 20px; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333;">
+
+        <div style="max-width: 800px; margin: 0 auto; margin-bottom: 30px; border-bottom: 4px solid #1a365d; padding-bottom: 20px;">
+            <h1 style="color: #1a365d; font-size: 36px; margin-bottom: 10px; font-weight: 900; letter-spacing: 1px;">Global Morning Brief</h1>
+            <p style="color: #4a5568; font-size: 16px; font-weight: 500;">
+                {display_date_str} | 每日精选，洞见全球
+            </p>
+        </div>
+
+        <div style="max-width: 800px; margin: 0 auto;">
+{"".join(render_morning_section(section, stories) for section, stories in sections)}
+            <div style="text-align: center; margin-top: 50px; border-top: 1px solid #cbd5e0; padding-top: 20px; color: #718096; font-size: 12px;">
+                © 2026 Daily Briefing
+            </div>
+
+        </div>
+    </div>"""
+
+
+# ---------------- 午报 (Sage Green 2.0) ----------------
+def render_ielts(data, topic_name, selected_p3, date_str):
+    points = "".join(f"""
+                        <li>{_esc(p)}</li>""" for p in data["part2_points"])
+    p3_html = "<br>".join(f"- {_esc(q)}" for q in selected_p3)
+    collocations = "".join(f"""
+                    <li style="margin-bottom: 10px;">
+                        <span style="color: #2d6a4f; font-weight: bold; background-color: #d8f3dc; padding: 2px 6px; border-radius: 4px;">{_esc(c['en'])}</span>
+                        <span style="font-size: 14px;"> : {_esc(c['zh'])}{f"（ {_esc(c['example'])}）" if c.get('example') else ""}</span>
+                    </li>""" for c in data["collocations"])
+    thinking = "".join(f"""
+                <div style="margin-bottom: 20px;">
+                    <div style="font-size: 15px; color: #333; margin-bottom: 8px; font-weight: bold;">
+                        💡 思维角度：{_esc(t['angle'])}
+                    </div>
+                    <div style="font-size: 14px; color: #444; margin-bottom: 8px; line-height: 1.6;">
+                        {_esc(t['analysis'])}
+                    </div>
+                    <div style="background-color: #f0f7f4; padding: 10px; border-radius: 6px; color: #2d6a4f; font-size: 14px; line-height: 1.6; border-left: 3px solid #57a086;">
+                        🔤 <b>Express it:</b> <br>
+                        {inline(t['express'], AFTERNOON_GLOSS)}
+                    </div>
+                </div>
+""" for t in data["thinking"])
+    question = _esc(selected_p3[0]) if selected_p3 else ""
+
+    return f"""<div style="background-color: #f0f7f4; padding: 20px; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333;">
+
+        <div style="max-width: 600px; margin: 0 auto; margin-bottom: 30px; text-align: center; border-bottom: 3px solid #57a086; padding-bottom: 15px;">
+            <h1 style="color: #2d6a4f; font-size: 28px; margin-bottom: 5px; font-weight: 800;">IELTS Speaking Booster</h1>
+            <p style="color: #52b788; font-size: 14px; font-weight: bold; background-color: #d8f3dc; display: inline-block; padding: 4px 12px; border-radius: 15px;">
+                Topic: {_esc(topic_name)}
+            </p>
+        </div>
+
+        <div style="max-width: 600px; margin: 0 auto;">
+
+            <div style="background-color: white; border-radius: 10px; padding: 20px; margin-bottom: 25px; box-shadow: 0 4px 10px rgba(87, 160, 134, 0.15);">
+                <h3 style="color: #2d6a4f; margin-top: 0; border-left: 5px solid #57a086; padding-left: 10px; font-size: 18px;">🎯 Topic Overview</h3>
+
+                <div style="font-size: 15px; color: #333; margin-bottom: 20px; background-color: #f9fdfa; padding: 15px; border-radius: 8px; border: 1px solid #e0f2e9;">
+                    <div style="color: #2d6a4f; font-weight: bold; margin-bottom: 10px;">
+                        {_esc(data['part2_title'])}
+                    </div>
+                    <ul style="color: #555; margin: 0; padding-left: 20px; line-height: 1.6;">{points}
+                    </ul>
+                </div>
+
+                <div style="font-size: 14px; color: #555;">
+                    <b>Selected P3 Questions:</b><br>
+                    {p3_html}
+                </div>
+            </div>
+
+            <div style="background-color: white; border-radius: 10px; padding: 20px; margin-bottom: 25px; box-shadow: 0 4px 10px rgba(87, 160, 134, 0.15);">
+                <h3 style="color: #2d6a4f; margin-top: 0; border-left: 5px solid #57a086; padding-left: 10px; font-size: 18px;">💎 Band 9 Lexical Resource</h3>
+                <p style="font-size: 14px; color: #666; margin-bottom: 15px;">Use these <b>Collocations</b> to sound native.</p>
+                <ul style="line-height: 1.8; color: #333; padding-left: 20px;">{collocations}
+                </ul>
+            </div>
+
+            <div style="background-color: white; border-radius: 10px; padding: 20px; margin-bottom: 25px; box-shadow: 0 4px 10px rgba(87, 160, 134, 0.15);">
+                <h3 style="color: #2d6a4f; margin-top: 0; border-left: 5px solid #57a086; padding-left: 10px; font-size: 18px;">🧠 Critical Thinking</h3>
+                <p style="font-size: 14px; color: #888; margin-bottom: 15px;">Deep analysis for the topic.</p>
+{thinking}
+            </div>
+
+            <div style="background-color: #ebfcf0; border: 2px dashed #57a086; border-radius: 10px; padding: 20px; position: relative;">
+                <div style="position: absolute; top: -12px; left: 20px; background-color: #2d6a4f; color: white; padding: 2px 10px; font-size: 12px; border-radius: 4px;">Part 3 Sample Answer</div>
+
+                <div style="margin-top: 15px; font-weight: bold; color: #2d6a4f; font-size: 16px;">
+                    Q: {question}
+                </div>
+
+                <div style="margin-top: 10px; font-size: 16px; color: #333; line-height: 1.8;">
+                   {inline(data['sample_answer'], AFTERNOON_ANSWER_GLOSS)}
+                </div>
+
+                <div style="margin-top: 15px; border-top: 1px solid #b7e4c7; padding-top: 10px; font-size: 13px; color: #52b788;">
+                    💡 <b>Examiner's Note:</b> {_esc(data['examiner_note'])}
+                </div>
+            </div>
+
+            <div style="text-align: center; margin-top: 40px; color: #57a086; font-size: 12px; font-style: italic;">
+                Daily Progress · {date_str}
+            </div>
+
+        </div>
+    </div>"""
+
+
+# ---------------- 晚报 (莫兰迪暖咖色注读版) ----------------
+def render_reading_block(block):
+    paragraphs = "".join(f"""
+    <p style="font-size: 19px; text-align: justify; margin-bottom: 15px;">
+        {inline(p, EVENING_GLOSS)}
+    </p>
+""" for p in block["paragraphs"])
+    card = ""
+    if block.get("grammar"):
+        card = f"""
+    <div style="background-color: #f3ebe9; padding: 15px 20px; border-radius: 4px; font-family: sans-serif; font-size: 14px; color: #5d4037; border-left: 4px solid #bc8a86; margin-top: 10px;">
+        <div style="font-weight: bold; color: #bc8a86; margin-bottom: 5px;">🦉 Long Sentence Breakdown</div>
+        <div style="line-height: 1.6;">
+            {_esc(block['grammar']['sentence'])}<br>
+            <span style="color: #888;">👉 解析：{_esc(block['grammar']['analysis'])}</span>
+        </div>
+    </div>
+"""
+    return f"""
+<div style="margin-bottom: 35px;">
+{paragraphs}{card}
+</div>
+"""
+
+
+def render_evening(article_data, blocks, quote):
+    title = _esc(article_data['title'])
+    author = _esc(article_data['author'])
+    link = html.escape(article_data['link'], quote=True)
+    quote_html = f"""
+                <p style="font-size: 20px; font-style: italic; color: #8d6e63; margin-bottom: 15px;">
+                    " {_esc(quote)} "
+                </p>""" if quote else ""
+
+    return f"""<div style="background-color: #fdfbf7; padding: 40px 20px; font-family: 'Times New Roman', Times, serif; color: #2c2c2c; line-height: 2.0;">
+
+        <div style="max-width: 650px; margin: 0 auto; text-align: center; margin-bottom: 50px; border-bottom: 1px solid #dcc1be; padding-bottom: 20px;">
+            <div style="font-size: 12px; letter-spacing: 2px; color: #bc8a86; text-transform: uppercase; margin-bottom: 10px; font-family: sans-serif;">The Evening Read</div>
+            <h1 style="font-size: 32px; color: #5d4037; margin-bottom: 15px; font-weight: normal; font-style: italic;">{title}</h1>
+            <p style="font-size: 14px; color: #999; font-family: sans-serif;">
+                By {author}
+                <br><a href="{link}" style="color: #bc8a86; text-decoration: none;">Read Original Source</a>
+            </p>
+        </div>
+
+        <div style="max-width: 650px; margin: 0 auto;">
+{"".join(render_reading_block(block) for block in blocks)}
+            <div style="text-align: center; margin-top: 60px; padding-top: 30px; border-top: 1px solid #dcc1be;">{quote_html}
+                <div style="font-size: 12px; color: #bc8a86; text-transform: uppercase; letter-spacing: 1px; font-family: sans-serif;">Goodnight & Sweet Dreams</div>
+            </div>
+
+        </div>
+    </div>"""
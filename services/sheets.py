@@ -1,10 +1,13 @@
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import os
 import datetime
-import traceback
-import datetime
-from datetime import timedelta, timezone # 👈 确保加了这行
+import threading
+from collections import Counter
+from datetime import timedelta
+# gspread / oauth2client 比较重，只在第一次真正连接表格时导入 (见 get_client)
+
+from services.dates import get_target_dates
+from services.artifacts import save_artifact, mark_artifact
+from services.telemetry import span, traced
 
 # 1. 引入发信模块 (新增)
 from services.mailer import send_email 
@@ -21,48 +24,387 @@ CREDS_FILE = os.path.join(os.getcwd(), 'service_account.json')
 # 4. 你的表格 ID (保持不变)
 SHEET_ID = "1tyu1VH-TSnV20E9uj3T6bmWFluCRZ7Y1bUqPakglXc8" 
 
-def get_client():
-    try:
-        creds = ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPE)
-        client = gspread.authorize(creds)
-        return client
-    except Exception as e:
-        print(f"❌ 无法连接 Google Sheets: {e}")
+# 5. Check 表的状态列 (E 列)，以及每次 batch_update 最多合并多少个改动
+STATUS_COL = "E"
+STATUS_COL_INDEX = 4
+# 群发后仍未送达的收件人 (F 列，JSON)，状态为 Retry 的行下次只补发给这些人
+FAILED_COL = "F"
+STATUS_BATCH_SIZE = 100
+CELL_FETCH_BATCH_SIZE = 100
+
+# 6. 归档：已结束的状态、保留天数、Check 表表头 (归档表沿用同样的列)
+ARCHIVE_STATUSES = ["Sent", "Regenerated"]
+ARCHIVE_AFTER_DAYS = 14
+CHECK_HEADER = ["Date", "Task", "Subject", "Content", "Status"]
+
+# ================= 进程内共享连接 =================
+# 同一个进程里 (调度员 + 各 Agent) 只授权一次，worksheet 句柄也缓存起来，
+# 省掉重复读取密钥、gspread.authorize 和 open_by_key(...).worksheet(...) 的元数据请求
+_lock = threading.RLock()
+_client = None
+_creds = None
+_worksheets = {}  # (sheet_id, tab_name) -> Worksheet
+
+# 本进程往 Check 表第 2 行插入的行数，以及最近一次扫描时的快照。
+# 扫描得到的行号，在之后每次插入后都要下移一行 (调度员会在同一进程里并发重生成)
+_insert_lock = threading.Lock()
+_check_inserts = 0
+_scan_inserts = 0
+# ===============================================
+
+def get_client(force_new=False):
+    global _client, _creds
+    with _lock:
+        # token 过期时直接重新授权，旧的 worksheet 句柄一并作废
+        if _client is not None and not force_new and not getattr(_creds, "access_token_expired", False):
+            return _client
+
+        _worksheets.clear()
+        _client = None
+        try:
+            import gspread
+            from oauth2client.service_account import ServiceAccountCredentials
+            _creds = ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPE)
+            _client = gspread.authorize(_creds)
+            return _client
+        except Exception as e:
+            print(f"❌ 无法连接 Google Sheets: {e}")
+            return None
+
+def get_worksheet(tab_name, sheet_id=SHEET_ID):
+    """
+    获取 (缓存的) worksheet 句柄，连不上返回 None
+    """
+    with _lock:
+        client = get_client()
+        if not client:
+            return None
+
+        key = (sheet_id, tab_name)
+        if key not in _worksheets:
+            _worksheets[key] = client.open_by_key(sheet_id).worksheet(tab_name)
+        return _worksheets[key]
+
+def _should_reconnect(e):
+    # 只对鉴权失效 / 连接断开重连；其他错误 (比如 429、400) 重试也没用，还可能重复写入
+    import gspread
+    import requests
+    if isinstance(e, gspread.exceptions.APIError):
+        return getattr(e.response, "status_code", None) in (401, 403)
+    return isinstance(e, (requests.exceptions.ConnectionError, ConnectionError))
+
+def with_worksheet(tab_name, action, sheet_id=SHEET_ID):
+    """
+    执行 action(worksheet) 并返回结果。
+    如果是 token 过期或连接断开导致的失败，重新授权后再试一次。
+    """
+    for attempt in range(2):
+        sheet = get_worksheet(tab_name, sheet_id)
+        if sheet is None:
+            raise RuntimeError("无法连接 Google Sheets")
+        try:
+            return action(sheet)
+        except Exception as e:
+            if attempt == 0 and _should_reconnect(e):
+                print(f"🔌 [Sheets] 连接失效，正在重连: {e}")
+                get_client(force_new=True)
+                continue
+            raise
+
+class StatusBatch:
+    """
+    收集 Check 表 Status 列 (E 列) 的改动，最后用 batch_update 一次性写回，
+    代替每行一次 update_cell (每次都是一个 API 请求，容易撞上每分钟配额 429)。
+    用 with 包裹时，即使中途出错退出也会保证 flush。
+    """
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.pending = []
+
+    def set(self, row, status, failed=None):
+        """
+        failed: (可选) 同时写入 F 列的未送达名单 ("" 表示清空)
+        """
+        self.pending.append((f"{STATUS_COL}{row}", status))
+        if failed is not None:
+            self.pending.append((f"{FAILED_COL}{row}", failed))
+
+    @traced("status_flush")
+    def flush(self):
+        while self.pending:
+            chunk = self.pending[:STATUS_BATCH_SIZE]
+            self.sheet.batch_update([
+                {"range": cell, "values": [[value]]} for cell, value in chunk
+            ])
+            del self.pending[:len(chunk)]
+            print(f"📝 [Sheets] 批量写入 {len(chunk)} 个状态改动")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"❌ 状态批量写入失败 (未写入 {len(self.pending)} 条): {e}")
+        return False
+
+
+def _pad(values, n):
+    # Sheets API 会省略行尾的空单元格，这里补齐成固定长度
+    values = list(values or [])
+    return values + [""] * (n - len(values))
+
+def _read_status_columns():
+    date_task, statuses = with_worksheet(
+        "Check", lambda sheet: sheet.batch_get(["A2:B", f"{STATUS_COL}2:{STATUS_COL}"])
+    )
+    rows = []
+    for k in range(max(len(date_task), len(statuses))):
+        date, task = _pad(date_task[k] if k < len(date_task) else [], 2)
+        status = _pad(statuses[k] if k < len(statuses) else [], 1)[0]
+        rows.append((k + 2, date, task, status))
+    return rows
+
+def read_check_status():
+    """
+    只读取 Check 表的 Date / Task / Status 三列 (A、B、E)，不下载 D 列的整篇 HTML。
+    返回 [(行号, 日期, 任务, 状态), ...]，行号从 2 开始 (第 1 行是表头)。
+    之后 push_to_sheets 收到的 status_updates 行号都以这次扫描为准，会自动加上期间插入造成的偏移。
+    """
+    global _scan_inserts
+    with _insert_lock:
+        _scan_inserts = _check_inserts
+    return _read_status_columns()
+
+def _locate_row(identity, hint):
+    """
+    按 (日期, 任务, 标题, 状态) 在 Check 表里找到这一行现在的行号，找不到返回 None。
+    其他进程 (另一个调度员、晚间生成) 插入的行不会计入本进程的偏移，所以写入前要按内容重新定位。
+    有多行完全相同时，取离 hint (按本进程偏移推算的行号) 最近的一行。
+    """
+    date, task, subject, status = (str(v).strip() for v in identity)
+    candidates = [r for r, row_date, row_task, row_status in _read_status_columns()
+                  if row_date.strip() == date and row_task.strip() == task
+                  and row_status.strip().lower() == status.lower()]
+    if not candidates:
         return None
+    subjects = with_worksheet("Check", lambda sheet: sheet.batch_get([f"C{r}" for r in candidates]))
+    matches = [r for r, value_range in zip(candidates, subjects)
+               if _pad(value_range[0] if value_range else [], 1)[0].strip() == subject]
+    return min(matches, key=lambda r: abs(r - hint)) if matches else None
 
-def push_to_sheets(task_name, subject, html_content):
+def read_check_cells(row_numbers, first_col="C", last_col="D"):
+    """
+    只读取指定行的若干列 (默认 Subject + Content)，一次 batch_get 请求 (过多时分块)。
+    返回 {行号: [单元格, ...]}
+    """
+    width = ord(last_col) - ord(first_col) + 1
+    cells = {}
+    for start in range(0, len(row_numbers), CELL_FETCH_BATCH_SIZE):
+        chunk = row_numbers[start:start + CELL_FETCH_BATCH_SIZE]
+        ranges = [f"{first_col}{r}:{last_col}{r}" for r in chunk]
+        results = with_worksheet("Check", lambda sheet: sheet.batch_get(ranges))
+        for r, value_range in zip(chunk, results):
+            cells[r] = _pad(value_range[0] if value_range else [], width)
+    return cells
+
+def find_check_rows(date_str, task, subject, html_content):
+    """
+    查找 Check 表里日期、任务、标题和正文都相同的行 (重推稿件前确认它是否已经在表里)。
+    只为日期和任务对得上的行读取 C:D。返回行号列表
+    """
+    candidates = [r for r, date, row_task, _ in _read_status_columns()
+                  if date.strip() == date_str and row_task.strip() == task]
+    cells = read_check_cells(candidates, "C", "D")
+    return [r for r in candidates if cells[r][0] == subject and cells[r][1] == html_content]
+
+def _get_or_create_archive(title):
+    """
+    获取归档 Tab (例如 "Archive-2026-10")，不存在就新建并写好表头
+    """
+    import gspread
+    try:
+        return get_worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        spreadsheet = get_worksheet("Check").spreadsheet
+        sheet = spreadsheet.add_worksheet(title=title, rows=1, cols=len(CHECK_HEADER))
+        sheet.update(range_name="A1", values=[CHECK_HEADER])
+        with _lock:
+            _worksheets[(SHEET_ID, title)] = sheet
+        print(f"🗂️ [Archive] 新建归档表: {title}")
+        return sheet
+
+def archive_check_rows(older_than_days=ARCHIVE_AFTER_DAYS):
+    """
+    把 Check 表里已结束 (Sent / Regenerated) 且日期早于 N 天的行，
+    按月份批量搬到 "Archive-YYYY-MM" 表，再从 Check 表一次性删除。
+    可以安全地重复执行：归档表里已有的行不会再追加；删除前会重新核对行号，行被挪动过就放弃删除，下次再归档。
+    返回从 Check 表删除的行数。
+    """
+    # 和 Date 列一样按北京时间的目标日期计算，不受 runner 所在时区影响
+    cutoff = get_target_dates()[0] - timedelta(days=older_than_days)
+    print(f"🗄️ [Archive] 正在归档 {cutoff} 之前的已结束任务...")
+
+    # 1. 按月份分组挑出要归档的行，记下扫描时每行的 (日期, 任务, 状态)
+    by_month = {}
+    snapshot = {}
+    for row_number, date_raw, task, status in read_check_status():
+        if status.strip() not in ARCHIVE_STATUSES:
+            continue
+        try:
+            row_date = datetime.datetime.strptime(str(date_raw).replace('/', '-').strip(), "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        if row_date < cutoff:
+            by_month.setdefault(row_date.strftime("Archive-%Y-%m"), []).append(row_number)
+            snapshot[row_number] = (date_raw, task, status)
+
+    if not by_month:
+        print("✅ [Archive] 没有需要归档的行。")
+        return 0
+
+    # 2. 先追加到归档表；某个月份追加失败就不删除该月的行
+    #    上次归档可能追加成功但删除没做 (或被放弃)，这些行已经在归档表里，按 (日期, 任务, 标题, 状态) 计数跳过
+    full_rows = read_check_cells(list(snapshot), "A", "E")
+    archived = []
+    for title, row_numbers in sorted(by_month.items()):
+        try:
+            archive = _get_or_create_archive(title)
+            # 只读 A:C 和 E 列，不下载归档表里的整篇 HTML
+            keys, statuses = archive.batch_get(["A2:C", f"{STATUS_COL}2:{STATUS_COL}"])
+            existing = Counter(
+                (*_pad(keys[k] if k < len(keys) else [], 3), _pad(statuses[k] if k < len(statuses) else [], 1)[0])
+                for k in range(max(len(keys), len(statuses)))
+            )
+            new_rows = []
+            for r in sorted(row_numbers):
+                key = tuple(full_rows[r][i] for i in (0, 1, 2, 4))
+                if existing[key] > 0:
+                    existing[key] -= 1
+                else:
+                    new_rows.append(full_rows[r])
+            if new_rows:
+                archive.append_rows(new_rows, value_input_option="RAW")
+            archived.extend(row_numbers)
+            skipped = len(row_numbers) - len(new_rows)
+            print(f"  - 📦 {title}: {len(new_rows)} 行" + (f" (另有 {skipped} 行已在归档表中)" if skipped else ""))
+        except Exception as e:
+            print(f"  - ❌ 归档到 {title} 失败，保留原行: {e}")
+
+    if not archived:
+        print("✅ [Archive] 共归档 0 行。")
+        return 0
+
+    # 3. 删除前重新核对：扫描之后调度员 / 生成任务可能在第 2 行插入了新行，原来的行号就指向了别的行。
+    #    只要有一行的 (日期, 任务, 标题, 状态) 对不上，就整批放弃删除 (数据已在归档表里，下次归档会跳过重复)
+    current = {r: (date_raw, task, status) for r, date_raw, task, status in read_check_status()}
+    subjects = read_check_cells(archived, "C", "C")
+    moved = [r for r in archived
+             if current.get(r) != snapshot[r] or subjects[r][0] != full_rows[r][2]]
+    if moved:
+        print(f"⚠️ [Archive] 扫描后 Check 表有变动 ({len(moved)} 行对不上，例如第 {moved[0]} 行)，本次不删除，下次再归档。")
+        return 0
+
+    # 4. 一次 batchUpdate 删除所有已归档的行 (从下往上删，避免行号错位)
+    def delete_rows(sheet):
+        sheet.spreadsheet.batch_update({"requests": [
+            {"deleteDimension": {"range": {
+                "sheetId": sheet.id, "dimension": "ROWS", "startIndex": r - 1, "endIndex": r
+            }}} for r in sorted(archived, reverse=True)
+        ]})
+    with_worksheet("Check", delete_rows)
+
+    print(f"✅ [Archive] 共归档 {len(archived)} 行。")
+    return len(archived)
+
+def _cell(value):
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+
+def _insert_check_row(sheet, row_data, status_updates=None):
+    """
+    在 Check 表第 2 行插入新行，并把 status_updates 放进同一个 batchUpdate 请求
+    """
+    # 插入第 2 行 + 写入新行 + 状态改动，合成一个请求
+    batch_requests = [
+        {"insertDimension": {
+            "range": {"sheetId": sheet.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 2},
+            "inheritFromBefore": False
+        }},
+        {"updateCells": {
+            "start": {"sheetId": sheet.id, "rowIndex": 1, "columnIndex": 0},
+            "rows": [{"values": [_cell(v) for v in row_data]}],
+            "fields": "userEnteredValue"
+        }},
+    ]
+    for row, status in (status_updates or []):
+        # 新行插在第 2 行，原来的数据行都会下移一行 (下移后的 0-based 索引正好等于原行号)
+        batch_requests.append({"updateCells": {
+            "start": {"sheetId": sheet.id, "rowIndex": row, "columnIndex": STATUS_COL_INDEX},
+            "rows": [{"values": [_cell(status)]}],
+            "fields": "userEnteredValue"
+        }})
+
+    sheet.spreadsheet.batch_update({"requests": batch_requests})
+
+@traced("push_to_sheets")
+def push_to_sheets(task_name, subject, html_content, status_updates=None, date_str=None):
     """
     上传内容到 'Check' Tab，并同时发送一份预览邮件给自己
+    status_updates: (可选) [(行号, 状态), ...] 或 [(行号, 状态, (日期, 任务, 标题, 原状态)), ...]，
+                    和插入新行放在同一个 batchUpdate 请求里写入，例如重生成时把旧的 Reject 行标记为 Regenerated。
+                    行号按最近一次 read_check_status 时的位置给出；带上第三项时，写入前按内容重新定位这一行，
+                    找不到 (已被删除或改过状态) 就跳过这条改动。
+    date_str: (可选) 指定 Date 列，默认按北京时间计算目标日期 (重推旧稿件时用原日期)
     """
+    global _check_inserts
+    today_str = date_str or get_target_dates()[1]
+
+    # 没有正文就不发：宁可这一期缺席，也不把空白或占位文字当成简报推出去
+    if not html_content or not html_content.strip():
+        print(f"❌ [Sheets] {task_name} 内容为空，拒绝推送")
+        return False
+
+    # --- 0. 先落盘：后面表格和邮件都失败了，也能用 main.py --resume 重推，不必重新生成 ---
+    artifact_path = None
+    try:
+        with span("save_artifact"):
+            artifact_path = save_artifact(task_name, today_str, subject, html_content, status_updates)
+    except Exception as e:
+        print(f"⚠️ [Artifacts] 稿件保存失败: {e}")
+
     print(f"📤 [Sheets] 正在上传 {task_name} 到表格...")
     
     # --- 1. 上传表格逻辑 ---
-    client = get_client()
     upload_success = False
     
-    if client:
-        try:
-            sheet = client.open_by_key(SHEET_ID).worksheet("Check")
-            beijing_tz = timezone(timedelta(hours=8))
-            now_in_beijing = datetime.datetime.now(beijing_tz)
+    try:
+        row_data = [today_str, task_name, subject, html_content, "Pending"]
         
-            if now_in_beijing.hour >= 18:
-                target_date = now_in_beijing.date() + timedelta(days=1)
-            else:
-                target_date = now_in_beijing.date()
-                
-            today_str = target_date.strftime("%Y-%m-%d")
-            row_data = [today_str, task_name, subject, html_content, "Pending"]
-            
-            sheet.insert_row(row_data, 2)
-            print(f"✅ 表格上传成功！")
-            upload_success = True
-        except Exception as e:
-            print(f"❌ 表格上传失败: {e}")
-            # 即使表格失败了，我们也尝试发邮件，方便排查
+        # 插入串行执行：行号偏移 = 上次扫描以来本进程已插入的行数
+        with _insert_lock, span("sheets_insert", bytes=len(html_content.encode("utf-8"))):
+            shift = _check_inserts - _scan_inserts
+            shifted = []
+            for row, status, *identity in (status_updates or []):
+                if identity and identity[0]:
+                    current = _locate_row(identity[0], row + shift)
+                    if current is None:
+                        print(f"⚠️ [Sheets] 找不到原第 {row} 行 {identity[0][:3]}，跳过 {status} 标记")
+                        continue
+                    shifted.append((current, status))
+                else:
+                    shifted.append((row + shift, status))
+            with_worksheet("Check", lambda sheet: _insert_check_row(sheet, row_data, shifted))
+            _check_inserts += 1
+        print("✅ 表格上传成功！")
+        upload_success = True
+    except Exception as e:
+        print(f"❌ 表格上传失败: {e}")
+        # 即使表格失败了，我们也尝试发邮件，方便排查
     
     # --- 2. 发送预览邮件逻辑 (新增) ---
-    print(f"📧 [Preview] 正在发送预览邮件给自己...")
+    print("📧 [Preview] 正在发送预览邮件给自己...")
     
     # 给标题加个【预览】前缀，方便区分
     preview_subject = f"【预览 Preview】{subject}"
@@ -72,9 +414,12 @@ def push_to_sheets(task_name, subject, html_content):
     email_success = send_email(preview_subject, html_content)
     
     if email_success:
-        print(f"✅ 预览邮件已发送！")
+        print("✅ 预览邮件已发送！")
     else:
-        print(f"❌ 预览邮件发送失败。")
+        print("❌ 预览邮件发送失败。")
+
+    if artifact_path:
+        mark_artifact(artifact_path, pushed=upload_success, emailed=email_success)
 
     return upload_success
 
@@ -83,12 +428,9 @@ def get_active_users():
     # ... (保持原样) ...
     # 为了节省篇幅，这里省略 get_active_users 的代码，请保留你原文件中这部分
     print("👥 正在读取订阅用户列表...")
-    client = get_client()
-    if not client: return []
     
     try:
-        sheet = client.open_by_key(SHEET_ID).worksheet("Users")
-        rows = sheet.get_all_values()
+        rows = with_worksheet("Users", lambda sheet: sheet.get_all_values())
         
         if len(rows) < 2:
             print("⚠️ Users 表是空的。")
@@ -0,0 +1,286 @@
+import os
+import io
+import sys
+import json
+import time
+import datetime
+import threading
+import functools
+import contextlib
+import contextvars
+
+# ================= 运行埋点 =================
+# 每次 Agent / 调度运行是一个 run，里面的各个阶段 (抓取、解析、模型、表格、邮件...) 是 span。
+# run 结束时往 TELEMETRY_FILE 追加一行 JSON，并打印一张阶段耗时 / token 汇总表。
+# 跨线程 (线程池、LLM 对冲请求) 用 in_context() 把当前 run 带过去。
+TELEMETRY_FILE = os.path.join(os.getcwd(), "telemetry", "runs.jsonl")
+PROFILE_DIR = os.path.join(os.getcwd(), "telemetry", "profiles")
+PROFILE_TOP = 25   # --profile 时打印多少行热点
+# ===========================================
+
+_current_run = contextvars.ContextVar("telemetry_run", default=None)
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+_file_lock = threading.Lock()
+
+
+def _new_tokens():
+    return {"prompt": 0, "completion": 0, "cache_hit": 0, "calls": 0}
+
+
+def _add_tokens(total, prompt, completion, cache_hit):
+    total["prompt"] += prompt or 0
+    total["completion"] += completion or 0
+    total["cache_hit"] += cache_hit or 0
+    total["calls"] += 1
+
+
+class Run:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.monotonic()
+        self.started_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        self.spans = []
+        self.tokens = _new_tokens()
+        self.failed = False   # 运行没有抛异常，但结果算失败 (见 traced_run)
+        self.lock = threading.Lock()
+
+    def to_record(self, ok, error=None):
+        record = {
+            "run": self.name,
+            "started": self.started_at,
+            "duration": round(time.monotonic() - self.started, 3),
+            "ok": ok,
+            "tokens": self.tokens,
+            "spans": self.spans,
+        }
+        if error:
+            record["error"] = error
+        return record
+
+
+class Span:
+    def __init__(self, run, name, parent):
+        self.run = run
+        self.path = f"{parent.path}/{name}" if parent else name
+        self.started = time.monotonic()
+        self.tokens = None
+        self.attrs = {}
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    记录一个阶段的耗时。不在任何 run 里时什么都不做。
+    with span("fetch_feeds", feeds=8) as s:
+        ...
+        s.set(items=42)
+    """
+    run = _current_run.get()
+    if run is None:
+        yield _NullSpan()
+        return
+
+    current = Span(run, name, _current_span.get())
+    current.attrs.update(attrs)
+    token = _current_span.set(current)
+    ok, error = True, None
+    try:
+        yield current
+    except BaseException as e:
+        ok, error = False, f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        entry = {
+            "name": current.path,
+            "start": round(current.started - run.started, 3),
+            "duration": round(time.monotonic() - current.started, 3),
+            "ok": ok,
+        }
+        if current.tokens:
+            entry["tokens"] = current.tokens
+        if current.attrs:
+            entry["attrs"] = current.attrs
+        if error:
+            entry["error"] = error
+        with run.lock:
+            run.spans.append(entry)
+
+
+@contextlib.contextmanager
+def run(name):
+    """
+    一次完整运行。已经在某个 run 里 (例如调度员重写时调用 Agent.run) 就当作普通 span 记录。
+    结束时写一行 JSON 并打印汇总表。
+    """
+    if _current_run.get() is not None:
+        with span(name) as current:
+            yield current
+        return
+
+    current = Run(name)
+    run_token = _current_run.set(current)
+    span_token = _current_span.set(None)
+    ok, error = True, None
+    try:
+        yield current
+    except BaseException as e:
+        ok, error = False, f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_run.reset(run_token)
+        record = current.to_record(ok and not current.failed, error)
+        _write_record(record)
+        print(format_summary(record))
+
+
+def traced(name):
+    """
+    装饰器版的 span
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_run(name, ok=bool):
+    """
+    装饰器版的 run：ok(返回值) 为假时这次运行记为失败 (Agent 的 run() 失败时返回 None)
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with run(name) as current:
+                result = fn(*args, **kwargs)
+                if not ok(result) and isinstance(current, Run):
+                    current.failed = True
+                return result
+        return wrapper
+    return decorator
+
+
+def in_context(fn):
+    """
+    让提交到线程池的函数仍然记在当前 run / span 下：pool.submit(in_context(fn), ...)
+    每次调用都复制一份上下文，同一个函数可以并发提交多次。
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def record_usage(prompt_tokens, completion_tokens, cache_hit_tokens):
+    """
+    把一次模型请求的 usage 记到当前 span 和整个 run 上 (由 services/llm.py 调用)
+    """
+    current_run = _current_run.get()
+    if current_run is None:
+        return
+    current_span = _current_span.get()
+    with current_run.lock:
+        _add_tokens(current_run.tokens, prompt_tokens, completion_tokens, cache_hit_tokens)
+        if current_span is not None:
+            if current_span.tokens is None:
+                current_span.tokens = _new_tokens()
+            _add_tokens(current_span.tokens, prompt_tokens, completion_tokens, cache_hit_tokens)
+
+
+def _write_record(record):
+    try:
+        os.makedirs(os.path.dirname(TELEMETRY_FILE), exist_ok=True)
+        with _file_lock, open(TELEMETRY_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"⚠️ [Telemetry] 写入失败: {e}")
+
+
+def format_summary(record):
+    """
+    一次运行的阶段汇总表 (按开始时间排序，子阶段缩进)
+    """
+    tokens = record["tokens"]
+    lines = [
+        f"\n📈 [{record['run']}] {'✅' if record['ok'] else '❌'} 总耗时 {record['duration']:.1f}s, "
+        f"模型请求 {tokens['calls']} 次, tokens 输入 {tokens['prompt']} (缓存命中 {tokens['cache_hit']}) / 输出 {tokens['completion']}",
+        f"  {'stage':<44}{'start':>8}{'time':>9}{'in':>8}{'cache':>8}{'out':>8}",
+    ]
+    for entry in sorted(record["spans"], key=lambda e: (e["start"], e["name"].count("/"))):
+        depth = entry["name"].count("/")
+        name = "  " * depth + entry["name"].rsplit("/", 1)[-1] + ("" if entry["ok"] else " ❌")
+        t = entry.get("tokens") or {}
+        lines.append(f"  {name:<44}{entry['start']:>7.1f}s{entry['duration']:>8.1f}s"
+                     f"{t.get('prompt', ''):>8}{t.get('cache_hit', ''):>8}{t.get('completion', ''):>8}")
+    return "\n".join(lines)
+
+
+# ================= --profile =================
+@contextlib.contextmanager
+def profiling(name, enabled=True):
+    """
+    --profile: 整个进程的 cProfile (含所有新开的线程) + tracemalloc。
+    结束时把合并后的 .prof 存到 PROFILE_DIR，并打印 CPU 热点和内存分配最多的代码行。
+    """
+    if not enabled:
+        yield
+        return
+
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profilers = []
+    profilers_lock = threading.Lock()
+
+    def start_thread_profiler(*_):
+        # 每个新线程第一次触发时换成它自己的 cProfile (cProfile 只统计启用它的那个线程)
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return   # 新版本里已有全局的 profiler 在统计所有线程
+        with profilers_lock:
+            profilers.append(profiler)
+
+    tracemalloc.start(10)
+    main_profiler = cProfile.Profile()
+    threading.setprofile(start_thread_profiler)
+    main_profiler.enable()
+    try:
+        yield
+    finally:
+        main_profiler.disable()
+        threading.setprofile(None)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = pstats.Stats(main_profiler, stream=io.StringIO())
+        with profilers_lock:
+            for profiler in profilers:
+                stats.add(profiler)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.prof")
+        stats.dump_stats(path)
+
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(f"\n🔬 [Profile] cProfile ({len(profilers) + 1} 个线程) 已保存: {os.path.relpath(path)}")
+        print(out.getvalue())
+
+        print(f"🔬 [Profile] tracemalloc 峰值 {peak / 1024 / 1024:.1f} MB，分配最多的代码行:")
+        for stat in snapshot.statistics("lineno")[:PROFILE_TOP // 2]:
+            print(f"  {stat}")